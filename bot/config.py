@@ -16,6 +16,7 @@ import logging
 from pathlib import Path
 from typing import List, Optional, Final
 from dotenv import load_dotenv
+from bot.utils.constants import DEFAULT_DB_READ_POOL_SIZE
 
 # Настройка логирования для модуля конфигурации
 logger = logging.getLogger(__name__)
@@ -30,6 +31,7 @@ ENV_DB_PATH: Final[str] = 'DB_PATH'
 ENV_ADMIN_IDS: Final[str] = 'ADMIN_IDS'
 ENV_BOOKING_CONTACT_ID: Final[str] = 'BOOKING_CONTACT_ID'
 ENV_LOG_LEVEL: Final[str] = 'LOG_LEVEL'
+ENV_DB_READ_POOL_SIZE: Final[str] = 'DB_READ_POOL_SIZE'
 
 # Значения по умолчанию
 DEFAULT_DB_PATH: Final[str] = 'bot_database.db'
@@ -190,6 +192,36 @@ def _parse_booking_contact_id(contact_id_str: Optional[str]) -> Optional[int]:
         return None
 
 
+def _parse_read_pool_size(pool_size_str: Optional[str]) -> int:
+    """
+    Парсит количество соединений-читателей в пуле БД.
+    
+    Args:
+        pool_size_str: Строка с размером пула
+        
+    Returns:
+        int: Размер пула (0 - чтение через соединение-писатель)
+        
+    Note:
+        Некорректные значения логируются и заменяются значением по умолчанию.
+    """
+    if not pool_size_str:
+        return DEFAULT_DB_READ_POOL_SIZE
+    
+    try:
+        pool_size = int(pool_size_str.strip())
+        if pool_size >= 0:
+            return pool_size
+    except ValueError:
+        pass
+    
+    logger.warning(
+        f"{ENV_DB_READ_POOL_SIZE} должен быть неотрицательным числом. "
+        f"Получено: {pool_size_str}. Используется значение по умолчанию: {DEFAULT_DB_READ_POOL_SIZE}"
+    )
+    return DEFAULT_DB_READ_POOL_SIZE
+
+
 def _validate_db_path(db_path: str) -> str:
     """
     Валидирует путь к базе данных.
@@ -294,6 +326,24 @@ except ValueError as e:
 # Время для ежедневных уведомлений о завершающихся арендах (формат: HH:MM)
 NOTIFICATION_TIME: Final[str] = os.getenv('NOTIFICATION_TIME', '10:00')
 
+# ============================================================================
+# НАСТРОЙКИ ПУЛА СОЕДИНЕНИЙ С БД
+# ============================================================================
+
+# Количество соединений-читателей (WAL) рядом с единственным соединением-писателем
+DB_READ_POOL_SIZE: Final[int] = _parse_read_pool_size(os.getenv(ENV_DB_READ_POOL_SIZE))
+
+# ============================================================================
+# НАСТРОЙКИ ОБЩЕГО КЭША
+# ============================================================================
+
+# Адрес Redis для общего кэша нескольких экземпляров бота (не задан - только локальный кэш)
+REDIS_URL: Final[Optional[str]] = os.getenv('REDIS_URL', '').strip() or None
+
+# Режим отладки кэша: проверка при каждом чтении, что закэшированное значение
+# не изменили после сохранения (медленнее, только для разработки и тестов)
+CACHE_DEBUG: Final[bool] = os.getenv('CACHE_DEBUG', '').strip().lower() in ('1', 'true', 'yes')
+
 # ============================================================================
 # ЭКСПОРТ ПУБЛИЧНОГО API
 # ============================================================================
@@ -305,4 +355,7 @@ __all__ = [
     'BOOKING_CONTACT_ID',
     'LOG_LEVEL',
     'NOTIFICATION_TIME',
+    'DB_READ_POOL_SIZE',
+    'REDIS_URL',
+    'CACHE_DEBUG',
 ]
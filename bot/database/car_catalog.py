@@ -0,0 +1,139 @@
+"""
+Каталог автомобилей в памяти
+
+Таблица cars маленькая, но читается постоянно: меню каталога, пагинация,
+карточка автомобиля и минимальная цена в /start. Каталог загружается одним
+запросом и хранит готовые представления: словарь по ID, список по дате
+добавления, доступные автомобили и доступные автомобили по цене.
+
+Изменения пишутся сквозь каталог: add_car/update_car/delete_car передают
+измененную строку в put()/remove(), и новый снимок собирается сразу, без
+повторной загрузки из БД. Снимок хранится в общем кэше под тегом 'cars',
+поэтому наследует от него защиту от "давки", фоновое обновление после TTL
+(на случай изменений в обход бота) и инвалидацию между экземплярами.
+
+Снимок неизменяем (кортежи CompactRow и словарь только для чтения), поэтому
+представления отдаются обработчикам без копирования.
+"""
+from types import MappingProxyType
+from typing import Any, Iterable, Mapping, Optional, Tuple
+from bot.database.db_pool import db_pool
+from bot.database.rows import CompactRow
+from bot.utils.cache import cache
+from bot.utils.constants import CACHE_TTL_CARS_LIST, CACHE_MAX_STALE_CARS_LIST
+
+
+Cars = Tuple[Mapping[str, Any], ...]
+
+
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога с готовыми представлениями"""
+
+    __slots__ = ('by_id', 'ordered', 'available', 'available_by_price')
+
+    by_id: Mapping[int, Mapping[str, Any]]
+    ordered: Cars
+    available: Cars
+    available_by_price: Cars
+
+    def __init__(self, cars: Iterable[Mapping[str, Any]]):
+        by_id = {car['id']: car for car in cars}
+        # Тот же порядок, что ORDER BY created_at DESC; при равных датах - новые ID первыми
+        ordered = tuple(sorted(
+            by_id.values(), key=lambda car: (car['created_at'] or '', car['id']), reverse=True
+        ))
+        available = tuple(car for car in ordered if car['available'])
+        object.__setattr__(self, 'by_id', MappingProxyType(by_id))
+        object.__setattr__(self, 'ordered', ordered)
+        object.__setattr__(self, 'available', available)
+        object.__setattr__(self, 'available_by_price', tuple(
+            sorted(available, key=lambda car: (car['daily_price'], car['id']))
+        ))
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("CatalogSnapshot неизменяем")
+
+    def __delattr__(self, name: str):
+        raise AttributeError("CatalogSnapshot неизменяем")
+
+    def __reduce__(self):
+        # MappingProxyType не сериализуется: для общего кэша достаточно строк
+        return CatalogSnapshot, (self.ordered,)
+
+    def with_car(self, car: Mapping[str, Any]) -> 'CatalogSnapshot':
+        """Новый снимок с добавленным или измененным автомобилем"""
+        cars = dict(self.by_id)
+        cars[car['id']] = car
+        return CatalogSnapshot(cars.values())
+
+    def without_car(self, car_id: int) -> 'CatalogSnapshot':
+        """Новый снимок без автомобиля"""
+        return CatalogSnapshot(car for key, car in self.by_id.items() if key != car_id)
+
+
+class CarCatalog:
+    """Каталог автомобилей со сквозной записью"""
+
+    CACHE_KEY = "cars:catalog"
+
+    async def _snapshot(self) -> CatalogSnapshot:
+        """Текущий снимок (загружается при первом обращении и после инвалидации)"""
+        return await cache.get_or_load(
+            self.CACHE_KEY, self._load, ttl=CACHE_TTL_CARS_LIST, tags=('cars',),
+            stale_ttl=CACHE_MAX_STALE_CARS_LIST
+        )
+
+    async def _load(self) -> CatalogSnapshot:
+        """Загружает весь каталог одним запросом"""
+        return CatalogSnapshot(await db_pool.execute_fetchall("SELECT * FROM cars", compact=True))
+
+    async def load(self):
+        """Загружает каталог заранее (при запуске бота)"""
+        await self._snapshot()
+
+    async def get_all(self, available_only: bool = False) -> Cars:
+        """Автомобили от новых к старым"""
+        snapshot = await self._snapshot()
+        return snapshot.available if available_only else snapshot.ordered
+
+    async def get(self, car_id: int) -> Optional[Mapping[str, Any]]:
+        """Автомобиль по ID"""
+        return (await self._snapshot()).by_id.get(car_id)
+
+    async def get_available_by_price(self) -> Cars:
+        """Доступные автомобили от дешевых к дорогим"""
+        return (await self._snapshot()).available_by_price
+
+    async def min_price(self) -> Optional[int]:
+        """Минимальная цена среди доступных автомобилей"""
+        cars = await self.get_available_by_price()
+        return cars[0]['daily_price'] if cars else None
+
+    def put(self, car: Mapping[str, Any]):
+        """Добавляет или обновляет автомобиль после записи в БД"""
+        self._replace(lambda snapshot: snapshot.with_car(CompactRow.from_mapping(car)))
+
+    def remove(self, car_id: int):
+        """Убирает автомобиль после удаления из БД"""
+        self._replace(lambda snapshot: snapshot.without_car(car_id))
+
+    def _replace(self, update):
+        """
+        Применяет изменение к актуальному снимку
+
+        Данные, производные от автомобилей (аренды с названием автомобиля),
+        инвалидируются всегда. Если актуального снимка нет (не загружен,
+        истек или инвалидирован другим экземпляром), следующее чтение
+        загрузит каталог из БД.
+        """
+        snapshot = cache.get(self.CACHE_KEY)
+        cache.invalidate('cars')
+        if snapshot is not None:
+            cache.set(
+                self.CACHE_KEY, update(snapshot), ttl=CACHE_TTL_CARS_LIST, tags=('cars',),
+                stale_ttl=CACHE_MAX_STALE_CARS_LIST
+            )
+
+
+# Глобальный экземпляр каталога
+car_catalog = CarCatalog()
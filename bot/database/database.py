@@ -1,206 +1,46 @@
 import aiosqlite
+import sqlite3
 from bot.config import DB_PATH, ADMIN_IDS
-from bot.database.models import ALL_TABLES
 from bot.database.db_pool import db_pool
+from bot.database.migrations import run_migrations, latest_version
+from bot.database.car_catalog import car_catalog
 from bot.utils.cache import cache
+from bot.utils.reminders import next_reminder_at, format_reminder_at
 from bot.utils.constants import (
-    CACHE_TTL_CARS_LIST, CACHE_TTL_CAR_DETAILS,
-    CACHE_TTL_RENTAL_USER, CACHE_TTL_RENTALS_ACTIVE,
+    CACHE_TTL_RENTAL_USER, CACHE_TTL_RENTAL_USER_MISS, CACHE_TTL_RENTALS_ACTIVE,
     CACHE_TTL_ADMIN_CHECK
 )
-from typing import Optional, List, Dict, Any
+from typing import Optional, Callable, List, Dict, Any, Mapping, Sequence
+from datetime import date, datetime
 import logging
 import os
+import time
 
 logger = logging.getLogger(__name__)
 
 async def init_db():
-    """Инициализация базы данных и создание всех таблиц"""
+    """Инициализация базы данных: пул соединений, миграции схемы, администраторы"""
+    started = time.perf_counter()
     # Инициализируем пул соединений
     await db_pool.initialize()
-    db = await db_pool.get_connection()
     
     try:
-        # Создаем все таблицы
-        for table_sql in ALL_TABLES:
-            await db.execute(table_sql)
-        
-        # Создаем индексы для оптимизации
-        await _create_indexes(db)
-        
-        # Выполняем миграции для существующих таблиц
-        await _migrate_cars_table_for_images(db)
-        await _migrate_rentals_table_for_reminder_type(db)
-        await _migrate_rentals_table_for_deposits(db)
-        await _migrate_users_table_for_referrals(db)
-        await _migrate_users_table_for_source(db)
-        
-        await db.commit()
-        logger.info("✅ База данных инициализирована успешно")
+        # Актуальная схема проверяется одним чтением PRAGMA user_version
+        applied = await run_migrations(db_pool)
         
         # Инициализируем администраторов из конфигурации
         await init_admins_from_config()
         
-        # Инициализируем контакты
-        await init_contacts()
-        
-        # Добавляем таблицу для логирования рассылок
-        await _create_broadcast_logs_table(db)
-        
-        # Инициализируем настройки реферальной системы по умолчанию
-        await _init_referral_settings(db)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(
+            f"✅ База данных инициализирована за {elapsed_ms:.1f} мс "
+            f"(версия схемы: {latest_version()}, применено миграций: {applied})"
+        )
         
     except Exception as e:
         logger.error(f"❌ Ошибка инициализации БД: {e}")
         raise
 
-async def _create_indexes(db):
-    """Создание индексов для оптимизации запросов"""
-    try:
-        # Индекс для быстрого поиска пользователей
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id)
-        """)
-        # Индекс для быстрого поиска админов
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_admins_telegram_id ON admins(telegram_id)
-        """)
-        # Индекс для фильтрации доступных автомобилей
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_cars_available ON cars(available)
-        """)
-        # Индекс для сортировки по дате создания
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_cars_created_at ON cars(created_at DESC)
-        """)
-        # Индексы для аренды
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_rentals_user_id ON rentals(user_id)
-        """)
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_rentals_car_id ON rentals(car_id)
-        """)
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_rentals_is_active ON rentals(is_active)
-        """)
-        logger.info("✅ Индексы созданы")
-    except Exception as e:
-        logger.warning(f"⚠️ Ошибка создания индексов: {e}")
-
-async def _migrate_cars_table_for_images(db):
-    """Миграция таблицы cars для добавления полей изображений"""
-    try:
-        # Проверяем существующие колонки в таблице cars
-        cursor = await db.execute("PRAGMA table_info(cars)")
-        columns = await cursor.fetchall()
-        existing_columns = {col[1] for col in columns}  # col[1] - имя колонки
-        
-        # Добавляем отсутствующие колонки для изображений
-        image_columns = ['image_1', 'image_2', 'image_3']
-        for img_col in image_columns:
-            if img_col not in existing_columns:
-                await db.execute(f"ALTER TABLE cars ADD COLUMN {img_col} TEXT")
-                logger.info(f"✅ Добавлена колонка {img_col} в таблицу cars")
-        
-        # Проверяем, нужна ли миграция
-        added_cols = [col for col in image_columns if col not in existing_columns]
-        if added_cols:
-            logger.info(f"🔄 Миграция завершена: добавлено {len(added_cols)} колонок для изображений")
-        
-    except Exception as e:
-        logger.warning(f"⚠️  Ошибка при миграции таблицы cars: {e}")
-        # Не останавливаем работу, так как для новых БД колонки уже будут созданы
-
-async def _migrate_rentals_table_for_reminder_type(db):
-    """Миграция таблицы rentals для добавления полей reminder_type и last_reminder_date"""
-    try:
-        # Проверяем существующие колонки в таблице rentals
-        cursor = await db.execute("PRAGMA table_info(rentals)")
-        columns = await cursor.fetchall()
-        existing_columns = {col[1] for col in columns}  # col[1] - имя колонки
-        
-        # Добавляем отсутствующие колонки
-        if 'reminder_type' not in existing_columns:
-            await db.execute("ALTER TABLE rentals ADD COLUMN reminder_type TEXT DEFAULT 'daily'")
-            logger.info("✅ Добавлена колонка reminder_type в таблицу rentals")
-        
-        if 'last_reminder_date' not in existing_columns:
-            await db.execute("ALTER TABLE rentals ADD COLUMN last_reminder_date DATE")
-            logger.info("✅ Добавлена колонка last_reminder_date в таблицу rentals")
-        
-        # Обновляем существующие записи, если нужно
-        if 'reminder_type' not in existing_columns:
-            await db.execute("UPDATE rentals SET reminder_type = 'daily' WHERE reminder_type IS NULL")
-        
-    except Exception as e:
-        logger.warning(f"⚠️  Ошибка при миграции таблицы rentals: {e}")
-
-async def _migrate_rentals_table_for_deposits(db):
-    """Миграция таблицы rentals для добавления полей deposit_amount и deposit_status (Модуль 4)"""
-    try:
-        cursor = await db.execute("PRAGMA table_info(rentals)")
-        columns = await cursor.fetchall()
-        existing_columns = {col[1] for col in columns}
-        
-        if 'deposit_amount' not in existing_columns:
-            await db.execute("ALTER TABLE rentals ADD COLUMN deposit_amount DECIMAL(10, 2) DEFAULT 0")
-            logger.info("✅ Добавлена колонка deposit_amount в таблицу rentals")
-        
-        if 'deposit_status' not in existing_columns:
-            await db.execute("ALTER TABLE rentals ADD COLUMN deposit_status TEXT DEFAULT 'pending'")
-            # Обновляем существующие записи
-            await db.execute("UPDATE rentals SET deposit_status = 'pending' WHERE deposit_status IS NULL")
-            logger.info("✅ Добавлена колонка deposit_status в таблицу rentals")
-        
-        # Добавляем поле end_date для определения даты окончания аренды
-        if 'end_date' not in existing_columns:
-            await db.execute("ALTER TABLE rentals ADD COLUMN end_date DATE")
-            logger.info("✅ Добавлена колонка end_date в таблицу rentals")
-        
-        # Добавляем поле referral_discount_percentage для хранения примененного реферального бонуса (Модуль 6)
-        if 'referral_discount_percentage' not in existing_columns:
-            await db.execute("ALTER TABLE rentals ADD COLUMN referral_discount_percentage INTEGER DEFAULT 0")
-            logger.info("✅ Добавлена колонка referral_discount_percentage в таблицу rentals")
-        
-    except Exception as e:
-        logger.warning(f"⚠️  Ошибка при миграции таблицы rentals для депозитов: {e}")
-
-async def _migrate_users_table_for_referrals(db):
-    """Миграция таблицы users для добавления полей referral_code и referrer_id (Модуль 6)"""
-    try:
-        cursor = await db.execute("PRAGMA table_info(users)")
-        columns = await cursor.fetchall()
-        existing_columns = {col[1] for col in columns}
-        
-        if 'referral_code' not in existing_columns:
-            # SQLite не поддерживает добавление UNIQUE колонки напрямую
-            # Сначала добавляем колонку без ограничения
-            await db.execute("ALTER TABLE users ADD COLUMN referral_code TEXT")
-            # Затем создаем уникальный индекс
-            await db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_referral_code ON users(referral_code)")
-            logger.info("✅ Добавлена колонка referral_code в таблицу users")
-        
-        if 'referrer_id' not in existing_columns:
-            await db.execute("ALTER TABLE users ADD COLUMN referrer_id INTEGER")
-            logger.info("✅ Добавлена колонка referrer_id в таблицу users")
-        
-    except Exception as e:
-        logger.warning(f"⚠️  Ошибка при миграции таблицы users для реферальной системы: {e}")
-
-async def _migrate_users_table_for_source(db):
-    """Миграция таблицы users для добавления поля source (Модуль 7)"""
-    try:
-        cursor = await db.execute("PRAGMA table_info(users)")
-        columns = await cursor.fetchall()
-        existing_columns = {col[1] for col in columns}
-        
-        if 'source' not in existing_columns:
-            await db.execute("ALTER TABLE users ADD COLUMN source TEXT")
-            logger.info("✅ Добавлена колонка source в таблицу users")
-        
-    except Exception as e:
-        logger.warning(f"⚠️  Ошибка при миграции таблицы users для UTM-меток: {e}")
-
 # === ФУНКЦИИ ДЛЯ РАБОТЫ С ПОЛЬЗОВАТЕЛЯМИ ===
 
 async def add_user(telegram_id: int, username: Optional[str], first_name: Optional[str], 
@@ -215,16 +55,73 @@ async def add_user(telegram_id: int, username: Optional[str], first_name: Option
                 await update_user_source(telegram_id, source)
             return False
         
-        await db_pool.execute(
+        await db_pool.write(
             "INSERT INTO users (telegram_id, username, first_name, referral_code, source) VALUES (?, ?, ?, ?, ?)",
             (telegram_id, username, first_name, referral_code, source)
         )
-        await db_pool.commit()
         return True
     except Exception as e:
         logger.error(f"Ошибка при добавлении пользователя: {e}")
         return False
 
+async def register_user(telegram_id: int, username: Optional[str], first_name: Optional[str],
+                        start_param: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Регистрирует или обновляет пользователя при /start одним запросом (Модули 6, 7)
+    
+    Параметр deep-link считается реферальным кодом, если такой код есть в базе,
+    иначе - UTM-меткой источника. Новый пользователь получает реферальный код
+    и реферера (кроме собственного кода); у существующего обновляются имя и
+    username, а источник и реферальный код заполняются, только если пусты.
+    Реферер существующему пользователю не назначается.
+    
+    Args:
+        telegram_id: Telegram ID пользователя
+        username: Username пользователя
+        first_name: Имя пользователя
+        start_param: Параметр команды /start (реферальный код или UTM-метка)
+    
+    Returns:
+        Запись пользователя после изменения или None при ошибке
+    """
+    from bot.utils.constants import MAX_UTM_LENGTH
+    
+    source = start_param[:MAX_UTM_LENGTH] if start_param else None
+    # Код уникален за счет префикса telegram_id; при редком совпадении
+    # случайной части UNIQUE-индекс отклонит запрос и код будет сгенерирован заново
+    for attempt in range(3):
+        try:
+            return await db_pool.write_returning(
+                """WITH referrer AS (
+                       SELECT (SELECT telegram_id FROM users WHERE referral_code = :start_param) AS telegram_id
+                   )
+                   INSERT INTO users (telegram_id, username, first_name, referral_code, referrer_id, source)
+                   SELECT :telegram_id, :username, :first_name, :referral_code,
+                          NULLIF(referrer.telegram_id, :telegram_id),
+                          CASE WHEN referrer.telegram_id IS NULL THEN :source END
+                   FROM referrer WHERE true
+                   ON CONFLICT(telegram_id) DO UPDATE SET
+                       username = excluded.username,
+                       first_name = excluded.first_name,
+                       referral_code = COALESCE(users.referral_code, excluded.referral_code),
+                       source = COALESCE(users.source, excluded.source)
+                   RETURNING *""",
+                {
+                    'telegram_id': telegram_id,
+                    'username': username,
+                    'first_name': first_name,
+                    'referral_code': _random_referral_code(telegram_id),
+                    'start_param': start_param,
+                    'source': source,
+                }
+            )
+        except sqlite3.IntegrityError as e:
+            logger.warning(f"Повтор регистрации пользователя {telegram_id} (попытка {attempt + 1}): {e}")
+        except Exception as e:
+            logger.error(f"Ошибка при регистрации пользователя: {e}")
+            return None
+    return None
+
 async def get_all_users() -> List[Dict[str, Any]]:
     """Получает всех пользователей из базы данных"""
     try:
@@ -233,11 +130,43 @@ async def get_all_users() -> List[Dict[str, Any]]:
         logger.error(f"Ошибка при получении пользователей: {e}")
         return []
 
+async def get_users_count() -> int:
+    """Возвращает количество пользователей без загрузки самих записей"""
+    try:
+        result = await db_pool.execute_fetchone("SELECT COUNT(*) as count FROM users")
+        return result['count'] if result else 0
+    except Exception as e:
+        logger.error(f"Ошибка при подсчете пользователей: {e}")
+        return 0
+
+# Порция пользователей по первичному ключу (keyset): каждая порция - отдельный запрос
+_USERS_PAGE_QUERY = "SELECT * FROM users WHERE id > ? ORDER BY id LIMIT ?"
+
+async def iterate_users(batch: int = None):
+    """
+    Async генератор, потоково перебирающий всех пользователей (по возрастанию id)
+    
+    Args:
+        batch: Количество строк, читаемых из БД за раз (по умолчанию DB_CHUNK_SIZE)
+    
+    Yields:
+        Dict[str, Any]: Пользователь
+    """
+    from bot.utils.constants import DB_CHUNK_SIZE
+    
+    async for user in db_pool.iterate(_USERS_PAGE_QUERY, batch=batch or DB_CHUNK_SIZE):
+        yield user
+
 async def get_users_chunked(chunk_size: int = None):
     """
     Async генератор для получения пользователей порциями (для оптимизации памяти)
     Используется в рассылках для обработки больших объемов данных
     
+    Каждая порция читается отдельным запросом по первичному ключу
+    (WHERE id > ? ORDER BY id LIMIT ?): соединение не удерживается, пока
+    рассылка отправляет порцию и делает паузы, а таблица не сканируется
+    заново, как при LIMIT/OFFSET.
+    
     Args:
         chunk_size: Размер порции (если None, используется DB_CHUNK_SIZE из констант)
     
@@ -249,85 +178,67 @@ async def get_users_chunked(chunk_size: int = None):
     if chunk_size is None:
         chunk_size = DB_CHUNK_SIZE
     
-    offset = 0
+    after = 0
     while True:
         try:
-            users = await db_pool.execute_fetchall(
-                "SELECT * FROM users ORDER BY created_at DESC LIMIT ? OFFSET ?",
-                (chunk_size, offset)
-            )
-            if not users:
-                break
-            yield users
-            offset += chunk_size
+            chunk = await db_pool.execute_fetchall(_USERS_PAGE_QUERY, (after, chunk_size))
         except Exception as e:
             logger.error(f"Ошибка при получении пользователей порциями: {e}")
-            break
+            return
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        after = chunk[-1]['id']
 
 # === ФУНКЦИИ ДЛЯ РАБОТЫ С АВТОМОБИЛЯМИ ===
 
 async def add_car(name: str, description: Optional[str], daily_price: int, available: bool = True, 
                  image_1: Optional[str] = None, image_2: Optional[str] = None, image_3: Optional[str] = None) -> Optional[int]:
-    """Добавляет новый автомобиль в базу данных и очищает кэш"""
+    """Добавляет новый автомобиль в базу данных и в каталог"""
     try:
-        cursor = await db_pool.execute(
-            "INSERT INTO cars (name, description, daily_price, available, image_1, image_2, image_3) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        car = await db_pool.write_returning(
+            """INSERT INTO cars (name, description, daily_price, available, image_1, image_2, image_3)
+               VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING *""",
             (name, description, daily_price, available, image_1, image_2, image_3)
         )
-        await db_pool.commit()
         
-        # Очищаем кэш списка автомобилей
-        cache.delete("cars:all:True")
-        cache.delete("cars:all:False")
+        # Сквозная запись: каталог обновляется без повторной загрузки
+        car_catalog.put(car)
         
-        return cursor.lastrowid
+        return car['id']
     except Exception as e:
         logger.error(f"Ошибка при добавлении автомобиля: {e}")
         return None
 
-async def get_all_cars(available_only: bool = False) -> List[Dict[str, Any]]:
-    """Получает все автомобили из базы данных с кэшированием"""
+async def get_all_cars(available_only: bool = False) -> Sequence[Mapping[str, Any]]:
+    """Получает все автомобили (от новых к старым) из каталога в памяти"""
     try:
-        cache_key = f"cars:all:{available_only}"
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            return cached_result
-        
-        query = "SELECT * FROM cars"
-        params = ()
-        if available_only:
-            query += " WHERE available = 1"
-        query += " ORDER BY created_at DESC"
-        
-        result = await db_pool.execute_fetchall(query, params)
-        # Используем константу для TTL кэша
-        cache.set(cache_key, result, ttl=CACHE_TTL_CARS_LIST)
-        return result
+        return await car_catalog.get_all(available_only)
     except Exception as e:
         logger.error(f"Ошибка при получении автомобилей: {e}")
         return []
 
-async def get_car_by_id(car_id: int) -> Optional[Dict[str, Any]]:
-    """Получает автомобиль по ID с кэшированием"""
+async def get_car_by_id(car_id: int) -> Optional[Mapping[str, Any]]:
+    """Получает автомобиль по ID из каталога в памяти"""
     try:
-        cache_key = f"car:{car_id}"
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            return cached_result
-        
-        result = await db_pool.execute_fetchone("SELECT * FROM cars WHERE id = ?", (car_id,))
-        if result:
-            # Используем константу для TTL кэша
-            cache.set(cache_key, result, ttl=CACHE_TTL_CAR_DETAILS)
-        return result
+        return await car_catalog.get(car_id)
     except Exception as e:
         logger.error(f"Ошибка при получении автомобиля: {e}")
         return None
 
+async def get_min_car_price() -> Optional[int]:
+    """Минимальная цена среди доступных автомобилей (None, если доступных нет)"""
+    try:
+        return await car_catalog.min_price()
+    except Exception as e:
+        logger.error(f"Ошибка при получении минимальной цены: {e}")
+        return None
+
 async def update_car(car_id: int, name: Optional[str] = None, description: Optional[str] = None, 
                     daily_price: Optional[int] = None, available: Optional[bool] = None,
                     image_1: Optional[str] = None, image_2: Optional[str] = None, image_3: Optional[str] = None) -> bool:
-    """Обновляет информацию об автомобиле и очищает кэш"""
+    """Обновляет информацию об автомобиле и каталог"""
     try:
         updates = []
         params = []
@@ -358,15 +269,13 @@ async def update_car(car_id: int, name: Optional[str] = None, description: Optio
             return True
         
         params.append(car_id)
-        query = f"UPDATE cars SET {', '.join(updates)} WHERE id = ?"
+        query = f"UPDATE cars SET {', '.join(updates)} WHERE id = ? RETURNING *"
         
-        await db_pool.execute(query, tuple(params))
-        await db_pool.commit()
+        car = await db_pool.write_returning(query, tuple(params))
         
-        # Очищаем кэш для этого автомобиля и списка автомобилей
-        cache.delete(f"car:{car_id}")
-        cache.delete("cars:all:True")
-        cache.delete("cars:all:False")
+        # Обновляем каталог; аренды с данными автомобиля инвалидируются вместе с ним
+        if car:
+            car_catalog.put(car)
         
         return True
     except Exception as e:
@@ -374,57 +283,46 @@ async def update_car(car_id: int, name: Optional[str] = None, description: Optio
         return False
 
 async def delete_car(car_id: int) -> bool:
-    """Удаляет автомобиль из базы данных и очищает кэш"""
+    """Удаляет автомобиль из базы данных (одной транзакцией) и из каталога"""
     try:
-        # Проверяем, существует ли автомобиль
-        car = await get_car_by_id(car_id)
-        if not car:
-            logger.warning(f"Попытка удалить несуществующий автомобиль с ID: {car_id}")
-            return False
-        
-        # Проверяем, есть ли активные аренды для этого автомобиля
-        active_rentals = await db_pool.execute_fetchall(
-            "SELECT id FROM rentals WHERE car_id = ? AND is_active = 1",
-            (car_id,)
-        )
-        
-        if active_rentals:
-            logger.warning(f"Нельзя удалить автомобиль с ID {car_id}: есть {len(active_rentals)} активных аренд")
-            return False
-        
-        # Удаляем все аренды (активные и неактивные), связанные с этим автомобилем
-        # Это необходимо для избежания ошибки FOREIGN KEY constraint
-        rentals_to_delete = await db_pool.execute_fetchall(
-            "SELECT id, user_id FROM rentals WHERE car_id = ?",
-            (car_id,)
-        )
-        
-        if rentals_to_delete:
-            # Очищаем кэш для пользователей, у которых были аренды этого автомобиля
-            for rental in rentals_to_delete:
-                cache.delete(f"rental:user:{rental['user_id']}")
+        async with db_pool.transaction():
+            # Проверяем, есть ли активные аренды для этого автомобиля
+            active_rentals = await db_pool.execute_fetchall(
+                "SELECT id FROM rentals WHERE car_id = ? AND is_active = 1",
+                (car_id,)
+            )
             
-            # Удаляем все аренды этого автомобиля
-            await db_pool.execute(
-                "DELETE FROM rentals WHERE car_id = ?",
+            if active_rentals:
+                logger.warning(f"Нельзя удалить автомобиль с ID {car_id}: есть {len(active_rentals)} активных аренд")
+                return False
+            
+            # Удаляем все аренды (активные и неактивные), связанные с этим автомобилем
+            # Это необходимо для избежания ошибки FOREIGN KEY constraint
+            rentals_to_delete = await db_pool.execute_fetchall(
+                "SELECT id, user_id FROM rentals WHERE car_id = ?",
                 (car_id,)
             )
-            logger.info(f"Удалено {len(rentals_to_delete)} аренд для автомобиля с ID {car_id}")
-        
-        # Удаляем автомобиль
-        cursor = await db_pool.execute("DELETE FROM cars WHERE id = ?", (car_id,))
-        await db_pool.commit()
+            
+            if rentals_to_delete:
+                await db_pool.execute(
+                    "DELETE FROM rentals WHERE car_id = ?",
+                    (car_id,)
+                )
+            
+            # Удаляем автомобиль
+            cursor = await db_pool.execute("DELETE FROM cars WHERE id = ?", (car_id,))
+            
+            # Проверяем, существовал ли автомобиль
+            if cursor.rowcount == 0:
+                logger.warning(f"Попытка удалить несуществующий автомобиль с ID: {car_id}")
+                return False
         
-        # Проверяем, было ли удаление успешным
-        if cursor.rowcount == 0:
-            logger.warning(f"Автомобиль с ID {car_id} не был удален (возможно, не существует)")
-            return False
+        if rentals_to_delete:
+            logger.info(f"Удалено {len(rentals_to_delete)} аренд для автомобиля с ID {car_id}")
         
-        # Очищаем кэш
-        cache.delete(f"car:{car_id}")
-        cache.delete("cars:all:True")
-        cache.delete("cars:all:False")
-        cache.delete("rentals:active")
+        # Убираем автомобиль из каталога и инвалидируем записи аренд
+        car_catalog.remove(car_id)
+        cache.invalidate('rentals')
         
         logger.info(f"Автомобиль с ID {car_id} успешно удален")
         return True
@@ -447,11 +345,10 @@ async def add_admin(telegram_id: int) -> bool:
             return False
         
         # Добавляем администратора
-        await db_pool.execute(
+        await db_pool.write(
             "INSERT INTO admins (telegram_id) VALUES (?)",
             (telegram_id,)
         )
-        await db_pool.commit()
         
         # Очищаем кэш для этого администратора
         cache.delete(f"admin:{telegram_id}")
@@ -465,16 +362,11 @@ async def add_admin(telegram_id: int) -> bool:
 async def is_admin(telegram_id: int) -> bool:
     """Проверяет, является ли пользователь администратором с кэшированием"""
     try:
-        cache_key = f"admin:{telegram_id}"
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            return cached_result
+        async def load():
+            result = await db_pool.execute_fetchone("SELECT id FROM admins WHERE telegram_id = ?", (telegram_id,))
+            return result is not None
         
-        result = await db_pool.execute_fetchone("SELECT id FROM admins WHERE telegram_id = ?", (telegram_id,))
-        is_admin_result = result is not None
-        # Используем константу для TTL кэша
-        cache.set(cache_key, is_admin_result, ttl=CACHE_TTL_ADMIN_CHECK)
-        return is_admin_result
+        return await cache.get_or_load(f"admin:{telegram_id}", load, ttl=CACHE_TTL_ADMIN_CHECK)
     except Exception as e:
         logger.error(f"Ошибка при проверке администратора: {e}")
         return False
@@ -490,10 +382,9 @@ async def get_all_admins() -> List[Dict[str, Any]]:
 async def delete_admin(telegram_id: int) -> bool:
     """Удаляет администратора из базы данных"""
     try:
-        cursor = await db_pool.execute("DELETE FROM admins WHERE telegram_id = ?", (telegram_id,))
-        await db_pool.commit()
+        result = await db_pool.write("DELETE FROM admins WHERE telegram_id = ?", (telegram_id,))
         # Проверяем, было ли удаление успешным
-        success = cursor.rowcount > 0
+        success = result.rowcount > 0
         if success:
             # Очищаем кэш для удаленного администратора
             cache.delete(f"admin:{telegram_id}")
@@ -575,44 +466,18 @@ async def init_admins_from_config():
     except Exception as e:
         print(f"⚠️  Ошибка при инициализации администраторов из конфигурации: {e}")
 
-async def _create_broadcast_logs_table(db):
-    """Создает таблицу для логирования рассылок"""
-    try:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS broadcast_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                admin_id INTEGER NOT NULL,
-                content_type TEXT NOT NULL,
-                text TEXT,
-                total_users INTEGER NOT NULL,
-                sent_count INTEGER NOT NULL,
-                failed_count INTEGER NOT NULL,
-                blocked_count INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        # Индекс для быстрого поиска по дате
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_broadcast_logs_created_at 
-            ON broadcast_logs(created_at DESC)
-        """)
-        logger.info("✅ Таблица логирования рассылок готова")
-    except Exception as e:
-        logger.warning(f"⚠️  Ошибка создания таблицы рассылок: {e}")
-
 # === ФУНКЦИИ ДЛЯ РАССЫЛКИ ===
 
 async def add_broadcast_log(admin_id: int, content_type: str, text: Optional[str], 
                           total_users: int, sent_count: int, failed_count: int, blocked_count: int) -> bool:
     """Добавляет запись о рассылке в логи"""
     try:
-        await db_pool.execute(
+        await db_pool.write(
             """INSERT INTO broadcast_logs 
                (admin_id, content_type, text, total_users, sent_count, failed_count, blocked_count) 
                VALUES (?, ?, ?, ?, ?, ?, ?)""",
             (admin_id, content_type, text, total_users, sent_count, failed_count, blocked_count)
         )
-        await db_pool.commit()
         return True
     except Exception as e:
         logger.error(f"Ошибка при добавлении лога рассылки: {e}")
@@ -636,189 +501,344 @@ async def add_rental(user_id: int, car_id: int, daily_price: int, reminder_time:
                     end_date: Optional[str] = None, referral_discount_percentage: int = 0) -> Optional[int]:
     """Добавляет аренду автомобиля пользователю (Модули 4, 6: добавлена поддержка залогов и реферальных скидок)"""
     try:
-        # Проверяем, нет ли уже активной аренды у пользователя
-        existing = await get_active_rental_by_user(user_id)
-        if existing:
-            return None  # У пользователя уже есть активная аренда
-        
         # Применяем реферальную скидку к цене, если есть (Модуль 6)
         final_price = daily_price
         if referral_discount_percentage > 0:
             discount = (daily_price * referral_discount_percentage) // 100
             final_price = daily_price - discount
         
-        cursor = await db_pool.execute(
-            """INSERT INTO rentals (user_id, car_id, daily_price, reminder_time, reminder_type, 
-               deposit_amount, deposit_status, end_date, referral_discount_percentage) 
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (user_id, car_id, final_price, reminder_time, reminder_type, deposit_amount, deposit_status, 
-             end_date, referral_discount_percentage)
-        )
-        await db_pool.commit()
+        # Проверка и вставка в одной транзакции: две параллельные аренды не создадутся
+        async with db_pool.transaction():
+            existing = await db_pool.execute_fetchone(
+                "SELECT id FROM rentals WHERE user_id = ? AND is_active = 1 LIMIT 1",
+                (user_id,)
+            )
+            if existing:
+                return None  # У пользователя уже есть активная аренда
+            
+            rental = await db_pool.write_returning(
+                f"""INSERT INTO rentals (user_id, car_id, daily_price, reminder_time, reminder_type, 
+                   deposit_amount, deposit_status, end_date, referral_discount_percentage) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) {_RENTAL_RETURNING}""",
+                (user_id, car_id, final_price, reminder_time, reminder_type, deposit_amount, deposit_status, 
+                 end_date, referral_discount_percentage)
+            )
+            rental = await _store_next_reminder(rental)
         
-        # Очищаем кэш
-        cache.delete(f"rental:user:{user_id}")
-        cache.delete("rentals:active")
+        # Инвалидируем аренды, включая метку "нет аренды" пользователя
+        cache.invalidate('rentals')
+        _notify_rental_changed(rental)
         
-        return cursor.lastrowid
+        return rental['id']
     except Exception as e:
         logger.error(f"Ошибка при добавлении аренды: {e}")
         return None
 
 async def get_active_rental_by_user(user_id: int) -> Optional[Dict[str, Any]]:
-    """Получает активную аренду пользователя"""
+    """
+    Получает активную аренду пользователя
+    
+    У большинства пользователей активной аренды нет, поэтому отсутствие
+    тоже кэшируется; метку снимают add_rental и end_rental.
+    """
     try:
-        cache_key = f"rental:user:{user_id}"
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            return cached_result
+        async def load():
+            return await db_pool.execute_fetchone(
+                """SELECT r.*, c.name as car_name, c.description as car_description, 
+                          c.image_1, c.image_2, c.image_3
+                   FROM rentals r
+                   JOIN cars c ON r.car_id = c.id
+                   WHERE r.user_id = ? AND r.is_active = 1
+                   ORDER BY r.created_at DESC
+                   LIMIT 1""",
+                (user_id,)
+            )
         
-        result = await db_pool.execute_fetchone(
-            """SELECT r.*, c.name as car_name, c.description as car_description, 
-                      c.image_1, c.image_2, c.image_3
-               FROM rentals r
-               JOIN cars c ON r.car_id = c.id
-               WHERE r.user_id = ? AND r.is_active = 1
-               ORDER BY r.created_at DESC
-               LIMIT 1""",
-            (user_id,)
+        return await cache.get_or_load(
+            f"rental:user:{user_id}", load, ttl=CACHE_TTL_RENTAL_USER, negative_ttl=CACHE_TTL_RENTAL_USER_MISS,
+            tags=('rentals', 'cars')
         )
-        
-        if result:
-            cache.set(cache_key, result, ttl=CACHE_TTL_RENTAL_USER)
-        return result
     except Exception as e:
         logger.error(f"Ошибка при получении аренды пользователя: {e}")
         return None
 
-async def get_all_active_rentals() -> List[Dict[str, Any]]:
+async def get_all_active_rentals() -> Sequence[Mapping[str, Any]]:
     """Получает все активные аренды"""
     try:
-        cache_key = "rentals:active"
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            return cached_result
+        async def load():
+            return await db_pool.execute_fetchall(
+                """SELECT r.*, c.name as car_name, u.first_name, u.username
+                   FROM rentals r
+                   JOIN cars c ON r.car_id = c.id
+                   JOIN users u ON r.user_id = u.telegram_id
+                   WHERE r.is_active = 1
+                   ORDER BY r.created_at DESC""",
+                compact=True
+            )
         
-        result = await db_pool.execute_fetchall(
-            """SELECT r.*, c.name as car_name, u.first_name, u.username
-               FROM rentals r
-               JOIN cars c ON r.car_id = c.id
-               JOIN users u ON r.user_id = u.telegram_id
-               WHERE r.is_active = 1
-               ORDER BY r.created_at DESC"""
+        return await cache.get_or_load(
+            "rentals:active", load, ttl=CACHE_TTL_RENTALS_ACTIVE, tags=('rentals', 'cars')
         )
-        
-        cache.set(cache_key, result, ttl=CACHE_TTL_RENTALS_ACTIVE)
-        return result
     except Exception as e:
         logger.error(f"Ошибка при получении активных аренд: {e}")
         return []
 
-async def get_rentals_by_reminder_time(reminder_time: str) -> List[Dict[str, Any]]:
+# Условие "аренде r положено напоминание в день p.day" - то же правило, что
+# bot.utils.reminders.is_reminder_day, но без разбора дат в Python.
+# Дата начала берется по первым 10 символам, как datetime.fromisoformat(...).date();
+# некорректная дата последнего напоминания считается отсутствующей
+_DAYS_SINCE_START = "CAST(julianday(p.day) - julianday(substr(r.start_date, 1, 10)) AS INTEGER)"
+_DAYS_SINCE_LAST = "CAST(julianday(p.day) - julianday(date(r.last_reminder_date)) AS INTEGER)"
+
+
+def _periodic_reminder_due(period: int) -> str:
+    """Напоминание каждые period дней от начала аренды, не чаще раза в period дней"""
+    return (
+        f"{_DAYS_SINCE_START} >= {period} AND {_DAYS_SINCE_START} % {period} = 0"
+        f" AND (date(r.last_reminder_date) IS NULL OR {_DAYS_SINCE_LAST} >= {period})"
+    )
+
+
+REMINDER_DUE_CONDITION = f"""(date(substr(r.start_date, 1, 10)) IS NOT NULL AND CASE r.reminder_type
+    WHEN 'daily' THEN date(r.last_reminder_date) IS NOT p.day
+    WHEN 'weekly' THEN {_periodic_reminder_due(7)}
+    WHEN 'monthly' THEN {_periodic_reminder_due(30)}
+    ELSE 0 END)"""
+
+async def get_active_rentals_by_ids(rental_ids: List[int],
+                                    due_on: Optional[date] = None) -> Sequence[Mapping[str, Any]]:
     """
-    Получает активные аренды с указанным временем напоминания (Fix based on audit)
-    Оптимизация для PaymentReminderScheduler - фильтрация на уровне БД вместо загрузки всех аренд
+    Получает активные аренды по списку ID с названием автомобиля и данными пользователя
     
-    Args:
-        reminder_time: Время напоминания в формате "HH:MM"
+    Планировщик перечитывает одним запросом аренды, срок напоминания которых
+    наступил: завершенные к этому моменту аренды в результат не попадают.
     
-    Returns:
-        Список аренд с указанным временем напоминания
+    Args:
+        rental_ids: ID аренд
+        due_on: Если задан, возвращаются только аренды, которым в этот день
+            положено напоминание (REMINDER_DUE_CONDITION)
     """
-    try:
-        result = await db_pool.execute_fetchall(
-            """SELECT r.*, c.name as car_name, u.first_name, u.username
-               FROM rentals r
-               JOIN cars c ON r.car_id = c.id
-               JOIN users u ON r.user_id = u.telegram_id
-               WHERE r.is_active = 1 AND r.reminder_time = ?
-               ORDER BY r.created_at DESC""",
-            (reminder_time,)
-        )
-        return result
-    except Exception as e:
-        logger.error(f"Ошибка при получении аренд по времени напоминания: {e}")
+    if not rental_ids:
         return []
+    placeholders = ", ".join("?" * len(rental_ids))
+    # Параметр дня идет первым: подзапрос p стоит в тексте раньше WHERE
+    due_filter = f"AND {REMINDER_DUE_CONDITION}" if due_on is not None else ""
+    day = due_on.isoformat() if due_on is not None else None
+    # Ошибка БД не маскируется пустым списком: планировщик вернет сроки в очередь
+    return await db_pool.execute_fetchall(
+        f"""SELECT r.*, c.name as car_name, u.first_name, u.username
+           FROM rentals r
+           JOIN cars c ON r.car_id = c.id
+           JOIN users u ON r.user_id = u.telegram_id
+           CROSS JOIN (SELECT date(?) AS day) p
+           WHERE r.is_active = 1 AND r.id IN ({placeholders}) {due_filter}""",
+        (day, *rental_ids),
+        compact=True
+    )
+
+# Изменяющие запросы аренды возвращают строку в той же форме, что get_rental_by_id,
+# поэтому ни для инвалидации кэша, ни для ответа обработчику не нужен повторный SELECT
+_RENTAL_RETURNING = """RETURNING *,
+    (SELECT name FROM cars WHERE cars.id = rentals.car_id) AS car_name,
+    (SELECT first_name FROM users WHERE users.telegram_id = rentals.user_id) AS first_name,
+    (SELECT username FROM users WHERE users.telegram_id = rentals.user_id) AS username"""
+
+async def _store_next_reminder(rental: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Пересчитывает rentals.next_reminder_at по измененной строке аренды
+    
+    Вызывается изменяющими функциями внутри их транзакции; возвращает строку
+    с актуальным значением колонки.
+    """
+    value = None
+    if rental.get('is_active', 1):
+        value = format_reminder_at(next_reminder_at(rental, datetime.now().replace(second=0, microsecond=0)))
+    if value != rental.get('next_reminder_at'):
+        await db_pool.write("UPDATE rentals SET next_reminder_at = ? WHERE id = ?", (value, rental['id']))
+        rental = {**rental, 'next_reminder_at': value}
+    return rental
+
+# Подписчики на изменения аренд, влияющие на напоминания (планировщик держит
+# очередь ближайших напоминаний в памяти). Вызываются с обновленной строкой аренды
+_rental_listeners: List[Callable[[Mapping[str, Any]], None]] = []
+
+def subscribe_rental_changes(listener: Callable[[Mapping[str, Any]], None]):
+    """Подписывает обработчик на создание, завершение и изменение напоминаний аренд"""
+    if listener not in _rental_listeners:
+        _rental_listeners.append(listener)
+
+def unsubscribe_rental_changes(listener: Callable[[Mapping[str, Any]], None]):
+    """Отписывает обработчик изменений аренд"""
+    if listener in _rental_listeners:
+        _rental_listeners.remove(listener)
+
+def _notify_rental_changed(rental: Mapping[str, Any]):
+    """Сообщает подписчикам об изменении аренды (ошибка подписчика не ломает запись)"""
+    for listener in list(_rental_listeners):
+        try:
+            listener(rental)
+        except Exception as e:
+            logger.error(f"Ошибка обработчика изменения аренды: {e}")
 
-async def end_rental(rental_id: int) -> bool:
-    """Завершает аренду"""
+async def end_rental(rental_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Завершает аренду
+    
+    Returns:
+        Обновленная аренда (в форме get_rental_by_id) или None, если аренда не найдена
+    """
     try:
-        await db_pool.execute(
-            "UPDATE rentals SET is_active = 0 WHERE id = ?",
+        rental = await db_pool.write_returning(
+            f"UPDATE rentals SET is_active = 0, next_reminder_at = NULL WHERE id = ? {_RENTAL_RETURNING}",
             (rental_id,)
         )
-        await db_pool.commit()
+        if not rental:
+            return None
         
         # Очищаем кэш
-        cache.delete("rentals:active")
-        # Очищаем кэш пользователя (нужно получить user_id из rental_id)
-        rental = await db_pool.execute_fetchone("SELECT user_id FROM rentals WHERE id = ?", (rental_id,))
-        if rental:
-            cache.delete(f"rental:user:{rental['user_id']}")
-        
-        return True
+        cache.invalidate('rentals')
+        _notify_rental_changed(rental)
+        return rental
     except Exception as e:
         logger.error(f"Ошибка при завершении аренды: {e}")
-        return False
+        return None
 
-async def update_rental_reminder_time(rental_id: int, reminder_time: str) -> bool:
-    """Обновляет время напоминания для аренды"""
+async def update_rental_reminder_time(rental_id: int, reminder_time: str) -> Optional[Dict[str, Any]]:
+    """
+    Обновляет время напоминания для аренды
+    
+    Returns:
+        Обновленная аренда (в форме get_rental_by_id) или None, если аренда не найдена
+    """
     try:
-        await db_pool.execute(
-            "UPDATE rentals SET reminder_time = ? WHERE id = ?",
-            (reminder_time, rental_id)
-        )
-        await db_pool.commit()
+        async with db_pool.transaction():
+            rental = await db_pool.write_returning(
+                f"UPDATE rentals SET reminder_time = ? WHERE id = ? {_RENTAL_RETURNING}",
+                (reminder_time, rental_id)
+            )
+            if not rental:
+                return None
+            rental = await _store_next_reminder(rental)
         
         # Очищаем кэш
-        rental = await db_pool.execute_fetchone("SELECT user_id FROM rentals WHERE id = ?", (rental_id,))
-        if rental:
-            cache.delete(f"rental:user:{rental['user_id']}")
-        cache.delete("rentals:active")
-        
-        return True
+        cache.invalidate('rentals')
+        _notify_rental_changed(rental)
+        return rental
     except Exception as e:
         logger.error(f"Ошибка при обновлении времени напоминания: {e}")
-        return False
+        return None
 
-async def update_rental_reminder_type(rental_id: int, reminder_type: str) -> bool:
-    """Обновляет тип напоминания для аренды"""
+async def update_rental_reminder_type(rental_id: int, reminder_type: str) -> Optional[Dict[str, Any]]:
+    """
+    Обновляет тип напоминания для аренды
+    
+    Returns:
+        Обновленная аренда (в форме get_rental_by_id) или None, если аренда не найдена
+    """
     try:
-        await db_pool.execute(
-            "UPDATE rentals SET reminder_type = ?, last_reminder_date = NULL WHERE id = ?",
-            (reminder_type, rental_id)
-        )
-        await db_pool.commit()
+        async with db_pool.transaction():
+            rental = await db_pool.write_returning(
+                f"UPDATE rentals SET reminder_type = ?, last_reminder_date = NULL WHERE id = ? {_RENTAL_RETURNING}",
+                (reminder_type, rental_id)
+            )
+            if not rental:
+                return None
+            rental = await _store_next_reminder(rental)
         
         # Очищаем кэш
-        rental = await db_pool.execute_fetchone("SELECT user_id FROM rentals WHERE id = ?", (rental_id,))
-        if rental:
-            cache.delete(f"rental:user:{rental['user_id']}")
-        cache.delete("rentals:active")
-        
-        return True
+        cache.invalidate('rentals')
+        _notify_rental_changed(rental)
+        return rental
     except Exception as e:
         logger.error(f"Ошибка при обновлении типа напоминания: {e}")
-        return False
+        return None
 
-async def update_rental_last_reminder(rental_id: int, reminder_date: str) -> bool:
-    """Обновляет дату последнего напоминания"""
+async def update_rental_last_reminder(rental_id: int, reminder_date: str) -> Optional[Dict[str, Any]]:
+    """
+    Обновляет дату последнего напоминания
+    
+    Returns:
+        Обновленная аренда (в форме get_rental_by_id) или None, если аренда не найдена
+    """
+    try:
+        async with db_pool.transaction():
+            rental = await db_pool.write_returning(
+                f"UPDATE rentals SET last_reminder_date = ? WHERE id = ? {_RENTAL_RETURNING}",
+                (reminder_date, rental_id)
+            )
+            if not rental:
+                return None
+            rental = await _store_next_reminder(rental)
+        
+        # Планировщик отмечает напоминания ежедневно по каждой аренде: инвалидировать
+        # все пространство аренд здесь слишком дорого, удаляем только ключ
+        # пользователя и список активных аренд (в нем тоже есть last_reminder_date)
+        cache.delete(f"rental:user:{rental['user_id']}")
+        cache.delete("rentals:active")
+        _notify_rental_changed(rental)
+        return rental
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении даты напоминания: {e}")
+        return None
+
+async def update_rentals_reminders(last_reminder_dates: Mapping[int, str],
+                                   next_reminders: Mapping[int, Optional[datetime]]) -> List[Dict[str, Any]]:
+    """
+    Записывает состояние напоминаний пачки аренд одним UPDATE
+    
+    Args:
+        last_reminder_dates: ID аренды -> дата отправленного напоминания "YYYY-MM-DD"
+        next_reminders: ID аренды -> ближайшее напоминание (next_reminder_at)
+    
+    Returns:
+        Обновленные аренды (в форме get_rental_by_id)
+    """
+    rental_ids = list(dict.fromkeys([*last_reminder_dates, *next_reminders]))
+    if not rental_ids:
+        return []
+    
+    def assign(column: str, values: Mapping[int, Any]):
+        # Аренды без значения в пачке сохраняют прежнее
+        if not values:
+            return column, ()
+        cases = " ".join("WHEN ? THEN ?" for _ in values)
+        return f"CASE id {cases} ELSE {column} END", tuple(value for item in values.items() for value in item)
+    
     try:
-        await db_pool.execute(
-            "UPDATE rentals SET last_reminder_date = ? WHERE id = ?",
-            (reminder_date, rental_id)
+        last_sql, last_params = assign('last_reminder_date', last_reminder_dates)
+        next_sql, next_params = assign('next_reminder_at', {
+            rental_id: format_reminder_at(value) for rental_id, value in next_reminders.items()
+        })
+        placeholders = ", ".join("?" * len(rental_ids))
+        result = await db_pool.write(
+            f"""UPDATE rentals SET last_reminder_date = {last_sql}, next_reminder_at = {next_sql}
+                WHERE id IN ({placeholders}) {_RENTAL_RETURNING}""",
+            last_params + next_params + tuple(rental_ids),
+            returning=True
         )
-        await db_pool.commit()
-        
-        # Очищаем кэш
-        rental = await db_pool.execute_fetchone("SELECT user_id FROM rentals WHERE id = ?", (rental_id,))
-        if rental:
+        # Как в update_rental_last_reminder: удаляем только ключи пользователей
+        # и список активных аренд
+        if result.rows:
+            cache.delete("rentals:active")
+        for rental in result.rows:
             cache.delete(f"rental:user:{rental['user_id']}")
-        
-        return True
+            _notify_rental_changed(rental)
+        return result.rows
     except Exception as e:
-        logger.error(f"Ошибка при обновлении даты напоминания: {e}")
-        return False
+        logger.error(f"Ошибка при обновлении напоминаний аренд: {e}")
+        return []
+
+async def get_next_reminders() -> Sequence[Mapping[str, Any]]:
+    """
+    ID и ближайшее напоминание (next_reminder_at) всех активных аренд
+    
+    Планировщик строит по ним очередь при запуске, не разбирая даты аренд
+    (покрывающий индекс idx_rentals_active_next_reminder).
+    """
+    return await db_pool.execute_fetchall(
+        "SELECT id, next_reminder_at FROM rentals WHERE is_active = 1",
+        compact=True
+    )
 
 async def get_rental_by_id(rental_id: int) -> Optional[Dict[str, Any]]:
     """Получает аренду по ID"""
@@ -835,45 +855,49 @@ async def get_rental_by_id(rental_id: int) -> Optional[Dict[str, Any]]:
         logger.error(f"Ошибка при получении аренды: {e}")
         return None
 
-async def update_rental_deposit_status(rental_id: int, deposit_status: str) -> bool:
-    """Обновляет статус залога аренды (Модуль 4)"""
+async def update_rental_deposit_status(rental_id: int, deposit_status: str) -> Optional[Dict[str, Any]]:
+    """
+    Обновляет статус залога аренды (Модуль 4)
+    
+    Returns:
+        Обновленная аренда (в форме get_rental_by_id) или None, если аренда не найдена
+    """
     try:
-        await db_pool.execute(
-            "UPDATE rentals SET deposit_status = ? WHERE id = ?",
+        rental = await db_pool.write_returning(
+            f"UPDATE rentals SET deposit_status = ? WHERE id = ? {_RENTAL_RETURNING}",
             (deposit_status, rental_id)
         )
-        await db_pool.commit()
+        if not rental:
+            return None
         
         # Очищаем кэш
-        rental = await db_pool.execute_fetchone("SELECT user_id FROM rentals WHERE id = ?", (rental_id,))
-        if rental:
-            cache.delete(f"rental:user:{rental['user_id']}")
-        cache.delete("rentals:active")
-        
-        return True
+        cache.invalidate('rentals')
+        return rental
     except Exception as e:
         logger.error(f"Ошибка при обновлении статуса залога: {e}")
-        return False
+        return None
 
-async def update_rental_end_date(rental_id: int, end_date: str) -> bool:
-    """Обновляет дату окончания аренды"""
+async def update_rental_end_date(rental_id: int, end_date: str) -> Optional[Dict[str, Any]]:
+    """
+    Обновляет дату окончания аренды
+    
+    Returns:
+        Обновленная аренда (в форме get_rental_by_id) или None, если аренда не найдена
+    """
     try:
-        await db_pool.execute(
-            "UPDATE rentals SET end_date = ? WHERE id = ?",
+        rental = await db_pool.write_returning(
+            f"UPDATE rentals SET end_date = ? WHERE id = ? {_RENTAL_RETURNING}",
             (end_date, rental_id)
         )
-        await db_pool.commit()
+        if not rental:
+            return None
         
         # Очищаем кэш
-        rental = await db_pool.execute_fetchone("SELECT user_id FROM rentals WHERE id = ?", (rental_id,))
-        if rental:
-            cache.delete(f"rental:user:{rental['user_id']}")
-        cache.delete("rentals:active")
-        
-        return True
+        cache.invalidate('rentals')
+        return rental
     except Exception as e:
         logger.error(f"Ошибка при обновлении даты окончания аренды: {e}")
-        return False
+        return None
 
 # === ФУНКЦИЯ ДЛЯ ВЫГРУЗКИ БАЗЫ ДАННЫХ ===
 
@@ -906,24 +930,6 @@ async def export_database() -> Optional[bytes]:
 
 # === ФУНКЦИИ ДЛЯ РАБОТЫ С КОНТАКТАМИ ===
 
-async def init_contacts():
-    """Инициализация контактов по умолчанию"""
-    try:
-        # Проверяем, есть ли уже контакты
-        existing = await db_pool.execute_fetchone("SELECT id FROM contacts WHERE contact_type = 'booking'")
-        if existing:
-            return
-        
-        # Создаем контакт по умолчанию
-        await db_pool.execute(
-            """INSERT OR IGNORE INTO contacts (contact_type, name, phone, telegram_username) 
-               VALUES (?, ?, ?, ?)""",
-            ('booking', 'Денис', '+7 919 634-90-91', 'olimp_auto')
-        )
-        await db_pool.commit()
-    except Exception as e:
-        logger.warning(f"Ошибка при инициализации контактов: {e}")
-
 async def get_contact(contact_type: str = 'booking') -> Optional[Dict[str, Any]]:
     """Получает контакт по типу"""
     try:
@@ -940,42 +946,42 @@ async def update_contact(contact_type: str, name: Optional[str] = None,
                         telegram_id: Optional[int] = None) -> bool:
     """Обновляет контакт"""
     try:
-        # Проверяем, существует ли контакт
-        existing = await get_contact(contact_type)
-        
-        if existing:
-            # Обновляем существующий
-            updates = []
-            params = []
-            
-            if name is not None:
-                updates.append("name = ?")
-                params.append(name)
-            if phone is not None:
-                updates.append("phone = ?")
-                params.append(phone)
-            if telegram_username is not None:
-                updates.append("telegram_username = ?")
-                params.append(telegram_username)
-            if telegram_id is not None:
-                updates.append("telegram_id = ?")
-                params.append(telegram_id)
+        async with db_pool.transaction():
+            # Проверяем, существует ли контакт
+            existing = await get_contact(contact_type)
             
-            if updates:
-                updates.append("updated_at = CURRENT_TIMESTAMP")
-                params.append(contact_type)
+            if existing:
+                # Обновляем существующий
+                updates = []
+                params = []
                 
-                query = f"UPDATE contacts SET {', '.join(updates)} WHERE contact_type = ?"
-                await db_pool.execute(query, tuple(params))
-        else:
-            # Создаем новый
-            await db_pool.execute(
-                """INSERT INTO contacts (contact_type, name, phone, telegram_username, telegram_id) 
-                   VALUES (?, ?, ?, ?, ?)""",
-                (contact_type, name, phone, telegram_username, telegram_id)
-            )
+                if name is not None:
+                    updates.append("name = ?")
+                    params.append(name)
+                if phone is not None:
+                    updates.append("phone = ?")
+                    params.append(phone)
+                if telegram_username is not None:
+                    updates.append("telegram_username = ?")
+                    params.append(telegram_username)
+                if telegram_id is not None:
+                    updates.append("telegram_id = ?")
+                    params.append(telegram_id)
+                
+                if updates:
+                    updates.append("updated_at = CURRENT_TIMESTAMP")
+                    params.append(contact_type)
+                    
+                    query = f"UPDATE contacts SET {', '.join(updates)} WHERE contact_type = ?"
+                    await db_pool.execute(query, tuple(params))
+            else:
+                # Создаем новый
+                await db_pool.execute(
+                    """INSERT INTO contacts (contact_type, name, phone, telegram_username, telegram_id) 
+                       VALUES (?, ?, ?, ?, ?)""",
+                    (contact_type, name, phone, telegram_username, telegram_id)
+                )
         
-        await db_pool.commit()
         return True
     except Exception as e:
         logger.error(f"Ошибка при обновлении контакта: {e}")
@@ -986,12 +992,11 @@ async def update_contact(contact_type: str, name: Optional[str] = None,
 async def add_user_note(user_id: int, admin_id: int, note_text: str) -> Optional[int]:
     """Добавляет заметку о пользователе (Модуль 2)"""
     try:
-        cursor = await db_pool.execute(
+        result = await db_pool.write(
             "INSERT INTO user_notes (user_id, admin_id, note_text) VALUES (?, ?, ?)",
             (user_id, admin_id, note_text)
         )
-        await db_pool.commit()
-        return cursor.lastrowid
+        return result.lastrowid
     except Exception as e:
         logger.error(f"Ошибка при добавлении заметки о пользователе: {e}")
         return None
@@ -1014,9 +1019,8 @@ async def get_user_notes(user_id: int) -> List[Dict[str, Any]]:
 async def delete_user_note(note_id: int) -> bool:
     """Удаляет заметку о пользователе (Модуль 2)"""
     try:
-        cursor = await db_pool.execute("DELETE FROM user_notes WHERE id = ?", (note_id,))
-        await db_pool.commit()
-        return cursor.rowcount > 0
+        result = await db_pool.write("DELETE FROM user_notes WHERE id = ?", (note_id,))
+        return result.rowcount > 0
     except Exception as e:
         logger.error(f"Ошибка при удалении заметки: {e}")
         return False
@@ -1038,13 +1042,12 @@ async def add_rental_incident(rental_id: int, incident_type: str, description: s
                               amount: float = 0.0, photo_file_id: Optional[str] = None) -> Optional[int]:
     """Добавляет инцидент к аренде (Модуль 3)"""
     try:
-        cursor = await db_pool.execute(
+        result = await db_pool.write(
             """INSERT INTO rental_incidents (rental_id, incident_type, description, amount, photo_file_id) 
                VALUES (?, ?, ?, ?, ?)""",
             (rental_id, incident_type, description, amount, photo_file_id)
         )
-        await db_pool.commit()
-        return cursor.lastrowid
+        return result.lastrowid
     except Exception as e:
         logger.error(f"Ошибка при добавлении инцидента: {e}")
         return None
@@ -1065,9 +1068,8 @@ async def get_rental_incidents(rental_id: int) -> List[Dict[str, Any]]:
 async def delete_rental_incident(incident_id: int) -> bool:
     """Удаляет инцидент (Модуль 3)"""
     try:
-        cursor = await db_pool.execute("DELETE FROM rental_incidents WHERE id = ?", (incident_id,))
-        await db_pool.commit()
-        return cursor.rowcount > 0
+        result = await db_pool.write("DELETE FROM rental_incidents WHERE id = ?", (incident_id,))
+        return result.rowcount > 0
     except Exception as e:
         logger.error(f"Ошибка при удалении инцидента: {e}")
         return False
@@ -1084,13 +1086,12 @@ async def add_car_maintenance(car_id: int, entry_type: str, description: str,
             from datetime import date
             event_date = date.today().isoformat()
         
-        cursor = await db_pool.execute(
+        result = await db_pool.write(
             """INSERT INTO car_maintenance (car_id, entry_type, description, mileage, event_date, reminder_date) 
                VALUES (?, ?, ?, ?, ?, ?)""",
             (car_id, entry_type, description, mileage, event_date, reminder_date)
         )
-        await db_pool.commit()
-        return cursor.lastrowid
+        return result.lastrowid
     except Exception as e:
         logger.error(f"Ошибка при добавлении записи обслуживания: {e}")
         return None
@@ -1128,11 +1129,10 @@ async def get_maintenance_reminders_for_today() -> List[Dict[str, Any]]:
 async def remove_maintenance_reminder(entry_id: int) -> bool:
     """Удаляет напоминание из записи обслуживания (Модуль 5)"""
     try:
-        await db_pool.execute(
+        await db_pool.write(
             "UPDATE car_maintenance SET reminder_date = NULL WHERE id = ?",
             (entry_id,)
         )
-        await db_pool.commit()
         return True
     except Exception as e:
         logger.error(f"Ошибка при удалении напоминания: {e}")
@@ -1155,25 +1155,27 @@ async def get_setting(setting_key: str) -> Optional[str]:
 async def set_setting(setting_key: str, setting_value: str) -> bool:
     """Устанавливает значение настройки (Модуль 6)"""
     try:
-        await db_pool.execute(
+        await db_pool.write(
             """INSERT OR REPLACE INTO settings (setting_key, setting_value, updated_at) 
                VALUES (?, ?, CURRENT_TIMESTAMP)""",
             (setting_key, setting_value)
         )
-        await db_pool.commit()
         return True
     except Exception as e:
         logger.error(f"Ошибка при установке настройки: {e}")
         return False
 
-async def generate_referral_code(telegram_id: int) -> str:
-    """Генерирует уникальный реферальный код для пользователя (Модуль 6)"""
+def _random_referral_code(telegram_id: int) -> str:
+    """Формирует реферальный код: user_id + случайная строка из 6 символов"""
     import random
     import string
     
-    # Формируем код: user_id + случайная строка из 6 символов
     random_part = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    code = f"{telegram_id}{random_part}"
+    return f"{telegram_id}{random_part}"
+
+async def generate_referral_code(telegram_id: int) -> str:
+    """Генерирует уникальный реферальный код для пользователя (Модуль 6)"""
+    code = _random_referral_code(telegram_id)
     
     # Проверяем уникальность
     try:
@@ -1200,13 +1202,21 @@ async def ensure_user_referral_code(telegram_id: int) -> str:
         if referral_code:
             return referral_code
         
-        # Генерируем новый код
-        new_code = await generate_referral_code(telegram_id)
-        await db_pool.execute(
-            "UPDATE users SET referral_code = ? WHERE telegram_id = ?",
-            (new_code, telegram_id)
-        )
-        await db_pool.commit()
+        async with db_pool.transaction():
+            # Повторная проверка под блокировкой записи: код мог назначить параллельный /start
+            user = await db_pool.execute_fetchone(
+                "SELECT referral_code FROM users WHERE telegram_id = ?",
+                (telegram_id,)
+            )
+            if user and user.get('referral_code'):
+                return user['referral_code']
+            
+            # Генерируем новый код (проверка уникальности идет в той же транзакции)
+            new_code = await generate_referral_code(telegram_id)
+            await db_pool.execute(
+                "UPDATE users SET referral_code = ? WHERE telegram_id = ?",
+                (new_code, telegram_id)
+            )
         return new_code
     except Exception as e:
         logger.error(f"Ошибка при генерации реферального кода: {e}")
@@ -1226,11 +1236,10 @@ async def get_user_by_referral_code(referral_code: str) -> Optional[Dict[str, An
 async def set_user_referrer(user_id: int, referrer_id: int) -> bool:
     """Устанавливает реферера для пользователя (Модуль 6)"""
     try:
-        await db_pool.execute(
+        await db_pool.write(
             "UPDATE users SET referrer_id = ? WHERE telegram_id = ? AND referrer_id IS NULL",
             (referrer_id, user_id)
         )
-        await db_pool.commit()
         return True
     except Exception as e:
         logger.error(f"Ошибка при установке реферера: {e}")
@@ -1239,19 +1248,14 @@ async def set_user_referrer(user_id: int, referrer_id: int) -> bool:
 async def get_referral_stats() -> Dict[str, Any]:
     """Получает статистику реферальной системы (Модуль 6)"""
     try:
-        # Количество пользователей с реферерами
+        # Оба счетчика одним запросом, без загрузки всех пользователей
         result = await db_pool.execute_fetchone(
-            "SELECT COUNT(*) as count FROM users WHERE referrer_id IS NOT NULL"
+            "SELECT COUNT(*) as total_count, COUNT(referrer_id) as referred_count FROM users"
         )
-        referred_count = result['count'] if result else 0
-        
-        # Всего пользователей
-        all_users = await get_all_users()
-        total_count = len(all_users)
         
         return {
-            'referred_count': referred_count,
-            'total_count': total_count
+            'referred_count': result['referred_count'] if result else 0,
+            'total_count': result['total_count'] if result else 0
         }
     except Exception as e:
         logger.error(f"Ошибка при получении статистики рефералов: {e}")
@@ -1266,11 +1270,10 @@ async def update_user_source(telegram_id: int, source: str) -> bool:
             # Источник уже установлен, не перезаписываем
             return False
         
-        await db_pool.execute(
+        await db_pool.write(
             "UPDATE users SET source = ? WHERE telegram_id = ?",
             (source, telegram_id)
         )
-        await db_pool.commit()
         return True
     except Exception as e:
         logger.error(f"Ошибка при обновлении источника пользователя: {e}")
@@ -1279,19 +1282,21 @@ async def update_user_source(telegram_id: int, source: str) -> bool:
 async def get_users_by_source() -> Dict[str, int]:
     """Получает статистику пользователей по источникам (Модуль 7)"""
     try:
+        # Группа с source = NULL - пользователи без источника
         result = await db_pool.execute_fetchall(
-            "SELECT source, COUNT(*) as count FROM users WHERE source IS NOT NULL GROUP BY source"
+            "SELECT source, COUNT(*) as count FROM users GROUP BY source"
         )
         
         stats = {}
+        direct_count = 0
         for row in result:
-            stats[row['source']] = row['count']
+            if row['source'] is None:
+                direct_count = row['count']
+            else:
+                stats[row['source']] = row['count']
         
         # Добавляем прямые переходы (пользователи без источника)
-        total_with_source = sum(stats.values())
-        all_users = await get_all_users()
-        total_users = len(all_users)
-        stats['Прямой переход'] = total_users - total_with_source
+        stats['Прямой переход'] = direct_count
         
         return stats
     except Exception as e:
@@ -1401,26 +1406,3 @@ async def get_referral_statistics() -> Dict[str, Any]:
     except Exception as e:
         logger.error(f"Ошибка при получении расширенной статистики рефералов: {e}")
         return {'referred_count': 0, 'total_count': 0, 'used_bonus_count': 0, 'total_discount_amount': 0}
-
-async def _init_referral_settings(db):
-    """Инициализация настроек реферальной системы по умолчанию"""
-    try:
-        # Проверяем, есть ли уже настройки
-        cursor = await db.execute("SELECT setting_key FROM settings WHERE setting_key IN (?, ?, ?)",
-                                 ('referral_system_enabled', 'referral_bonus_percentage', 'referral_bonus_duration_days'))
-        existing_keys = {row[0] for row in await cursor.fetchall()}
-        
-        # Добавляем недостающие настройки по умолчанию
-        default_settings = [
-            ('referral_system_enabled', 'false'),
-            ('referral_bonus_percentage', '10'),
-            ('referral_bonus_duration_days', '30')
-        ]
-        
-        for key, value in default_settings:
-            if key not in existing_keys:
-                await db.execute("INSERT INTO settings (setting_key, setting_value) VALUES (?, ?)",
-                               (key, value))
-                logger.info(f"✅ Добавлена настройка реферальной системы: {key} = {value}")
-    except Exception as e:
-        logger.warning(f"⚠️  Ошибка при инициализации настроек реферальной системы: {e}")
\ No newline at end of file
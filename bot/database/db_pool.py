@@ -1,78 +1,594 @@
 """
 Connection pool для оптимизации работы с БД
+
+Пул состоит из одного соединения-писателя и нескольких соединений-читателей
+(WAL). Запросы на чтение из execute_fetchone/execute_fetchall выполняются на
+свободном читателе и не ждут в очереди за записью; все изменения, DDL и
+PRAGMA идут через писателя.
+
+Одиночные изменения через write() в режиме очереди записи накапливаются
+в течение короткого окна и фиксируются одной транзакцией (group commit).
+Многошаговые операции выполняются атомарно через `async with db_pool.transaction()`.
+
+Каждый запрос хронометрируется (см. query_metrics): статистика доступна
+через get_query_stats()/get_slow_queries().
 """
+import asyncio
+import logging
+import time
 import aiosqlite
-from typing import Optional
-from bot.config import DB_PATH
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Any, Tuple, NamedTuple, Union, Mapping
+from bot.config import DB_PATH, DB_READ_POOL_SIZE
+from bot.database.query_metrics import QueryMetrics
+from bot.database.rows import CompactRow
+from bot.utils.constants import (
+    DB_ACQUIRE_TIMEOUT, DB_CHUNK_SIZE, DB_WRITE_QUEUE_ENABLED,
+    DB_WRITE_BATCH_WINDOW, DB_WRITE_BATCH_MAX
+)
+
+logger = logging.getLogger(__name__)
+
+# Ключевые слова, с которых начинаются запросы только на чтение
+_READ_PREFIXES: Tuple[str, ...] = ("SELECT", "WITH", "EXPLAIN")
+# Ключевые слова, превращающие CTE-запрос в изменяющий
+_WRITE_KEYWORDS: Tuple[str, ...] = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def is_read_query(query: str) -> bool:
+    """Проверяет, является ли запрос чистым чтением (можно выполнить на читателе)"""
+    head = query.lstrip().upper()
+    if not head.startswith(_READ_PREFIXES):
+        return False
+    if head.startswith("WITH"):
+        # WITH ... INSERT/UPDATE/DELETE изменяет данные
+        return not any(keyword in head for keyword in _WRITE_KEYWORDS)
+    return True
+
+
+class WriteResult(NamedTuple):
+    """Результат изменяющего запроса (совместим с cursor.lastrowid/cursor.rowcount)"""
+    lastrowid: Optional[int]
+    rowcount: int
+    # Строки RETURNING (только для write(..., returning=True))
+    rows: Optional[List[Dict[str, Any]]] = None
+
 
 class DatabasePool:
     """Пул соединений с базой данных для оптимизации производительности"""
-    
+
     _instance: Optional['DatabasePool'] = None
+    # Соединение-писатель (единственное, SQLite допускает одного писателя)
     _connection: Optional[aiosqlite.Connection] = None
-    
+    _readers: List[aiosqlite.Connection] = []
+    _idle_readers: Optional[asyncio.Queue] = None
+    read_pool_size: int = DB_READ_POOL_SIZE
+    acquire_timeout: float = DB_ACQUIRE_TIMEOUT
+    write_queue_enabled: bool = DB_WRITE_QUEUE_ENABLED
+    write_batch_window: float = DB_WRITE_BATCH_WINDOW
+    write_batch_max: int = DB_WRITE_BATCH_MAX
+    _write_queue: Optional[asyncio.Queue] = None
+    _write_flusher: Optional[asyncio.Task] = None
+    # Блокировка писателя: транзакции, очередь записи и одиночные изменения не перемешиваются
+    _write_lock: Optional[asyncio.Lock] = None
+    _tx_owner: Optional[asyncio.Task] = None
+    _tx_depth: int = 0
+    # Фоновые задачи сбора планов медленных запросов (ссылки не дают GC их удалить)
+    _plan_tasks: set = set()
+    _stats: Dict[str, Any] = {}
+    query_metrics: QueryMetrics = QueryMetrics()
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
-    
-    async def initialize(self):
-        """Инициализация пула соединений"""
+
+    async def initialize(self, read_pool_size: Optional[int] = None,
+                         acquire_timeout: Optional[float] = None,
+                         write_queue: Optional[bool] = None):
+        """
+        Инициализация пула соединений
+
+        Args:
+            read_pool_size: Количество соединений-читателей (по умолчанию DB_READ_POOL_SIZE)
+            acquire_timeout: Максимальное ожидание свободного читателя в секундах
+            write_queue: Включить групповую фиксацию для write() (по умолчанию DB_WRITE_QUEUE_ENABLED)
+        """
         if self._connection is None:
-            self._connection = await aiosqlite.connect(
-                DB_PATH,
-                check_same_thread=False
-            )
-            # Устанавливаем row_factory один раз при инициализации
-            self._connection.row_factory = aiosqlite.Row
+            if read_pool_size is not None:
+                self.read_pool_size = read_pool_size
+            if acquire_timeout is not None:
+                self.acquire_timeout = acquire_timeout
+            if write_queue is not None:
+                self.write_queue_enabled = write_queue
+
+            self._write_queue = asyncio.Queue()
+            self._write_flusher = None
+            self._write_lock = asyncio.Lock()
+            self._tx_owner = None
+            self._tx_depth = 0
+            self._plan_tasks = set()
+            self._reset_stats()
+
+            self._connection = await self._open_connection()
             # Оптимизация для производительности
             await self._connection.execute("PRAGMA journal_mode=WAL")
             await self._connection.execute("PRAGMA synchronous=NORMAL")
-            await self._connection.execute("PRAGMA cache_size=10000")
             await self._connection.execute("PRAGMA foreign_keys=ON")
             await self._connection.commit()
-            print("✅ Database pool initialized")
-    
+
+            self._readers = []
+            self._idle_readers = asyncio.Queue()
+            # In-memory БД не разделяется между соединениями - читаем через писателя
+            if DB_PATH != ":memory:":
+                for _ in range(self.read_pool_size):
+                    reader = await self._open_connection()
+                    # Читатель не может случайно изменить данные
+                    await reader.execute("PRAGMA query_only=ON")
+                    self._readers.append(reader)
+                    self._idle_readers.put_nowait(reader)
+
+            print(f"✅ Database pool initialized (readers: {len(self._readers)})")
+
+    async def _open_connection(self) -> aiosqlite.Connection:
+        """Открывает соединение с общими настройками"""
+        conn = await aiosqlite.connect(DB_PATH, check_same_thread=False)
+        # Устанавливаем row_factory один раз при открытии
+        conn.row_factory = aiosqlite.Row
+        await conn.execute("PRAGMA cache_size=10000")
+        return conn
+
     async def get_connection(self) -> aiosqlite.Connection:
-        """Получить соединение из пула"""
+        """Получить соединение-писатель"""
         if self._connection is None:
             await self.initialize()
         return self._connection
-    
+
     async def close(self):
         """Закрыть все соединения"""
+        await self._stop_write_flusher()
+        await self._cancel_plan_tasks()
+        for reader in self._readers:
+            await reader.close()
+        self._readers = []
+        self._idle_readers = None
         if self._connection:
             await self._connection.close()
             self._connection = None
             print("✅ Database pool closed")
-    
-    async def execute(self, query: str, params: tuple = ()):
-        """Выполнить запрос и вернуть cursor"""
+
+    @asynccontextmanager
+    async def _read_connection(self):
+        """
+        Выдает свободное соединение-читатель на время запроса
+
+        Если читателей нет или ожидание превысило acquire_timeout,
+        запрос выполняется на соединении-писателе под блокировкой записи,
+        чтобы не попасть внутрь чужой незафиксированной транзакции.
+        """
+        await self.get_connection()
+        if not self._readers:
+            async with self._writer_connection() as writer:
+                yield writer
+            return
+
+        started = time.perf_counter()
+        try:
+            reader = await asyncio.wait_for(self._idle_readers.get(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._stats['acquire_timeouts'] += 1
+            logger.warning(
+                f"Нет свободного читателя за {self.acquire_timeout} с, запрос выполняется через писателя"
+            )
+            reader = None
+
+        waited = time.perf_counter() - started
+        self._stats['acquires'] += 1
+        self._stats['acquire_wait_total'] += waited
+        self._stats['acquire_wait_max'] = max(self._stats['acquire_wait_max'], waited)
+
+        if reader is None:
+            async with self._writer_connection() as writer:
+                yield writer
+            return
+
+        idle_readers = self._idle_readers
+        try:
+            yield reader
+        finally:
+            idle_readers.put_nowait(reader)
+
+    def in_transaction(self) -> bool:
+        """Выполняется ли текущая задача внутри db_pool.transaction()"""
+        return self._tx_owner is not None and self._tx_owner is asyncio.current_task()
+
+    @asynccontextmanager
+    async def _writer_connection(self):
+        """Выдает соединение-писатель, дожидаясь завершения чужой транзакции"""
+        writer = await self.get_connection()
+        if self.in_transaction():
+            yield writer
+            return
+        async with self._write_lock:
+            yield writer
+
+    @asynccontextmanager
+    async def _connection_for(self, query: str):
+        """Выбирает соединение по типу запроса: чтение - читатель, иначе - писатель"""
+        await self.get_connection()
+        if is_read_query(query) and not self.in_transaction():
+            self._stats['reads'] += 1
+            async with self._read_connection() as conn:
+                yield conn
+        else:
+            # Внутри транзакции читаем через писателя, чтобы видеть свои изменения
+            self._stats['writes'] += 1
+            async with self._writer_connection() as conn:
+                yield conn
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Атомарная транзакция на соединении-писателе
+
+        Внешний уровень открывает BEGIN IMMEDIATE (блокировка записи берется
+        сразу, а не при первом изменении) и удерживает писателя до COMMIT;
+        вложенные вызовы создают SAVEPOINT. При исключении изменения уровня
+        откатываются. Внутри блока execute/execute_fetchone/execute_fetchall/
+        write выполняются в этой транзакции, commit() ничего не делает.
+
+        Использование:
+            async with db_pool.transaction():
+                await db_pool.execute(...)
+        """
         conn = await self.get_connection()
-        cursor = await conn.execute(query, params)
+
+        if self.in_transaction():
+            self._tx_depth += 1
+            savepoint = f"tx_savepoint_{self._tx_depth}"
+            await conn.execute(f"SAVEPOINT {savepoint}")
+            try:
+                yield self
+            except BaseException:
+                await conn.execute(f"ROLLBACK TO {savepoint}")
+                await conn.execute(f"RELEASE {savepoint}")
+                raise
+            else:
+                await conn.execute(f"RELEASE {savepoint}")
+            finally:
+                self._tx_depth -= 1
+            return
+
+        async with self._write_lock:
+            if conn.in_transaction:
+                # Фиксируем незавершенные изменения, сделанные без транзакции
+                await conn.commit()
+            await conn.execute("BEGIN IMMEDIATE")
+            self._tx_owner = asyncio.current_task()
+            self._tx_depth = 0
+            self._stats['transactions'] += 1
+            try:
+                yield self
+            except BaseException:
+                await conn.rollback()
+                self._stats['rollbacks'] += 1
+                raise
+            else:
+                await conn.commit()
+            finally:
+                self._tx_owner = None
+
+    async def execute(self, query: str, params: tuple = ()):
+        """Выполнить запрос на соединении-писателе и вернуть cursor"""
+        async with self._writer_connection() as conn:
+            self._stats['writes'] += 1
+            started = time.perf_counter()
+            cursor = await conn.execute(query, params)
+            self._observe_query(query, params, time.perf_counter() - started, max(cursor.rowcount, 0))
         return cursor
-    
+
     async def execute_fetchone(self, query: str, params: tuple = ()):
         """Выполнить запрос и получить одну строку"""
-        conn = await self.get_connection()
-        # row_factory уже установлен при инициализации
-        cursor = await conn.execute(query, params)
-        row = await cursor.fetchone()
+        async with self._connection_for(query) as conn:
+            started = time.perf_counter()
+            # row_factory уже установлен при открытии соединения
+            cursor = await conn.execute(query, params)
+            try:
+                row = await cursor.fetchone()
+            finally:
+                # Закрываем курсор, чтобы читатель не удерживал снимок WAL
+                await cursor.close()
+            self._observe_query(query, params, time.perf_counter() - started, 1 if row else 0)
         return dict(row) if row else None
-    
-    async def execute_fetchall(self, query: str, params: tuple = ()):
-        """Выполнить запрос и получить все строки"""
-        conn = await self.get_connection()
-        # row_factory уже установлен при инициализации
-        cursor = await conn.execute(query, params)
-        rows = await cursor.fetchall()
+
+    async def execute_fetchall(self, query: str, params: tuple = (), compact: bool = False):
+        """
+        Выполнить запрос и получить все строки
+
+        Args:
+            query: Текст запроса
+            params: Параметры запроса
+            compact: Вернуть неизменяемые CompactRow вместо dict
+                (для больших кэшируемых выборок горячих таблиц)
+        """
+        async with self._connection_for(query) as conn:
+            started = time.perf_counter()
+            cursor = await conn.execute(query, params)
+            try:
+                rows = await cursor.fetchall()
+                description = cursor.description
+            finally:
+                await cursor.close()
+            self._observe_query(query, params, time.perf_counter() - started, len(rows))
+        if compact:
+            return CompactRow.from_rows(description, rows)
         return [dict(row) for row in rows]
-    
+
+    async def iterate(self, query: str, params: tuple = (), key: str = 'id',
+                      start: Any = 0, batch: int = DB_CHUNK_SIZE):
+        """
+        Потоково перебрать строки результата порциями по ключу (async генератор)
+
+        Запрос постраничный (keyset): выбирает колонку key, а два последних
+        параметра - значение ключа, после которого читать, и размер порции:
+        "SELECT * FROM users WHERE id > ? ORDER BY id LIMIT ?". Каждая порция
+        читается отдельным execute_fetchall, и соединение возвращается в пул
+        до того, как потребитель получит строки: паузы между порциями не
+        удерживают читателя и снимок WAL, а досрочный выход из цикла ничего
+        не оставляет открытым.
+
+        Args:
+            query: Постраничный запрос на чтение
+            params: Параметры запроса (без значения ключа и размера порции)
+            key: Колонка, по которой упорядочены строки
+            start: Значение ключа, после которого начинать чтение
+            batch: Количество строк в порции
+
+        Yields:
+            Dict[str, Any]: Очередная строка результата
+        """
+        after = start
+        while True:
+            rows = await self.execute_fetchall(query, (*params, after, batch))
+            for row in rows:
+                yield row
+            if len(rows) < batch:
+                return
+            after = rows[-1][key]
+
     async def commit(self):
-        """Закоммитить изменения"""
-        if self._connection:
-            await self._connection.commit()
+        """Закоммитить изменения (внутри transaction() фиксация происходит при выходе из блока)"""
+        if self._connection and not self.in_transaction():
+            async with self._write_lock:
+                await self._connection.commit()
+
+    async def write(self, query: str, params: Union[tuple, Mapping[str, Any]] = (),
+                    returning: bool = False) -> WriteResult:
+        """
+        Выполнить одиночный изменяющий запрос и зафиксировать его
+
+        В режиме очереди записи запросы конкурентных корутин собираются в
+        пачку (окно write_batch_window или write_batch_max запросов) и
+        фиксируются одним COMMIT. Каждый вызов получает свои lastrowid/rowcount
+        после общей фиксации; ошибка одного запроса не откатывает остальные.
+
+        Args:
+            query: Изменяющий запрос
+            params: Параметры запроса (кортеж для ? или словарь для :name)
+            returning: Запрос содержит RETURNING - прочитать возвращенные строки
+
+        Returns:
+            WriteResult с lastrowid, rowcount и (при returning) строками запроса
+        """
+        if self.in_transaction():
+            # Внутри транзакции пишем сразу - фиксация произойдет вместе с ней
+            async with self._writer_connection() as conn:
+                self._stats['writes'] += 1
+                return await self._run_write(conn, query, params, returning)
+
+        if not self.write_queue_enabled:
+            async with self._writer_connection() as conn:
+                self._stats['writes'] += 1
+                result = await self._run_write(conn, query, params, returning)
+            await self.commit()
+            return result
+
+        await self.get_connection()
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((query, params, returning, future))
+        self._ensure_write_flusher()
+        return await future
+
+    async def write_returning(self, query: str,
+                              params: Union[tuple, Mapping[str, Any]] = ()) -> Optional[Dict[str, Any]]:
+        """
+        Выполнить INSERT/UPDATE ... RETURNING через write() и вернуть первую строку
+
+        Returns:
+            Строка, возвращенная запросом, или None, если запрос не изменил строк
+        """
+        result = await self.write(query, params, returning=True)
+        return result.rows[0] if result.rows else None
+
+    async def _run_write(self, conn: aiosqlite.Connection, query: str,
+                         params: Union[tuple, Mapping[str, Any]], returning: bool) -> WriteResult:
+        """Выполняет изменяющий запрос на писателе (вызывается под блокировкой записи)"""
+        started = time.perf_counter()
+        cursor = await conn.execute(query, params)
+        rows = None
+        if returning:
+            # Читаем RETURNING до конца: незавершенный запрос мешает RELEASE/COMMIT
+            try:
+                rows = [dict(row) for row in await cursor.fetchall()]
+            finally:
+                await cursor.close()
+        self._observe_query(query, params, time.perf_counter() - started, max(cursor.rowcount, 0))
+        return WriteResult(cursor.lastrowid, cursor.rowcount, rows)
+
+    def _ensure_write_flusher(self):
+        """Запускает фоновую задачу групповой фиксации, если она не работает"""
+        flusher = self._write_flusher
+        if flusher is None or flusher.done() or flusher.get_loop() is not asyncio.get_running_loop():
+            self._write_flusher = asyncio.create_task(self._write_flush_loop())
+
+    async def _write_flush_loop(self):
+        """Собирает запросы из очереди в пачки и фиксирует их"""
+        queue = self._write_queue
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.write_batch_window
+            while len(batch) < self.write_batch_max:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                async with self._write_lock:
+                    await self._flush_write_batch(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _flush_write_batch(self, batch: List[Tuple[str, tuple, bool, asyncio.Future]]):
+        """Выполняет пачку запросов в одной транзакции и разрешает futures"""
+        conn = self._connection
+        outcomes = []
+        try:
+            if not conn.in_transaction:
+                await conn.execute("BEGIN")
+            for query, params, returning, future in batch:
+                # Savepoint изолирует ошибку одного запроса от остальной пачки
+                await conn.execute("SAVEPOINT write_queue")
+                try:
+                    result = await self._run_write(conn, query, params, returning)
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    await conn.execute("ROLLBACK TO write_queue")
+                    outcomes.append((future, None, e))
+                await conn.execute("RELEASE write_queue")
+            await conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка групповой фиксации ({len(batch)} запросов): {e}")
+            try:
+                await conn.rollback()
+            except Exception:
+                pass
+            outcomes = [(future, None, e) for *_, future in batch]
+
+        self._stats['write_batches'] += 1
+        self._stats['queued_writes'] += len(batch)
+        self._stats['largest_write_batch'] = max(self._stats['largest_write_batch'], len(batch))
+
+        for future, result, error in outcomes:
+            if future.done():
+                # Вызывающая корутина отменена - результат никому не нужен
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def _stop_write_flusher(self):
+        """Дожидается фиксации накопленных запросов и останавливает очередь записи"""
+        flusher = self._write_flusher
+        self._write_flusher = None
+        if flusher is None or flusher.done() or flusher.get_loop() is not asyncio.get_running_loop():
+            return
+        await self._write_queue.join()
+        flusher.cancel()
+        try:
+            await flusher
+        except asyncio.CancelledError:
+            pass
+
+    def _observe_query(self, query: str, params: Union[tuple, Mapping[str, Any]],
+                       duration: float, rows: int):
+        """Учитывает выполненный запрос и логирует его, если он медленный"""
+        entry = self.query_metrics.record(query, duration, rows, params)
+        if entry is None:
+            return
+        logger.warning(f"🐢 Медленный запрос ({entry['duration_ms']} мс, строк: {rows}): {entry['sql']}")
+        if self.query_metrics.explain_slow and is_read_query(query):
+            # План собираем в фоне, чтобы не задерживать и без того медленный вызов
+            task = asyncio.create_task(self._capture_query_plan(entry, query, params))
+            self._plan_tasks.add(task)
+            task.add_done_callback(self._plan_tasks.discard)
+
+    async def _cancel_plan_tasks(self):
+        """Отменяет незавершенные задачи сбора планов (перед закрытием соединений)"""
+        tasks = [task for task in self._plan_tasks
+                 if not task.done() and task.get_loop() is asyncio.get_running_loop()]
+        self._plan_tasks = set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _capture_query_plan(self, entry: Dict[str, Any], query: str,
+                                  params: Union[tuple, Mapping[str, Any]]):
+        """Сохраняет EXPLAIN QUERY PLAN медленного запроса в запись журнала"""
+        try:
+            async with self._read_connection() as conn:
+                cursor = await conn.execute(f"EXPLAIN QUERY PLAN {query}", params)
+                try:
+                    rows = await cursor.fetchall()
+                finally:
+                    await cursor.close()
+            entry['plan'] = [row['detail'] for row in rows]
+        except Exception as e:
+            logger.debug(f"Не удалось получить план запроса: {e}")
+
+    def get_query_stats(self, limit: Optional[int] = None, order_by: str = 'total_ms') -> List[Dict[str, Any]]:
+        """
+        Статистика задержек по нормализованным запросам
+
+        Args:
+            limit: Максимальное количество записей (самые тяжелые первыми)
+            order_by: Поле сортировки (total_ms, avg_ms, max_ms, p95_ms, count, rows)
+        """
+        return self.query_metrics.get_stats(limit=limit, order_by=order_by)
+
+    def get_slow_queries(self) -> List[Dict[str, Any]]:
+        """Журнал медленных запросов (с планом выполнения, если он собран)"""
+        return self.query_metrics.get_slow_queries()
+
+    def _reset_stats(self):
+        """Сбрасывает счетчики пула"""
+        self._stats = {
+            'reads': 0,
+            'writes': 0,
+            'acquires': 0,
+            'acquire_timeouts': 0,
+            'acquire_wait_total': 0.0,
+            'acquire_wait_max': 0.0,
+            'write_batches': 0,
+            'queued_writes': 0,
+            'largest_write_batch': 0,
+            'transactions': 0,
+            'rollbacks': 0,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики пула соединений
+
+        Returns:
+            Dict с размером пула, числом свободных читателей, количеством
+            чтений/записей, временем ожидания читателя (в мс) и статистикой
+            групповой фиксации
+        """
+        stats = dict(self._stats) if self._stats else {}
+        acquires = stats.get('acquires', 0)
+        wait_total = stats.pop('acquire_wait_total', 0.0)
+        wait_max = stats.pop('acquire_wait_max', 0.0)
+        stats['read_pool_size'] = len(self._readers)
+        stats['idle_readers'] = self._idle_readers.qsize() if self._idle_readers else 0
+        stats['acquire_wait_avg_ms'] = round(wait_total / acquires * 1000, 3) if acquires else 0.0
+        stats['acquire_wait_max_ms'] = round(wait_max * 1000, 3)
+        return stats
 
 # Глобальный экземпляр пула
 db_pool = DatabasePool()
-
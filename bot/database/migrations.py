@@ -0,0 +1,285 @@
+"""
+Версионные миграции схемы БД
+
+Версия схемы хранится в PRAGMA user_version. Миграции регистрируются
+декоратором @migration в строгом порядке версий; при запуске run_migrations()
+читает user_version и, если база отстает, применяет недостающие миграции
+одной транзакцией вместе с обновлением версии. Актуальная база стартует
+с одного чтения, без PRAGMA table_info и CREATE ... IF NOT EXISTS.
+
+Миграции 1-8 повторяют прежнюю инициализацию init_db() и проверяют наличие
+колонок, поэтому безопасно применяются к базам, созданным до появления
+версий (user_version = 0).
+"""
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, List, NamedTuple, Set
+
+import aiosqlite
+
+from bot.database.models import ALL_TABLES
+from bot.utils.reminders import next_reminder_at, format_reminder_at
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    """Шаг миграции схемы"""
+    version: int
+    description: str
+    apply: Callable[[aiosqlite.Connection], Awaitable[None]]
+
+
+# Реестр миграций в порядке версий
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Регистрирует функцию как миграцию с указанной версией"""
+    def decorator(func: Callable[[aiosqlite.Connection], Awaitable[None]]):
+        expected = len(MIGRATIONS) + 1
+        if version != expected:
+            raise ValueError(f"Миграция {func.__name__}: ожидалась версия {expected}, получена {version}")
+        MIGRATIONS.append(Migration(version, description, func))
+        return func
+    return decorator
+
+
+def latest_version() -> int:
+    """Версия схемы после применения всех миграций"""
+    return len(MIGRATIONS)
+
+
+async def _get_columns(db: aiosqlite.Connection, table: str) -> Set[str]:
+    """Имена колонок таблицы"""
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    try:
+        return {col[1] for col in await cursor.fetchall()}  # col[1] - имя колонки
+    finally:
+        await cursor.close()
+
+
+async def _add_missing_columns(db: aiosqlite.Connection, table: str, columns: List[tuple]):
+    """Добавляет отсутствующие колонки: columns - список (имя, определение)"""
+    existing = await _get_columns(db, table)
+    for name, definition in columns:
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            logger.info(f"✅ Добавлена колонка {name} в таблицу {table}")
+
+
+# ============================================================================
+# МИГРАЦИИ
+# ============================================================================
+
+@migration(1, "Базовые таблицы и индексы")
+async def _create_base_schema(db: aiosqlite.Connection):
+    for table_sql in ALL_TABLES:
+        await db.execute(table_sql)
+
+    # Индекс для быстрого поиска пользователей
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id)")
+    # Индекс для быстрого поиска админов
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_admins_telegram_id ON admins(telegram_id)")
+    # Индекс для фильтрации доступных автомобилей
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_cars_available ON cars(available)")
+    # Индекс для сортировки по дате создания
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_cars_created_at ON cars(created_at DESC)")
+    # Индексы для аренды
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_rentals_user_id ON rentals(user_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_rentals_car_id ON rentals(car_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_rentals_is_active ON rentals(is_active)")
+
+
+@migration(2, "Изображения автомобилей")
+async def _add_car_images(db: aiosqlite.Connection):
+    await _add_missing_columns(db, 'cars', [
+        ('image_1', 'TEXT'),
+        ('image_2', 'TEXT'),
+        ('image_3', 'TEXT'),
+    ])
+
+
+@migration(3, "Тип напоминания и дата последнего напоминания в арендах")
+async def _add_rental_reminder_type(db: aiosqlite.Connection):
+    await _add_missing_columns(db, 'rentals', [
+        ('reminder_type', "TEXT DEFAULT 'daily'"),
+        ('last_reminder_date', 'DATE'),
+    ])
+    await db.execute("UPDATE rentals SET reminder_type = 'daily' WHERE reminder_type IS NULL")
+
+
+@migration(4, "Депозиты, дата окончания и реферальная скидка в арендах (Модули 4, 6)")
+async def _add_rental_deposits(db: aiosqlite.Connection):
+    await _add_missing_columns(db, 'rentals', [
+        ('deposit_amount', 'DECIMAL(10, 2) DEFAULT 0'),
+        ('deposit_status', "TEXT DEFAULT 'pending'"),
+        ('end_date', 'DATE'),
+        ('referral_discount_percentage', 'INTEGER DEFAULT 0'),
+    ])
+    await db.execute("UPDATE rentals SET deposit_status = 'pending' WHERE deposit_status IS NULL")
+
+
+@migration(5, "Реферальная система пользователей (Модуль 6)")
+async def _add_user_referrals(db: aiosqlite.Connection):
+    # SQLite не поддерживает добавление UNIQUE колонки напрямую:
+    # сначала добавляем колонку, затем создаем уникальный индекс
+    await _add_missing_columns(db, 'users', [
+        ('referral_code', 'TEXT'),
+        ('referrer_id', 'INTEGER'),
+    ])
+    await db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_referral_code ON users(referral_code)")
+
+
+@migration(6, "Источник перехода пользователя (Модуль 7)")
+async def _add_user_source(db: aiosqlite.Connection):
+    await _add_missing_columns(db, 'users', [('source', 'TEXT')])
+
+
+@migration(7, "Журнал рассылок")
+async def _create_broadcast_logs(db: aiosqlite.Connection):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER NOT NULL,
+            content_type TEXT NOT NULL,
+            text TEXT,
+            total_users INTEGER NOT NULL,
+            sent_count INTEGER NOT NULL,
+            failed_count INTEGER NOT NULL,
+            blocked_count INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Индекс для быстрого поиска по дате
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_broadcast_logs_created_at
+        ON broadcast_logs(created_at DESC)
+    """)
+
+
+@migration(8, "Контакт для бронирования и настройки реферальной системы по умолчанию")
+async def _insert_default_settings(db: aiosqlite.Connection):
+    await db.execute(
+        """INSERT OR IGNORE INTO contacts (contact_type, name, phone, telegram_username)
+           VALUES (?, ?, ?, ?)""",
+        ('booking', 'Денис', '+7 919 634-90-91', 'olimp_auto')
+    )
+    await db.executemany(
+        "INSERT OR IGNORE INTO settings (setting_key, setting_value) VALUES (?, ?)",
+        [
+            ('referral_system_enabled', 'false'),
+            ('referral_bonus_percentage', '10'),
+            ('referral_bonus_duration_days', '30'),
+        ]
+    )
+
+
+@migration(9, "Составные и частичные индексы под запросы планировщика, аренд и рефералов")
+async def _create_query_indexes(db: aiosqlite.Connection):
+    # Ежеминутная выборка планировщика: is_active = 1 AND reminder_time = ? ORDER BY created_at DESC
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_rentals_active_reminder_time
+        ON rentals(reminder_time, created_at DESC) WHERE is_active = 1
+    """)
+    # Активная аренда пользователя: user_id = ? AND is_active = 1 ORDER BY created_at DESC.
+    # Покрывает и прежний idx_rentals_user_id (тот же префикс)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_rentals_user_active_created
+        ON rentals(user_id, is_active, created_at DESC)
+    """)
+    await db.execute("DROP INDEX IF EXISTS idx_rentals_user_id")
+    # Аренды с реферальной скидкой: частичный покрывающий индекс для проверки
+    # права на бонус и статистики (user_id, daily_price читаются из индекса)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_rentals_referral_discount
+        ON rentals(user_id, referral_discount_percentage, daily_price)
+        WHERE referral_discount_percentage > 0
+    """)
+    # Статистика по источникам: GROUP BY source читается из индекса
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_source ON users(source)")
+    # Напоминания об обслуживании: у большинства записей reminder_date пустая
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_car_maintenance_reminder_date
+        ON car_maintenance(reminder_date) WHERE reminder_date IS NOT NULL
+    """)
+
+
+@migration(10, "Ближайшее напоминание аренды (next_reminder_at) с индексом и заполнением")
+async def _add_rental_next_reminder(db: aiosqlite.Connection):
+    await _add_missing_columns(db, 'rentals', [('next_reminder_at', 'TEXT')])
+    # Планировщик при запуске строит очередь по этой колонке активных аренд:
+    # is_active = 1 читается из индекса без обращения к таблице
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_rentals_active_next_reminder
+        ON rentals(is_active, next_reminder_at)
+    """)
+    # Покрывает и прежний idx_rentals_is_active (тот же префикс)
+    await db.execute("DROP INDEX IF EXISTS idx_rentals_is_active")
+
+    # Заполняем по тем же правилам, что и функции изменения аренд
+    after = datetime.now().replace(second=0, microsecond=0)
+    cursor = await db.execute(
+        """SELECT id, reminder_time, reminder_type, start_date, last_reminder_date
+           FROM rentals WHERE is_active = 1"""
+    )
+    try:
+        columns = [column[0] for column in cursor.description]
+        rentals = [dict(zip(columns, row)) for row in await cursor.fetchall()]
+    finally:
+        await cursor.close()
+    await db.executemany(
+        "UPDATE rentals SET next_reminder_at = ? WHERE id = ?",
+        [(format_reminder_at(next_reminder_at(rental, after)), rental['id']) for rental in rentals]
+    )
+
+
+@migration(11, "Удаление индекса прежней выборки планировщика по reminder_time")
+async def _drop_reminder_time_index(db: aiosqlite.Connection):
+    # Планировщик читает аренды по ID (первичный ключ) и next_reminder_at
+    # (idx_rentals_active_next_reminder); по reminder_time аренды больше не выбираются
+    await db.execute("DROP INDEX IF EXISTS idx_rentals_active_reminder_time")
+
+
+# ============================================================================
+# ЗАПУСК
+# ============================================================================
+
+async def get_schema_version(pool) -> int:
+    """Текущая версия схемы базы (PRAGMA user_version)"""
+    row = await pool.execute_fetchone("PRAGMA user_version")
+    return row['user_version'] if row else 0
+
+
+async def run_migrations(pool) -> int:
+    """
+    Применяет недостающие миграции
+
+    Все миграции и новая версия схемы фиксируются одной транзакцией:
+    при ошибке база остается в исходной версии.
+
+    Args:
+        pool: Пул соединений (DatabasePool)
+
+    Returns:
+        int: Количество примененных миграций (0 - схема актуальна)
+    """
+    current = await get_schema_version(pool)
+    target = latest_version()
+
+    if current >= target:
+        if current > target:
+            logger.warning(f"⚠️ Версия схемы БД ({current}) новее версии кода ({target})")
+        return 0
+
+    pending = MIGRATIONS[current:]
+    async with pool.transaction():
+        db = await pool.get_connection()
+        for step in pending:
+            logger.info(f"🔄 Миграция {step.version}: {step.description}")
+            await step.apply(db)
+        # PRAGMA нельзя параметризовать; target - целое число из реестра
+        await db.execute(f"PRAGMA user_version = {target}")
+
+    logger.info(f"✅ Схема БД обновлена с версии {current} до {target}")
+    return len(pending)
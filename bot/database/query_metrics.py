@@ -0,0 +1,159 @@
+"""
+Инструментирование SQL-запросов: гистограммы задержек и журнал медленных запросов
+
+Запросы группируются по нормализованному тексту (литералы и списки
+параметров заменены на ?), поэтому все вызовы одной функции database.py
+попадают в одну запись независимо от аргументов.
+"""
+import re
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, Tuple, Deque, Union, Mapping
+from bot.utils.constants import (
+    DB_SLOW_QUERY_THRESHOLD_MS, DB_SLOW_QUERY_LOG_SIZE, DB_EXPLAIN_SLOW_QUERIES
+)
+
+# Верхние границы интервалов гистограммы задержек (в миллисекундах)
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query: str) -> str:
+    """Приводит запрос к каноническому виду для группировки статистики"""
+    normalized = _WHITESPACE_RE.sub(" ", query).strip()
+    normalized = _STRING_LITERAL_RE.sub("?", normalized)
+    normalized = _NUMBER_LITERAL_RE.sub("?", normalized)
+    return _PLACEHOLDER_LIST_RE.sub("(?)", normalized)
+
+
+class QueryStats:
+    """Накопленная статистика одного нормализованного запроса"""
+
+    __slots__ = ('sql', 'count', 'total_ms', 'max_ms', 'rows', 'buckets')
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        # Последний элемент - запросы дольше самой большой границы
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, duration_ms: float, rows: int):
+        """Учитывает одно выполнение запроса"""
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.rows += rows
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration_ms <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Оценка перцентиля по гистограмме (верхняя граница интервала, в мс)"""
+        if not self.count:
+            return 0.0
+        threshold = fraction * self.count
+        seen = 0
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            seen += self.buckets[index]
+            if seen >= threshold:
+                return float(bound)
+        return round(self.max_ms, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Представление для админ-команды или экспортера метрик"""
+        return {
+            'sql': self.sql,
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'rows': self.rows,
+            'avg_rows': round(self.rows / self.count, 2) if self.count else 0.0,
+            'histogram': {
+                **{f"le_{bound:g}ms": self.buckets[index] for index, bound in enumerate(LATENCY_BUCKETS_MS)},
+                'inf': self.buckets[-1],
+            },
+        }
+
+
+class QueryMetrics:
+    """Реестр статистики запросов пула соединений"""
+
+    def __init__(self, slow_threshold_ms: float = DB_SLOW_QUERY_THRESHOLD_MS,
+                 slow_log_size: int = DB_SLOW_QUERY_LOG_SIZE,
+                 explain_slow: bool = DB_EXPLAIN_SLOW_QUERIES):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.explain_slow = explain_slow
+        self._stats: Dict[str, QueryStats] = {}
+        self._slow_log: Deque[Dict[str, Any]] = deque(maxlen=slow_log_size)
+
+    def record(self, query: str, duration: float, rows: int,
+               params: Union[tuple, Mapping[str, Any]] = ()) -> Optional[Dict[str, Any]]:
+        """
+        Учитывает выполнение запроса
+
+        Args:
+            query: Текст запроса
+            duration: Длительность в секундах
+            rows: Количество возвращенных или измененных строк
+            params: Параметры запроса (сохраняются только для медленных)
+
+        Returns:
+            Запись журнала медленных запросов или None, если запрос быстрый
+        """
+        sql = normalize_sql(query)
+        duration_ms = duration * 1000
+        stats = self._stats.get(sql)
+        if stats is None:
+            stats = self._stats[sql] = QueryStats(sql)
+        stats.observe(duration_ms, rows)
+
+        if duration_ms < self.slow_threshold_ms:
+            return None
+
+        entry = {
+            'sql': sql,
+            'params': repr(params)[:200],
+            'duration_ms': round(duration_ms, 3),
+            'rows': rows,
+            'at': time.time(),
+            'plan': None,
+        }
+        self._slow_log.append(entry)
+        return entry
+
+    def get_stats(self, limit: Optional[int] = None, order_by: str = 'total_ms') -> List[Dict[str, Any]]:
+        """
+        Статистика по запросам, отсортированная по убыванию выбранного поля
+
+        Args:
+            limit: Максимальное количество записей
+            order_by: Поле сортировки (total_ms, avg_ms, max_ms, count, rows, ...)
+        """
+        result = [stats.to_dict() for stats in self._stats.values()]
+        result.sort(key=lambda item: item.get(order_by, 0), reverse=True)
+        return result[:limit] if limit else result
+
+    def get_slow_queries(self) -> List[Dict[str, Any]]:
+        """Журнал медленных запросов, начиная с самого свежего"""
+        return list(reversed(self._slow_log))
+
+    def reset(self):
+        """Сбрасывает накопленную статистику"""
+        self._stats.clear()
+        self._slow_log.clear()
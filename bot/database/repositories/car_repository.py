@@ -1,8 +1,9 @@
 """
 Repository для работы с автомобилями
 """
-from typing import List, Optional, Dict, Any
+from typing import Any, Mapping, Optional, Sequence
 from bot.database.db_pool import db_pool
+from bot.database.car_catalog import car_catalog
 from bot.utils.cache import cache
 import logging
 
@@ -12,41 +13,18 @@ logger = logging.getLogger(__name__)
 class CarRepository:
     """Repository для работы с автомобилями"""
     
-    async def get_all(self, available_only: bool = False) -> List[Dict[str, Any]]:
-        """Получает все автомобили"""
+    async def get_all(self, available_only: bool = False) -> Sequence[Mapping[str, Any]]:
+        """Получает все автомобили (от новых к старым) из каталога в памяти"""
         try:
-            cache_key = f"cars:all:{available_only}"
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            query = "SELECT * FROM cars"
-            params = ()
-            if available_only:
-                query += " WHERE available = 1"
-            query += " ORDER BY created_at DESC"
-            
-            result = await db_pool.execute_fetchall(query, params)
-            # Кэшируем на 60 секунд
-            cache.set(cache_key, result, ttl=60)
-            return result
+            return await car_catalog.get_all(available_only)
         except Exception as e:
             logger.error(f"Ошибка при получении автомобилей: {e}")
             return []
     
-    async def get_by_id(self, car_id: int) -> Optional[Dict[str, Any]]:
-        """Получает автомобиль по ID"""
+    async def get_by_id(self, car_id: int) -> Optional[Mapping[str, Any]]:
+        """Получает автомобиль по ID из каталога в памяти"""
         try:
-            cache_key = f"car:{car_id}"
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            result = await db_pool.execute_fetchone("SELECT * FROM cars WHERE id = ?", (car_id,))
-            if result:
-                # Кэшируем на 120 секунд
-                cache.set(cache_key, result, ttl=120)
-            return result
+            return await car_catalog.get(car_id)
         except Exception as e:
             logger.error(f"Ошибка при получении автомобиля: {e}")
             return None
@@ -63,18 +41,16 @@ class CarRepository:
     ) -> Optional[int]:
         """Создает новый автомобиль"""
         try:
-            cursor = await db_pool.execute(
+            car = await db_pool.write_returning(
                 """INSERT INTO cars (name, description, daily_price, available, image_1, image_2, image_3) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                   VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING *""",
                 (name, description, daily_price, available, image_1, image_2, image_3)
             )
-            await db_pool.commit()
             
-            # Очищаем кэш
-            cache.delete("cars:all:True")
-            cache.delete("cars:all:False")
+            # Сквозная запись в каталог
+            car_catalog.put(car)
             
-            return cursor.lastrowid
+            return car['id']
         except Exception as e:
             logger.error(f"Ошибка при создании автомобиля: {e}")
             return None
@@ -121,15 +97,13 @@ class CarRepository:
                 return True
             
             params.append(car_id)
-            query = f"UPDATE cars SET {', '.join(updates)} WHERE id = ?"
+            query = f"UPDATE cars SET {', '.join(updates)} WHERE id = ? RETURNING *"
             
-            await db_pool.execute(query, tuple(params))
-            await db_pool.commit()
+            car = await db_pool.write_returning(query, tuple(params))
             
-            # Очищаем кэш
-            cache.delete(f"car:{car_id}")
-            cache.delete("cars:all:True")
-            cache.delete("cars:all:False")
+            # Сквозная запись в каталог
+            if car:
+                car_catalog.put(car)
             
             return True
         except Exception as e:
@@ -137,7 +111,7 @@ class CarRepository:
             return False
     
     async def delete(self, car_id: int) -> bool:
-        """Удаляет автомобиль"""
+        """Удаляет автомобиль вместе с его завершенными арендами (одной транзакцией)"""
         try:
             # Проверяем, существует ли автомобиль
             car = await self.get_by_id(car_id)
@@ -145,43 +119,39 @@ class CarRepository:
                 logger.warning(f"Попытка удалить несуществующий автомобиль с ID: {car_id}")
                 return False
             
-            # Проверяем, есть ли активные аренды
-            active_rentals = await db_pool.execute_fetchall(
-                "SELECT id FROM rentals WHERE car_id = ? AND is_active = 1",
-                (car_id,)
-            )
-            
-            if active_rentals:
-                logger.warning(f"Нельзя удалить автомобиль с ID {car_id}: есть {len(active_rentals)} активных аренд")
-                return False
-            
-            # Удаляем все аренды этого автомобиля
-            rentals_to_delete = await db_pool.execute_fetchall(
-                "SELECT id, user_id FROM rentals WHERE car_id = ?",
-                (car_id,)
-            )
+            async with db_pool.transaction():
+                # Проверяем, есть ли активные аренды
+                active_rentals = await db_pool.execute_fetchall(
+                    "SELECT id FROM rentals WHERE car_id = ? AND is_active = 1",
+                    (car_id,)
+                )
+                
+                if active_rentals:
+                    logger.warning(f"Нельзя удалить автомобиль с ID {car_id}: есть {len(active_rentals)} активных аренд")
+                    return False
+                
+                # Удаляем все аренды этого автомобиля
+                rentals_to_delete = await db_pool.execute_fetchall(
+                    "SELECT id, user_id FROM rentals WHERE car_id = ?",
+                    (car_id,)
+                )
+                
+                if rentals_to_delete:
+                    await db_pool.execute("DELETE FROM rentals WHERE car_id = ?", (car_id,))
+                
+                # Удаляем автомобиль
+                cursor = await db_pool.execute("DELETE FROM cars WHERE id = ?", (car_id,))
+                
+                if cursor.rowcount == 0:
+                    logger.warning(f"Автомобиль с ID {car_id} не был удален")
+                    return False
             
             if rentals_to_delete:
-                # Очищаем кэш для пользователей
-                for rental in rentals_to_delete:
-                    cache.delete(f"rental:user:{rental['user_id']}")
-                
-                await db_pool.execute("DELETE FROM rentals WHERE car_id = ?", (car_id,))
                 logger.info(f"Удалено {len(rentals_to_delete)} аренд для автомобиля с ID {car_id}")
             
-            # Удаляем автомобиль
-            cursor = await db_pool.execute("DELETE FROM cars WHERE id = ?", (car_id,))
-            await db_pool.commit()
-            
-            if cursor.rowcount == 0:
-                logger.warning(f"Автомобиль с ID {car_id} не был удален")
-                return False
-            
-            # Очищаем кэш
-            cache.delete(f"car:{car_id}")
-            cache.delete("cars:all:True")
-            cache.delete("cars:all:False")
-            cache.delete("rentals:active")
+            # Убираем автомобиль из каталога и очищаем кэш аренд
+            car_catalog.remove(car_id)
+            cache.invalidate('rentals')
             
             logger.info(f"Автомобиль с ID {car_id} успешно удален")
             return True
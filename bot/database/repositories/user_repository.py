@@ -19,11 +19,10 @@ class UserRepository:
     ) -> bool:
         """Создает нового пользователя"""
         try:
-            await db_pool.execute(
+            await db_pool.write(
                 "INSERT OR IGNORE INTO users (telegram_id, username, first_name) VALUES (?, ?, ?)",
                 (telegram_id, username, first_name)
             )
-            await db_pool.commit()
             return True
         except Exception as e:
             logger.error(f"Ошибка при создании пользователя: {e}")
@@ -0,0 +1,78 @@
+"""
+Компактное представление строк результата для горячих запросов
+
+Обычная выборка превращает каждую строку в отдельный dict со своей
+хеш-таблицей. CompactRow хранит только кортеж значений и ссылку на общий
+для всего результата индекс колонок, поэтому список из сотен автомобилей
+или аренд занимает в разы меньше памяти и создается быстрее. Доступ
+row['name'], row.get('name'), `in`, итерация по ключам и сравнение
+со словарем работают так же, как у dict.
+"""
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+
+@lru_cache(maxsize=256)
+def _column_index(columns: Tuple[str, ...]) -> Dict[str, int]:
+    """Индекс "имя колонки -> позиция", общий для всех строк одного запроса"""
+    return {name: position for position, name in enumerate(columns)}
+
+
+class CompactRow(Mapping):
+    """Неизменяемая строка результата на основе кортежа"""
+
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index: Dict[str, int], values: tuple):
+        self._index = index
+        self._values = values
+
+    @classmethod
+    def from_rows(cls, description: Sequence[tuple], rows: Iterable[Sequence[Any]]) -> List['CompactRow']:
+        """
+        Создает строки из результата курсора
+
+        Args:
+            description: cursor.description выполненного запроса
+            rows: Строки курсора (aiosqlite.Row или кортежи)
+        """
+        index = _column_index(tuple(column[0] for column in description))
+        return [cls(index, tuple(row)) for row in rows]
+
+    @classmethod
+    def from_mapping(cls, row: Mapping) -> 'CompactRow':
+        """Создает строку из словаря (например, результата write_returning)"""
+        return cls(_column_index(tuple(row)), tuple(row.values()))
+
+    def __getitem__(self, key: str) -> Any:
+        return self._values[self._index[key]]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        position = self._index.get(key)
+        return default if position is None else self._values[position]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getstate__(self) -> Tuple[Tuple[str, ...], tuple]:
+        return tuple(self._index), self._values
+
+    def __setstate__(self, state: Tuple[Tuple[str, ...], tuple]):
+        columns, values = state
+        self._index = _column_index(columns)
+        self._values = values
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Обычный изменяемый словарь с теми же данными"""
+        return dict(zip(self._index, self._values))
+
+    def __repr__(self) -> str:
+        return f"CompactRow({self.to_dict()!r})"
+
@@ -3,7 +3,7 @@
 """
 import logging
 from aiogram.types import Message, CallbackQuery
-from bot.database.database import get_all_cars, get_all_users, get_all_active_rentals
+from bot.database.database import get_all_cars, get_users_count, get_all_active_rentals
 from bot.keyboards.admin_keyboards import get_admin_panel_keyboard
 from bot.utils.helpers import safe_callback_answer
 from .common import admin_required
@@ -16,7 +16,7 @@ async def handle_admin_panel_button(message: Message):
     """Обработчик кнопки 'Админ панель'"""
     # Получаем быструю статистику
     cars = await get_all_cars()
-    users = await get_all_users()
+    users_count = await get_users_count()
     rentals = await get_all_active_rentals()
     
     available_cars = sum(1 for car in cars if car['available'])
@@ -25,7 +25,7 @@ async def handle_admin_panel_button(message: Message):
 
 📊 <b>Быстрая статистика:</b>
 🚗 Автомобилей: <b>{len(cars)}</b> (доступно: {available_cars})
-👥 Пользователей: <b>{len(users)}</b>
+👥 Пользователей: <b>{users_count}</b>
 📝 Активных аренд: <b>{len(rentals)}</b>
 
 📋 <b>Доступные функции:</b>
@@ -56,7 +56,7 @@ async def handle_admin_panel_callback(callback: CallbackQuery):
     
     # Получаем быструю статистику
     cars = await get_all_cars()
-    users = await get_all_users()
+    users_count = await get_users_count()
     rentals = await get_all_active_rentals()
     
     available_cars = sum(1 for car in cars if car['available'])
@@ -68,7 +68,7 @@ async def handle_admin_panel_callback(callback: CallbackQuery):
 ━━━━━━━━━━━━━━━━━━━━━━
 
 🚗 Автомобилей: <b>{len(cars)}</b> (доступно: {available_cars})
-👥 Пользователей: <b>{len(users)}</b>
+👥 Пользователей: <b>{users_count}</b>
 📝 Активных аренд: <b>{len(rentals)}</b>
 
 ━━━━━━━━━━━━━━━━━━━━━━
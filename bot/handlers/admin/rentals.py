@@ -6,7 +6,7 @@ import asyncio
 import logging
 import re
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
@@ -557,10 +557,11 @@ async def handle_admin_rental_deposit_amount_input(message: Message, state: FSMC
 
 @admin_required
 @error_handler
-async def handle_admin_rental_details_callback(callback: CallbackQuery) -> None:
-    """Детальная информация об аренде"""
+async def handle_admin_rental_details_callback(callback: CallbackQuery, rental: Optional[Dict[str, Any]] = None) -> None:
+    """Детальная информация об аренде (rental - уже полученная запись, чтобы не читать ее повторно)"""
     rental_id = int(callback.data.split(':')[1])
-    rental = await get_rental_by_id(rental_id)
+    if rental is None:
+        rental = await get_rental_by_id(rental_id)
     
     if not rental:
         raise NotFoundError(f"Аренда с ID {rental_id} не найдена")
@@ -697,9 +698,9 @@ async def handle_admin_rental_reminder_time_update(message: Message, state: FSMC
     data = await state.get_data()
     rental_id = data.get('rental_id')
     
-    success = await update_rental_reminder_time(rental_id, reminder_time)
+    rental = await update_rental_reminder_time(rental_id, reminder_time)
     
-    if success:
+    if rental:
         # Удаляем сообщение пользователя
         try:
             await message.delete()
@@ -731,7 +732,7 @@ async def handle_admin_rental_reminder_time_update(message: Message, state: FSMC
                 pass
         
         fake_callback = FakeCallback(rental_id, message, message.from_user)
-        await handle_admin_rental_details_callback(fake_callback)
+        await handle_admin_rental_details_callback(fake_callback, rental=rental)
     else:
         await message.answer("❌ Ошибка при обновлении времени напоминания")
         await state.clear()
@@ -803,9 +804,9 @@ async def handle_admin_rental_end_date_update(message: Message, state: FSMContex
     data = await state.get_data()
     rental_id = data.get('rental_id')
     
-    success = await update_rental_end_date(rental_id, end_date)
+    rental = await update_rental_end_date(rental_id, end_date)
     
-    if success:
+    if rental:
         # Удаляем сообщение пользователя
         try:
             await message.delete()
@@ -837,7 +838,7 @@ async def handle_admin_rental_end_date_update(message: Message, state: FSMContex
                 pass
         
         fake_callback = FakeCallback(rental_id, message, message.from_user)
-        await handle_admin_rental_details_callback(fake_callback)
+        await handle_admin_rental_details_callback(fake_callback, rental=rental)
     else:
         await message.answer("❌ Ошибка при обновлении даты окончания аренды")
         await state.clear()
@@ -880,17 +881,12 @@ async def handle_admin_end_rental_callback(callback: CallbackQuery) -> None:
 async def handle_admin_confirm_end_rental_callback(callback: CallbackQuery) -> None:
     """Окончательное завершение аренды"""
     rental_id = int(callback.data.split(':')[1])
-    rental = await get_rental_by_id(rental_id)
-    
-    if not rental:
-        raise NotFoundError(f"Аренда с ID {rental_id} не найдена")
+    rental = await end_rental(rental_id)
     
-    user_id = rental['user_id']
-    car_name = rental.get('car_name', 'Неизвестный автомобиль')
-    
-    success = await end_rental(rental_id)
-    
-    if success:
+    if rental:
+        user_id = rental['user_id']
+        car_name = rental.get('car_name') or 'Неизвестный автомобиль'
+        
         # Отправляем уведомление пользователю
         try:
             # Используем bot из контекста callback вместо создания нового экземпляра
@@ -1018,9 +1014,9 @@ async def handle_deposit_status_change_callback(callback: CallbackQuery) -> None
         return
     
     # Обновляем статус
-    success = await update_rental_deposit_status(rental_id, new_status)
+    rental = await update_rental_deposit_status(rental_id, new_status)
     
-    if success:
+    if rental:
         await safe_callback_answer(callback, f"✅ Залог {status_text}!", show_alert=False)
         
         # Возвращаемся к информации об аренде
@@ -1034,7 +1030,7 @@ async def handle_deposit_status_change_callback(callback: CallbackQuery) -> None
                 pass
         
         fake_callback = FakeCallback(rental_id, callback.message, callback.from_user)
-        await handle_admin_rental_details_callback(fake_callback)
+        await handle_admin_rental_details_callback(fake_callback, rental=rental)
     else:
         await safe_callback_answer(callback, "❌ Ошибка при обновлении статуса залога", show_alert=True)
 
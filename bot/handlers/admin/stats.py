@@ -3,7 +3,7 @@
 """
 import logging
 from aiogram.types import CallbackQuery
-from bot.database.database import get_all_cars, get_all_users, get_all_admins, get_users_by_source, get_referral_stats
+from bot.database.database import get_all_cars, get_users_count, get_all_admins, get_users_by_source, get_referral_stats
 from bot.keyboards.admin_keyboards import get_admin_stats_keyboard
 from bot.utils.helpers import safe_callback_answer
 from .common import admin_required
@@ -15,7 +15,7 @@ logger = logging.getLogger(__name__)
 async def handle_admin_stats_callback(callback: CallbackQuery):
     """Обработчик статистики"""
     cars = await get_all_cars()
-    users = await get_all_users()
+    users_count = await get_users_count()
     admins = await get_all_admins()
     
     available_cars = sum(1 for car in cars if car['available'])
@@ -59,7 +59,7 @@ async def handle_admin_stats_callback(callback: CallbackQuery):
 👥 <b>ПОЛЬЗОВАТЕЛИ</b>
 ━━━━━━━━━━━━━━━━━━━━━━
 
-👥 Всего пользователей: <b>{len(users)}</b>
+👥 Всего пользователей: <b>{users_count}</b>
 🔧 Администраторов: <b>{len(admins)}</b>
 
 {source_stats_text}━━━━━━━━━━━━━━━━━━━━━━
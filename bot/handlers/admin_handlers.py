@@ -10,7 +10,7 @@ from datetime import datetime
 logger = logging.getLogger(__name__)
 from bot.database.database import (
     is_admin, get_all_cars, get_car_by_id, add_car, update_car, delete_car,
-    get_all_users, get_all_admins, add_admin, delete_admin,
+    get_users_count, get_all_admins, add_admin, delete_admin,
     add_rental, get_all_active_rentals, end_rental, update_rental_reminder_time,
     get_rental_by_id, get_active_rental_by_user, get_contact, update_contact
 )
@@ -82,11 +82,11 @@ def admin_required(func):
 @admin_required
 async def handle_admin_panel_button(message: Message):
     """Обработчик кнопки 'Админ панель'"""
-    from bot.database.database import get_all_cars, get_all_users, get_all_active_rentals
+    from bot.database.database import get_all_cars, get_users_count, get_all_active_rentals
     
     # Получаем быструю статистику
     cars = await get_all_cars()
-    users = await get_all_users()
+    users_count = await get_users_count()
     rentals = await get_all_active_rentals()
     
     available_cars = sum(1 for car in cars if car['available'])
@@ -95,7 +95,7 @@ async def handle_admin_panel_button(message: Message):
 
 📊 <b>Быстрая статистика:</b>
 🚗 Автомобилей: <b>{len(cars)}</b> (доступно: {available_cars})
-👥 Пользователей: <b>{len(users)}</b>
+👥 Пользователей: <b>{users_count}</b>
 📝 Активных аренд: <b>{len(rentals)}</b>
 
 📋 <b>Доступные функции:</b>
@@ -117,7 +117,7 @@ async def handle_admin_panel_button(message: Message):
 @admin_required
 async def handle_admin_panel_callback(callback: CallbackQuery):
     """Возврат в главную админ панель"""
-    from bot.database.database import get_all_cars, get_all_users, get_all_active_rentals
+    from bot.database.database import get_all_cars, get_users_count, get_all_active_rentals
     
     # Удаляем предыдущее сообщение для чистоты чата
     try:
@@ -127,7 +127,7 @@ async def handle_admin_panel_callback(callback: CallbackQuery):
     
     # Получаем быструю статистику
     cars = await get_all_cars()
-    users = await get_all_users()
+    users_count = await get_users_count()
     rentals = await get_all_active_rentals()
     
     available_cars = sum(1 for car in cars if car['available'])
@@ -139,7 +139,7 @@ async def handle_admin_panel_callback(callback: CallbackQuery):
 ━━━━━━━━━━━━━━━━━━━━━━
 
 🚗 Автомобилей: <b>{len(cars)}</b> (доступно: {available_cars})
-👥 Пользователей: <b>{len(users)}</b>
+👥 Пользователей: <b>{users_count}</b>
 📝 Активных аренд: <b>{len(rentals)}</b>
 
 ━━━━━━━━━━━━━━━━━━━━━━
@@ -1243,7 +1243,7 @@ async def handle_car_broadcast_no_callback(callback: CallbackQuery, state: FSMCo
 async def handle_admin_stats_callback(callback: CallbackQuery):
     """Обработчик статистики"""
     cars = await get_all_cars()
-    users = await get_all_users()
+    users_count = await get_users_count()
     admins = await get_all_admins()
     
     available_cars = sum(1 for car in cars if car['available'])
@@ -1276,7 +1276,7 @@ async def handle_admin_stats_callback(callback: CallbackQuery):
 👥 <b>ПОЛЬЗОВАТЕЛИ</b>
 ━━━━━━━━━━━━━━━━━━━━━━
 
-👥 Всего пользователей: <b>{len(users)}</b>
+👥 Всего пользователей: <b>{users_count}</b>
 🔧 Администраторов: <b>{len(admins)}</b>
 
 ━━━━━━━━━━━━━━━━━━━━━━
@@ -1799,14 +1799,13 @@ async def handle_admin_refresh_stats_callback(callback: CallbackQuery):
     
     # Получаем актуальные данные
     cars = await get_all_cars()
-    users = await get_all_users()
+    total_users = await get_users_count()
     admins = await get_all_admins()
     
     # Подсчитываем статистику
     total_cars = len(cars)
     available_cars = sum(1 for car in cars if car['available'])
     unavailable_cars = total_cars - available_cars
-    total_users = len(users)
     total_admins = len(admins)
     
     # Подсчет ценовых категорий
@@ -9,7 +9,7 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from typing import Optional
 
-from bot.database.database import is_admin, get_all_users, get_broadcast_history
+from bot.database.database import is_admin, get_users_count, get_broadcast_history
 from bot.keyboards.admin_keyboards import (
     get_broadcast_main_keyboard, get_broadcast_content_keyboard,
     get_broadcast_confirm_keyboard,
@@ -44,7 +44,7 @@ async def handle_admin_broadcast_callback(callback: CallbackQuery, state: FSMCon
     """Главное меню рассылки"""
     await state.clear()
     
-    users_count = len(await get_all_users())
+    users_count = await get_users_count()
     
     text = f"""📢 <b>Система рассылки сообщений</b>
 
@@ -257,7 +257,7 @@ async def handle_broadcast_preview_callback(callback: CallbackQuery, state: FSMC
 @admin_required
 async def handle_broadcast_send_all_callback(callback: CallbackQuery, state: FSMContext):
     """Подтверждение отправки рассылки всем"""
-    users_count = len(await get_all_users())
+    users_count = await get_users_count()
     
     text = f"""🚀 <b>Подтверждение массовой рассылки</b>
 
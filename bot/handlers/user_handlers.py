@@ -5,7 +5,8 @@ from bot.database.database import (
     get_all_cars, get_car_by_id, add_user, get_active_rental_by_user
 )
 from bot.utils.helpers import safe_callback_answer
-from datetime import timedelta, datetime
+from bot.utils.reminders import parse_reminder_at
+from datetime import datetime
 from bot.keyboards.user_keyboards import (
     get_cars_catalog_keyboard, get_car_details_keyboard, 
     get_empty_catalog_keyboard, get_main_menu
@@ -435,33 +436,11 @@ async def handle_user_profile(message: Message):
         }
         type_name = type_names.get(reminder_type, 'Каждый день')
         
-        # Вычисляем следующую дату напоминания
+        # Следующее напоминание хранится в аренде (rentals.next_reminder_at)
         next_reminder_text = ""
-        if start_date and reminder_type != 'daily':
-            try:
-                if isinstance(start_date, str):
-                    start_date_obj = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-                else:
-                    start_date_obj = start_date
-                start_date_only = start_date_obj.date()
-                current_date = datetime.now().date()
-                
-                if reminder_type == 'weekly':
-                    days_passed = (current_date - start_date_only).days
-                    next_reminder_days = 7 - (days_passed % 7)
-                    if next_reminder_days == 7:
-                        next_reminder_days = 0
-                    next_reminder_date = current_date + timedelta(days=next_reminder_days)
-                    next_reminder_text = f"\n📅 <b>Следующее напоминание:</b> {next_reminder_date.strftime('%d.%m.%Y')}"
-                elif reminder_type == 'monthly':
-                    days_passed = (current_date - start_date_only).days
-                    next_reminder_days = 30 - (days_passed % 30)
-                    if next_reminder_days == 30:
-                        next_reminder_days = 0
-                    next_reminder_date = current_date + timedelta(days=next_reminder_days)
-                    next_reminder_text = f"\n📅 <b>Следующее напоминание:</b> {next_reminder_date.strftime('%d.%m.%Y')}"
-            except (ValueError, TypeError, AttributeError):
-                pass
+        next_reminder = parse_reminder_at(rental.get('next_reminder_at'))
+        if next_reminder and reminder_type != 'daily':
+            next_reminder_text = f"\n📅 <b>Следующее напоминание:</b> {next_reminder.strftime('%d.%m.%Y')}"
         
         # Форматируем дату окончания
         end_date_formatted = 'Не указана'
@@ -9,8 +9,8 @@ from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest, TelegramAPIError
 from bot.utils.helpers import safe_callback_answer
 
-from bot.config import BOT_TOKEN
-from bot.database.database import init_db, add_sample_cars, add_user, add_admin, is_admin, get_all_admins, get_contact
+from bot.config import BOT_TOKEN, REDIS_URL, CACHE_DEBUG
+from bot.database.database import init_db, add_sample_cars, add_admin, is_admin, get_all_admins, get_contact
 from bot.database.db_pool import db_pool
 from bot.keyboards.user_keyboards import get_main_menu
 from bot.keyboards.admin_keyboards import get_admin_main_menu
@@ -126,50 +126,25 @@ dp.include_router(webapp_router)
 @dp.message(Command("start"))
 async def cmd_start(message: Message):
     """Обработчик команды /start (Модули 6, 7: поддержка рефералов и UTM)"""
-    from bot.database.database import (
-        get_user_by_referral_code, set_user_referrer, 
-        ensure_user_referral_code, update_user_source
-    )
-    
-    # Парсим параметры команды /start (реферальный код или UTM-метка)
-    referral_code = None
-    source = None
+    from bot.database.database import register_user
     
+    # Параметр команды /start: реферальный код (Модуль 6) или UTM-метка (Модуль 7)
+    start_param = None
     if message.text and len(message.text.split()) > 1:
-        # Получаем параметр после /start
-        param = message.text.split()[1]
-        
-        # Проверяем, является ли это реферальным кодом (Модуль 6)
-        referrer_user = await get_user_by_referral_code(param)
-        if referrer_user:
-            referral_code = param
-            # referrer_id будет установлен после регистрации пользователя
-        else:
-            # Это может быть UTM-метка (Модуль 7)
-            # Ограничиваем длину UTM-метки до 100 символов
-            source = param[:100] if len(param) > 100 else param
+        start_param = message.text.split()[1]
     
-    # Регистрируем пользователя в базе данных
-    is_new_user = False
+    # Регистрируем пользователя, реферера, источник и реферальный код одним запросом
     if message.from_user:
-        is_new_user = await add_user(
+        user = await register_user(
             telegram_id=message.from_user.id,
             username=message.from_user.username,
             first_name=message.from_user.first_name,
-            referral_code=None,  # Будет сгенерирован отдельно
-            source=source  # Модуль 7
+            start_param=start_param
         )
         
-        # Если это новый пользователь и есть реферальный код, устанавливаем реферера (Модуль 6)
-        if is_new_user and referral_code and referrer_user:
-            # Проверка на self-referral: пользователь не может использовать свой собственный реферальный код
-            if referrer_user['telegram_id'] != message.from_user.id:
-                await set_user_referrer(message.from_user.id, referrer_user['telegram_id'])
-            else:
-                logger.warning(f"Попытка self-referral предотвращена для пользователя {message.from_user.id}")
-        
-        # Гарантируем наличие реферального кода у пользователя (Модуль 6)
-        await ensure_user_referral_code(message.from_user.id)
+        # Проверка на self-referral: собственный код не дает реферера
+        if user and start_param and user.get('referral_code') == start_param:
+            logger.warning(f"Попытка self-referral предотвращена для пользователя {message.from_user.id}")
     
     user_name = message.from_user.first_name if message.from_user else "пользователь"
     if not user_name:
@@ -200,13 +175,11 @@ async def cmd_start(message: Message):
 👇 <i>Используйте кнопки меню для навигации</i>"""
         reply_markup = get_admin_main_menu()
     else:
-        # Получаем минимальную цену из доступных автомобилей
-        from bot.database.database import get_all_cars
-        available_cars = await get_all_cars(available_only=True)
+        # Минимальная цена доступных автомобилей (из каталога в памяти)
+        from bot.database.database import get_min_car_price
+        min_price = await get_min_car_price()
         
-        if available_cars:
-            min_price = min(car['daily_price'] for car in available_cars)
-        else:
+        if min_price is None:
             min_price = 5000  # Значение по умолчанию, если нет доступных машин
         
         from bot.utils.formatters import format_divider
@@ -1159,6 +1132,25 @@ async def load_booking_contact_from_db():
 async def main():
     """Главная функция запуска бота"""
     try:
+        # Режим отладки проверяет только значения, сохраненные после его включения
+        from bot.utils.cache import cache
+        if CACHE_DEBUG:
+            cache.debug = True
+            logger.warning("⚠️ Включен режим отладки кэша (проверка изменений значений)")
+        
+        # Общий кэш для нескольких экземпляров бота подключается до первого
+        # обращения к данным: connect_backend() очищает локальный кэш
+        if REDIS_URL:
+            from bot.utils.cache_backends import RedisBackend
+            try:
+                await cache.connect_backend(RedisBackend(REDIS_URL))
+                logger.info("✅ Подключен общий кэш (Redis)")
+            except Exception as e:
+                logger.error(f"Не удалось подключить общий кэш, используется только локальный: {e}")
+        
+        # Фоновая очистка истекших записей кэша
+        cache.start_sweeper()
+        
         # Инициализация базы данных
         await init_db()
         
@@ -1168,6 +1160,10 @@ async def main():
         # Добавление тестовых автомобилей при первом запуске
         await add_sample_cars()
         
+        # Загрузка каталога автомобилей в память
+        from bot.database.car_catalog import car_catalog
+        await car_catalog.load()
+        
         # Инициализация первого администратора
         await initialize_first_admin()
         
@@ -1192,6 +1188,11 @@ async def main():
         from bot.utils.scheduler import stop_scheduler
         await stop_scheduler()
         
+        # Останавливаем очистку кэша и отключаем общий кэш
+        from bot.utils.cache import cache
+        await cache.stop_sweeper()
+        await cache.disconnect_backend()
+        
         # Закрываем пул соединений с БД
         await db_pool.close()
         await bot.session.close()
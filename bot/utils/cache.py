@@ -1,45 +1,396 @@
 """
 Система кэширования для оптимизации производительности
+
+Кэш ограничен по количеству записей: при переполнении вытесняется давно
+не использованная запись (LRU). Истекшие записи удаляются при чтении и
+фоновой задачей start_sweeper(), поэтому ключи вида admin:{id} и
+rental:user:{id} не накапливаются в долгоживущем процессе. Время жизни
+отсчитывается по монотонным часам и не зависит от перевода системного времени.
+
+get_or_load() объединяет одновременные промахи по одному ключу: загрузка
+выполняется один раз, остальные запросы ждут ее результат. С параметром
+negative_ttl отсутствие данных тоже кэшируется (отдельной меткой с коротким
+TTL), и повторный запрос "нет аренды" не обращается к БД.
+
+Записи можно помечать тегами-пространствами (tags=('cars',)). invalidate('cars')
+за O(1) увеличивает счетчик поколения пространства: все записи, сохраненные
+с прежним поколением, перестают читаться и удаляются при очистке. Пишущим
+функциям не нужно знать все производные ключи.
+
+Статистика (попадания, промахи, записи, вытеснения, истечения, количество
+записей и примерный объем) собирается по пространствам ключей - части ключа
+до последнего двоеточия (car, cars:all, rental:user, admin) - и доступна
+через get_stats() для подбора CACHE_TTL_*.
+
+Для нескольких экземпляров бота к кэшу подключается общее хранилище
+(connect_backend, см. cache_backends): промахи L1 читаются из L2 перед
+обращением к БД, а delete() и invalidate() удаляют данные в L2 и рассылаются
+остальным экземплярам через pub/sub. Поколения тегов в L2 общие, поэтому
+запись, сохраненная до инвалидации на другом экземпляре, не читается.
+Значения в L2 сериализуются pickle: хранилище должно быть доверенным.
+
+С параметром stale_ttl get_or_load() работает в режиме stale-while-revalidate:
+истекшая запись еще stale_ttl секунд отдается сразу, а обновляется фоновой
+загрузкой. Инвалидированные записи устаревшими не отдаются никогда.
+
+Декоратор @cached кэширует результаты корутинных функций под ключами-кортежами
+(модуль.функция, args, kwargs), включая None и другие "ложные" результаты.
+
+Глобальный кэш хранит неизменяемые снимки (freeze_values): списки становятся
+кортежами, словари - CompactRow. Одно и то же значение отдается всем
+обработчикам без копирования, а попытка изменить его падает с TypeError.
+В режиме отладки (debug) кэш дополнительно сверяет отпечаток значения при
+каждом чтении и поднимает CacheMutationError, если значение изменили в обход
+заморозки (например, атрибут объекта).
 """
-from typing import Optional, Dict, Any, Tuple
-import time
+import asyncio
+import hashlib
+import json
+import logging
+import pickle
+import random
+import sys
+import uuid
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Optional, Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Set, Tuple
+from time import monotonic
 from functools import wraps
-from bot.utils.constants import DEFAULT_CACHE_TTL
+from bot.database.rows import CompactRow
+from bot.utils.cache_backends import CacheBackend
+from bot.utils.constants import (
+    DEFAULT_CACHE_TTL, CACHE_MAX_ENTRIES, CACHE_SWEEP_INTERVAL, CACHE_TTL_JITTER,
+    CACHE_BACKEND_PREFIX, CACHE_INVALIDATION_CHANNEL
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _Missing:
+    """Метка закэшированного отсутствия значения"""
+    
+    __slots__ = ()
+    
+    def __repr__(self) -> str:
+        return "<MISSING>"
+    
+    def __reduce__(self) -> str:
+        # После pickle (общее хранилище) метка остается тем же объектом
+        return "MISSING"
+
+
+# Значение записи, означающее "загрузчик вернул None"
+MISSING = _Missing()
+
+# Поколения тегов записи на момент сохранения: ((тег, поколение), ...)
+Stamp = Tuple[Tuple[str, int], ...]
+
+
+class CacheMutationError(RuntimeError):
+    """Закэшированное значение изменено после сохранения (режим отладки)"""
+
+
+def freeze(value: Any) -> Any:
+    """
+    Неизменяемый снимок значения для хранения в кэше
+    
+    Списки и кортежи становятся кортежами, множества - frozenset, словари -
+    CompactRow; вложенные значения замораживаются рекурсивно. Скаляры,
+    CompactRow и объекты остальных типов возвращаются как есть.
+    """
+    value_type = type(value)
+    if value_type is list or value_type is tuple:
+        return tuple(freeze(item) for item in value)
+    if value_type is dict:
+        return CompactRow.from_mapping({key: freeze(item) for key, item in value.items()})
+    if value_type is set:
+        return frozenset(value)
+    return value
+
+
+def _fingerprint(value: Any) -> Optional[bytes]:
+    """Отпечаток содержимого значения (None, если значение не сериализуется)"""
+    try:
+        return hashlib.blake2b(pickle.dumps(value, pickle.HIGHEST_PROTOCOL), digest_size=16).digest()
+    except Exception:
+        return None
+
+
+def key_namespace(key: Hashable) -> str:
+    """
+    Пространство ключа для статистики: car:42 -> car, cars:all:True -> cars:all
+    
+    Для ключей-кортежей @cached пространство - первый элемент (модуль.функция)
+    """
+    if isinstance(key, tuple):
+        return key[0]
+    return key.rpartition(':')[0] or key
+
+
+def approx_size(value: Any, depth: int = 3) -> int:
+    """Примерный объем значения в байтах (вложенные коллекции - до depth уровней)"""
+    size = sys.getsizeof(value)
+    if depth <= 0 or isinstance(value, (str, bytes, int, float)) or value is None:
+        return size
+    if isinstance(value, Mapping):
+        return size + sum(approx_size(item, depth - 1) for item in value.values())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(approx_size(item, depth - 1) for item in value)
+    return size
+
+
+class CacheStats:
+    """Счетчики операций кэша по одному пространству ключей"""
+    
+    __slots__ = ('hits', 'misses', 'stale_hits', 'sets', 'evictions', 'expirations',
+                 'invalidations', 'backend_hits', 'backend_misses')
+    
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # Отдано истекших значений с фоновым обновлением (stale-while-revalidate)
+        self.stale_hits = 0
+        self.sets = 0
+        # Вытеснено LRU при переполнении
+        self.evictions = 0
+        # Удалено по истечении TTL
+        self.expirations = 0
+        # Удалено после invalidate() тега
+        self.invalidations = 0
+        # Промахи L1, найденные / не найденные в общем хранилище
+        self.backend_hits = 0
+        self.backend_misses = 0
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Представление для админ-команды или экспортера метрик"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'stale_hits': self.stale_hits,
+            'sets': self.sets,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'backend_hits': self.backend_hits,
+            'backend_misses': self.backend_misses,
+        }
+
 
 class SimpleCache:
-    """Простой in-memory кэш с TTL"""
+    """In-memory кэш с TTL и вытеснением LRU"""
     
-    def __init__(self, default_ttl: int = DEFAULT_CACHE_TTL):
-        self._cache: Dict[str, Tuple[Any, float]] = {}
+    def __init__(self, default_ttl: int = DEFAULT_CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES,
+                 freeze_values: bool = False, debug: bool = False):
+        # Порядок ключей - от давно использованных к недавно использованным.
+        # Запись: (значение, истечение, поколения тегов, предел устаревания, отпечаток)
+        self._cache: "OrderedDict[str, Tuple[Any, float, Stamp, float, Optional[bytes]]]" = OrderedDict()
         self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        # Сохранять неизменяемые снимки значений (см. freeze)
+        self.freeze_values = freeze_values
+        # Проверять при чтении, что значение не изменили после сохранения
+        self.debug = debug
+        self._sweeper: Optional[asyncio.Task] = None
+        # Выполняющиеся загрузки get_or_load: ключ -> (поколения тегов, задача)
+        self._inflight: Dict[str, Tuple[Stamp, asyncio.Task]] = {}
+        # Текущие поколения тегов (отсутствующий тег - поколение 0)
+        self._generations: Dict[str, int] = {}
+        # Статистика по пространствам ключей
+        self._stats: Dict[str, CacheStats] = {}
+        # Количество записей по пространствам ключей (для cached().cache_info)
+        self._entries: Dict[str, int] = {}
+        # Общее хранилище (L2) и еще не выполненные операции с ним
+        self.backend: Optional[CacheBackend] = None
+        self.instance_id = uuid.uuid4().hex
+        self._backend_tasks: Set[asyncio.Task] = set()
     
     def get(self, key: str) -> Optional[Any]:
-        """Получить значение из кэша"""
-        if key not in self._cache:
-            return None
+        """Получить значение из кэша (закэшированное отсутствие возвращается как None)"""
+        value, _ = self._lookup(key)
+        return None if value is MISSING else value
+    
+    def _lookup(self, key: str, allow_stale: bool = False) -> Tuple[Optional[Any], bool]:
+        """
+        Значение записи как есть, включая MISSING
         
-        value, expiry = self._cache[key]
+        Returns:
+            (значение или None, True если значение устарело и его нужно обновить)
+        """
+        stats = self._stats_for(key)
+        entry = self._cache.get(key)
+        if entry is None:
+            stats.misses += 1
+            return None, False
         
-        if time.time() > expiry:
-            del self._cache[key]
-            return None
+        value, expiry, stamp, stale_until, fingerprint = entry
+        now = monotonic()
         
-        return value
+        if fingerprint is not None and _fingerprint(value) != fingerprint:
+            self._remove(key)
+            raise CacheMutationError(f"Значение кэша {key!r} изменено после сохранения")
+        
+        if stamp and not self._is_current(stamp):
+            stats.invalidations += 1
+        elif now <= expiry:
+            stats.hits += 1
+            self._cache.move_to_end(key)
+            return value, False
+        elif now <= stale_until:
+            # Запись истекла, но еще может отдаваться до обновления
+            if allow_stale:
+                stats.stale_hits += 1
+                self._cache.move_to_end(key)
+                return value, True
+            stats.misses += 1
+            return None, False
+        else:
+            stats.expirations += 1
+        
+        stats.misses += 1
+        self._remove(key)
+        return None, False
     
-    def set(self, key: str, value: Any, ttl: Optional[int] = None):
-        """Установить значение в кэш"""
+    def set(self, key: str, value: Any, ttl: Optional[int] = None, tags: Iterable[str] = (),
+            stale_ttl: Optional[int] = None):
+        """Установить значение в кэш (tags - пространства для invalidate, stale_ttl - как в get_or_load)"""
+        self._store(key, self._freeze(value), ttl, self._stamp(tags), stale_ttl)
+    
+    def _freeze(self, value: Any) -> Any:
+        """Значение в том виде, в котором оно хранится в кэше"""
+        return freeze(value) if self.freeze_values else value
+    
+    def _store(self, key: str, value: Any, ttl: Optional[int], stamp: Stamp,
+               stale_ttl: Optional[int] = None):
+        """Сохраняет запись с заранее снятыми поколениями тегов"""
         ttl = ttl or self.default_ttl
-        expiry = time.time() + ttl
-        self._cache[key] = (value, expiry)
+        expiry = monotonic() + ttl
+        fingerprint = _fingerprint(value) if self.debug else None
+        if key not in self._cache:
+            self._count(key, 1)
+        self._cache[key] = (value, expiry, stamp, expiry + (stale_ttl or 0), fingerprint)
+        self._cache.move_to_end(key)
+        self._stats_for(key).sets += 1
+        
+        while len(self._cache) > self.max_entries:
+            evicted, _ = self._cache.popitem(last=False)
+            self._count(evicted, -1)
+            self._stats_for(evicted).evictions += 1
+    
+    def _stamp(self, tags: Iterable[str]) -> Stamp:
+        """Текущие поколения тегов"""
+        return tuple((tag, self._generations.get(tag, 0)) for tag in tags)
+    
+    def _is_current(self, stamp: Stamp) -> bool:
+        """Не изменилось ли поколение ни одного из тегов записи"""
+        return all(self._generations.get(tag, 0) == generation for tag, generation in stamp)
+    
+    def invalidate(self, *tags: str):
+        """
+        Инвалидирует все записи с указанными тегами
+        
+        Увеличивает поколение тегов, не перебирая записи: устаревшие записи
+        не читаются, а память освобождают чтение, purge_expired() и LRU.
+        При подключенном хранилище инвалидация передается остальным экземплярам.
+        """
+        self._invalidate_local(tags)
+        self._propagate(tags=tags)
+    
+    def _invalidate_local(self, tags: Iterable[str]):
+        """Увеличивает локальные поколения тегов"""
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
     
     def delete(self, key: str):
-        """Удалить значение из кэша"""
+        """Удалить значение из кэша (и из общего хранилища, если оно подключено)"""
+        self._delete_local(key)
+        self._propagate(keys=(key,))
+    
+    def _delete_local(self, key: str):
+        """Удаляет значение из локального кэша"""
         if key in self._cache:
-            del self._cache[key]
+            self._remove(key)
+        # Загрузка, начатая до удаления, может вернуть устаревшие данные:
+        # следующие запросы запустят новую, а результат старой не сохранится
+        self._inflight.pop(key, None)
     
     def clear(self):
-        """Очистить весь кэш"""
+        """Очистить весь локальный кэш (общее хранилище не затрагивается)"""
         self._cache.clear()
+        self._entries.clear()
+        self._inflight.clear()
+    
+    def purge_expired(self) -> int:
+        """
+        Удаляет все истекшие и инвалидированные записи
+        
+        Returns:
+            int: Количество удаленных записей
+        """
+        now = monotonic()
+        expired = []
+        for key, (_, _, stamp, stale_until, _) in self._cache.items():
+            if stamp and not self._is_current(stamp):
+                self._stats_for(key).invalidations += 1
+            elif now > stale_until:
+                self._stats_for(key).expirations += 1
+            else:
+                continue
+            expired.append(key)
+        for key in expired:
+            self._remove(key)
+        return len(expired)
+    
+    def _remove(self, key: str):
+        """Удаляет запись из локального кэша"""
+        del self._cache[key]
+        self._count(key, -1)
+    
+    def _count(self, key: str, delta: int):
+        """Изменяет количество записей пространства ключа"""
+        namespace = key_namespace(key)
+        count = self._entries.get(namespace, 0) + delta
+        if count:
+            self._entries[namespace] = count
+        else:
+            self._entries.pop(namespace, None)
+    
+    def _stats_for(self, key: str) -> CacheStats:
+        """Счетчики пространства ключа"""
+        namespace = key_namespace(key)
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = CacheStats()
+        return stats
+    
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """
+        Статистика по пространствам ключей
+        
+        Счетчики накапливаются при операциях; количество записей и примерный
+        объем в байтах считаются при вызове проходом по кэшу.
+        
+        Returns:
+            Список словарей с полями namespace, hits, misses, hit_rate, sets,
+            evictions, expirations, invalidations, entries, bytes
+        """
+        sizes: Dict[str, List[int]] = {}
+        for key, (value, _, _, _, _) in self._cache.items():
+            totals = sizes.setdefault(key_namespace(key), [0, 0])
+            totals[0] += 1
+            totals[1] += sys.getsizeof(key) + approx_size(value)
+        
+        result = []
+        for namespace in sorted(set(self._stats) | set(sizes)):
+            stats = self._stats.get(namespace) or CacheStats()
+            entries, size = sizes.get(namespace, (0, 0))
+            result.append({'namespace': namespace, **stats.to_dict(), 'entries': entries, 'bytes': size})
+        return result
+    
+    def reset_stats(self):
+        """Сбрасывает накопленные счетчики"""
+        self._stats.clear()
     
     def get_or_set(self, key: str, func, ttl: Optional[int] = None):
         """Получить из кэша или выполнить функцию и сохранить результат"""
@@ -47,33 +398,309 @@ class SimpleCache:
         if value is not None:
             return value
         
-        value = func()
-        self.set(key, value, ttl)
+        value = self._freeze(func())
+        self._store(key, value, ttl, ())
+        return value
+    
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]],
+                          ttl: Optional[int] = None, negative_ttl: Optional[int] = None,
+                          tags: Iterable[str] = (), stale_ttl: Optional[int] = None,
+                          shared: bool = True) -> Any:
+        """
+        Получить из кэша или загрузить значение с защитой от "давки"
+        
+        Одновременные промахи по одному ключу ждут одну общую загрузку.
+        Результат None кэшируется только при заданном negative_ttl. Ошибка
+        загрузки передается всем ожидающим; отмена одного из ожидающих
+        не прерывает загрузку.
+        
+        Args:
+            key: Ключ кэша
+            loader: Корутинная функция без аргументов, загружающая значение
+            ttl: Время жизни в секундах (по умолчанию default_ttl)
+            negative_ttl: Время жизни закэшированного отсутствия значения
+            tags: Пространства записи для invalidate
+            stale_ttl: Сколько секунд после истечения отдавать прежнее значение,
+                обновляя его в фоне (stale-while-revalidate); это же - предельная
+                задержка данных
+            shared: Использовать общее хранилище, если оно подключено
+                (False - значение кэшируется только в этом процессе)
+        """
+        tags = tuple(tags)
+        value, stale = self._lookup(key, allow_stale=bool(stale_ttl))
+        if value is not None:
+            if stale:
+                self._start_load(key, loader, ttl, negative_ttl, tags, stale_ttl, shared, background=True)
+            return None if value is MISSING else value
+        
+        task = self._start_load(key, loader, ttl, negative_ttl, tags, stale_ttl, shared)
+        return await asyncio.shield(task)
+    
+    def _start_load(self, key: str, loader: Callable[[], Awaitable[Any]],
+                    ttl: Optional[int], negative_ttl: Optional[int], tags: Tuple[str, ...],
+                    stale_ttl: Optional[int], shared: bool = True,
+                    background: bool = False) -> asyncio.Task:
+        """Запускает загрузку ключа или возвращает уже выполняющуюся"""
+        # Загрузка, начатая до invalidate, не подходит: запускаем новую
+        stamp = self._stamp(tags)
+        pending = self._inflight.get(key)
+        if pending is not None and pending[0] == stamp:
+            return pending[1]
+        
+        task = asyncio.ensure_future(
+            self._load(key, loader, ttl, negative_ttl, stamp, tags, stale_ttl, shared)
+        )
+        self._inflight[key] = (stamp, task)
+        if background:
+            # Фоновое обновление никто не ждет - ошибку нужно хотя бы залогировать
+            task.add_done_callback(self._log_refresh_error)
+        return task
+    
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка фонового обновления кэша: {task.exception()}")
+    
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]],
+                    ttl: Optional[int], negative_ttl: Optional[int], stamp: Stamp,
+                    tags: Tuple[str, ...], stale_ttl: Optional[int] = None,
+                    shared: bool = True) -> Any:
+        """Выполняет загрузку для get_or_load и сохраняет результат"""
+        task = asyncio.current_task()
+        try:
+            if shared and self.backend is not None:
+                value = await self._load_shared(key, loader, ttl, negative_ttl, tags)
+            else:
+                value = await loader()
+            # Все ожидающие получают тот же снимок, что сохраняется в кэше
+            value = self._freeze(value)
+            # Ключ могли удалить во время загрузки - тогда результат не сохраняем.
+            # Запись сохраняется с поколениями на момент начала загрузки, поэтому
+            # invalidate во время загрузки делает ее сразу устаревшей
+            if self._is_own_load(key, task):
+                if value is not None:
+                    self._store(key, value, ttl, stamp, stale_ttl)
+                elif negative_ttl:
+                    self._store(key, MISSING, negative_ttl, stamp)
+            return value
+        finally:
+            if self._is_own_load(key, task):
+                del self._inflight[key]
+    
+    def _is_own_load(self, key: str, task: asyncio.Task) -> bool:
+        """Является ли задача текущей загрузкой ключа"""
+        pending = self._inflight.get(key)
+        return pending is not None and pending[1] is task
+    
+    # ------------------------------------------------------------------
+    # Общее хранилище (L2)
+    # ------------------------------------------------------------------
+    
+    async def connect_backend(self, backend: CacheBackend):
+        """
+        Подключает общее хранилище и подписку на инвалидации других экземпляров
+        
+        Локальный кэш очищается: записи, сохраненные до подключения,
+        не согласованы с остальными экземплярами.
+        """
+        await backend.subscribe(CACHE_INVALIDATION_CHANNEL, self._on_invalidation)
+        self.backend = backend
+        self.clear()
+    
+    async def disconnect_backend(self):
+        """Дожидается отправки инвалидаций и отключает общее хранилище"""
+        if self.backend is None:
+            return
+        await self._flush_backend()
+        backend, self.backend = self.backend, None
+        await backend.close()
+    
+    @staticmethod
+    def _backend_key(key: str) -> str:
+        return f"{CACHE_BACKEND_PREFIX}{key}"
+    
+    @staticmethod
+    def _generation_key(tag: str) -> str:
+        return f"{CACHE_BACKEND_PREFIX}gen:{tag}"
+    
+    async def _load_shared(self, key: str, loader: Callable[[], Awaitable[Any]],
+                           ttl: Optional[int], negative_ttl: Optional[int],
+                           tags: Tuple[str, ...]) -> Any:
+        """Читает значение из общего хранилища, при промахе загружает и сохраняет туда"""
+        backend = self.backend
+        stats = self._stats_for(key)
+        # Собственные инвалидации должны дойти до хранилища раньше чтения
+        await self._flush_backend()
+        
+        try:
+            raw, *generations = await backend.get_many(
+                [self._backend_key(key), *(self._generation_key(tag) for tag in tags)]
+            )
+        except Exception as e:
+            logger.error(f"Ошибка чтения общего кэша: {e}")
+            return await loader()
+        
+        # Одним запросом с записью читаются и общие поколения ее тегов
+        shared_stamp = tuple(zip(tags, (int(generation or 0) for generation in generations)))
+        if raw is not None:
+            try:
+                value, stamp = pickle.loads(raw)
+            except Exception as e:
+                logger.warning(f"Поврежденная запись общего кэша {key}: {e}")
+            else:
+                if stamp == shared_stamp:
+                    stats.backend_hits += 1
+                    return None if value is MISSING else value
+        
+        stats.backend_misses += 1
+        value = await loader()
+        
+        if value is None and not negative_ttl:
+            return value
+        # Ключ удалили во время загрузки - результат мог устареть
+        if not self._is_own_load(key, asyncio.current_task()):
+            return value
+        try:
+            payload = pickle.dumps((MISSING if value is None else value, shared_stamp))
+            entry_ttl = negative_ttl if value is None else (ttl or self.default_ttl)
+            await backend.set(self._backend_key(key), payload, entry_ttl)
+        except Exception as e:
+            logger.error(f"Ошибка записи в общий кэш: {e}")
         return value
+    
+    def _propagate(self, keys: Iterable[str] = (), tags: Iterable[str] = ()):
+        """Передает удаление ключей и инвалидацию тегов в общее хранилище"""
+        if self.backend is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning("Инвалидация вне event loop не передана в общий кэш")
+            return
+        task = loop.create_task(self._send_invalidation(self.backend, list(keys), list(tags)))
+        self._backend_tasks.add(task)
+        task.add_done_callback(self._backend_tasks.discard)
+    
+    async def _send_invalidation(self, backend: CacheBackend, keys: List[str], tags: List[str]):
+        """Удаляет ключи, увеличивает общие поколения тегов и оповещает другие экземпляры"""
+        try:
+            if keys:
+                await backend.delete(*(self._backend_key(key) for key in keys))
+            for tag in tags:
+                await backend.incr(self._generation_key(tag))
+            message = json.dumps({'origin': self.instance_id, 'keys': keys, 'tags': tags})
+            await backend.publish(CACHE_INVALIDATION_CHANNEL, message.encode())
+        except Exception as e:
+            logger.error(f"Ошибка инвалидации общего кэша: {e}")
+    
+    async def _flush_backend(self):
+        """Дожидается отправки ранее запущенных инвалидаций"""
+        if self._backend_tasks:
+            # wait, а не gather: отмена ожидающего не должна отменять отправку
+            await asyncio.wait(list(self._backend_tasks))
+    
+    def _on_invalidation(self, message: bytes):
+        """Применяет к локальному кэшу инвалидацию другого экземпляра"""
+        try:
+            data = json.loads(message)
+        except ValueError:
+            logger.warning(f"Некорректное сообщение инвалидации кэша: {message!r}")
+            return
+        if data.get('origin') == self.instance_id:
+            return
+        for key in data.get('keys', ()):
+            self._delete_local(key)
+        self._invalidate_local(data.get('tags', ()))
+    
+    def start_sweeper(self, interval: float = CACHE_SWEEP_INTERVAL):
+        """Запускает фоновую очистку истекших записей (требует запущенный event loop)"""
+        if self._sweeper is not None and not self._sweeper.done():
+            return
+        self._sweeper = asyncio.create_task(self._sweep_loop(interval))
+    
+    async def stop_sweeper(self):
+        """Останавливает фоновую очистку"""
+        if self._sweeper is None:
+            return
+        self._sweeper.cancel()
+        try:
+            await self._sweeper
+        except asyncio.CancelledError:
+            pass
+        self._sweeper = None
+    
+    async def _sweep_loop(self, interval: float):
+        """Периодически удаляет истекшие записи"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = self.purge_expired()
+                if removed:
+                    logger.debug(f"Кэш: удалено истекших записей: {removed}, осталось: {len(self._cache)}")
+            except Exception as e:
+                logger.error(f"Ошибка очистки кэша: {e}")
 
-# Глобальный экземпляр кэша
-cache = SimpleCache(default_ttl=DEFAULT_CACHE_TTL)
+# Глобальный экземпляр кэша (режим отладки включается при запуске, см. CACHE_DEBUG)
+cache = SimpleCache(default_ttl=DEFAULT_CACHE_TTL, freeze_values=True)
 
-def cached(ttl: int = DEFAULT_CACHE_TTL):
-    """Декоратор для кэширования результатов функций"""
+def cached(ttl: int = DEFAULT_CACHE_TTL, tags: Iterable[str] = (), jitter: float = CACHE_TTL_JITTER):
+    """
+    Декоратор для кэширования результатов корутинных функций
+    
+    Ключ - кортеж (модуль.функция, args, kwargs): функции с одинаковым именем
+    из разных модулей не пересекаются, а аргументы не форматируются в строку.
+    Кэшируются любые результаты, включая None, 0 и пустые списки. Вызовы
+    с нехешируемыми аргументами выполняются без кэша.
+    
+    Записи хранятся только в кэше процесса (ключи-кортежи не передаются
+    в общее хранилище); invalidate() без аргументов рассылается всем
+    экземплярам через тег функции.
+    
+    Args:
+        ttl: Время жизни в секундах
+        tags: Пространства для cache.invalidate (например, ('cars',))
+        jitter: Случайный разброс TTL (доля), чтобы записи не истекали одновременно
+    
+    У обернутой функции есть:
+        invalidate(*args, **kwargs): Удаляет результат для этих аргументов;
+            без аргументов - все результаты функции
+        cache_info(): Статистика попаданий и количество записей функции
+    """
     def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        entry_tags = (name, *tags)
+        
+        def make_key(args: tuple, kwargs: Dict[str, Any]) -> Tuple:
+            return (name, args, tuple(sorted(kwargs.items())))
+        
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # Создаем ключ кэша на основе аргументов
-            cache_key = f"{func.__name__}:{str(args)}:{str(sorted(kwargs.items()))}"
-            
-            # Пытаемся получить из кэша
-            cached_value = cache.get(cache_key)
-            if cached_value is not None:
-                return cached_value
+            key = make_key(args, kwargs)
+            try:
+                hash(key)
+            except TypeError:
+                return await func(*args, **kwargs)
             
-            # Выполняем функцию
-            result = await func(*args, **kwargs)
-            
-            # Сохраняем в кэш
-            cache.set(cache_key, result, ttl)
-            
-            return result
+            entry_ttl = ttl * random.uniform(1 - jitter, 1 + jitter) if jitter else ttl
+            # negative_ttl: результат None тоже кэшируется (меткой MISSING)
+            return await cache.get_or_load(
+                key, lambda: func(*args, **kwargs), ttl=entry_ttl, negative_ttl=entry_ttl,
+                tags=entry_tags, shared=False
+            )
+        
+        def invalidate(*args, **kwargs):
+            if args or kwargs:
+                # Запись есть только в кэше этого процесса
+                cache._delete_local(make_key(args, kwargs))
+            else:
+                cache.invalidate(name)
+        
+        def cache_info() -> Dict[str, Any]:
+            # Счетчики пространства функции без прохода по кэшу (в отличие от get_stats)
+            stats = cache._stats.get(name) or CacheStats()
+            return {'namespace': name, **stats.to_dict(), 'entries': cache._entries.get(name, 0)}
+        
+        wrapper.invalidate = invalidate
+        wrapper.cache_info = cache_info
         return wrapper
     return decorator
-
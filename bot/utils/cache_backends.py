@@ -0,0 +1,188 @@
+"""
+Общие хранилища (L2) для двухуровневого кэша
+
+SimpleCache - локальный LRU-кэш процесса (L1). При подключенном бэкенде
+промахи L1 сначала читаются из общего хранилища, а удаления и инвалидации
+рассылаются остальным экземплярам бота через pub/sub.
+
+Бэкенды:
+    RedisBackend - Redis (необязательная зависимость redis>=5.0.1)
+    InMemoryBackend - замена Redis в памяти процесса для тестов; несколько
+        бэкендов с общим InMemoryBroker ведут себя как экземпляры бота,
+        подключенные к одному серверу
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from time import monotonic
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # redis - необязательная зависимость
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+# Обработчик сообщения pub/sub
+MessageHandler = Callable[[bytes], None]
+
+
+class CacheBackend(ABC):
+    """Интерфейс общего хранилища кэша (подмножество команд Redis)"""
+
+    @abstractmethod
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """Значения ключей (None для отсутствующих), как MGET"""
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float):
+        """Сохраняет значение с временем жизни в секундах"""
+
+    @abstractmethod
+    async def delete(self, *keys: str):
+        """Удаляет ключи"""
+
+    @abstractmethod
+    async def incr(self, key: str) -> int:
+        """Атомарно увеличивает счетчик и возвращает новое значение"""
+
+    @abstractmethod
+    async def publish(self, channel: str, message: bytes):
+        """Публикует сообщение в канал"""
+
+    @abstractmethod
+    async def subscribe(self, channel: str, handler: MessageHandler):
+        """Подписывает обработчик на сообщения канала"""
+
+    async def close(self):
+        """Закрывает соединения и подписки"""
+
+
+class InMemoryBroker:
+    """Общее "серверное" состояние для InMemoryBackend"""
+
+    def __init__(self):
+        # ключ -> (значение, момент истечения по monotonic или None)
+        self.data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self.subscribers: Dict[str, List[MessageHandler]] = {}
+
+    def read(self, key: str) -> Optional[bytes]:
+        """Значение ключа с учетом истечения"""
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expiry = entry
+        if expiry is not None and monotonic() > expiry:
+            del self.data[key]
+            return None
+        return value
+
+
+class InMemoryBackend(CacheBackend):
+    """Бэкенд в памяти процесса с семантикой Redis (для тестов)"""
+
+    def __init__(self, broker: Optional[InMemoryBroker] = None):
+        self.broker = broker or InMemoryBroker()
+        self._subscriptions: List[Tuple[str, MessageHandler]] = []
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return [self.broker.read(key) for key in keys]
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self.broker.data[key] = (value, monotonic() + ttl)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self.broker.data.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = int(self.broker.read(key) or 0) + 1
+        self.broker.data[key] = (str(value).encode(), None)
+        return value
+
+    async def publish(self, channel: str, message: bytes):
+        # Как и в Redis, сообщение доставляется подписчикам асинхронно
+        loop = asyncio.get_running_loop()
+        for handler in list(self.broker.subscribers.get(channel, ())):
+            loop.call_soon(handler, message)
+
+    async def subscribe(self, channel: str, handler: MessageHandler):
+        self.broker.subscribers.setdefault(channel, []).append(handler)
+        self._subscriptions.append((channel, handler))
+
+    async def close(self):
+        for channel, handler in self._subscriptions:
+            handlers = self.broker.subscribers.get(channel, [])
+            if handler in handlers:
+                handlers.remove(handler)
+        self._subscriptions.clear()
+
+
+class RedisBackend(CacheBackend):
+    """Бэкенд на Redis (redis.asyncio)"""
+
+    def __init__(self, url: str):
+        if redis_asyncio is None:
+            raise ImportError("Для общего кэша установите пакет redis>=5.0.1")
+        self._client = redis_asyncio.from_url(url)
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._handlers: Dict[str, MessageHandler] = {}
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return await self._client.mget(list(keys))
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._client.delete(*keys)
+
+    async def incr(self, key: str) -> int:
+        return await self._client.incr(key)
+
+    async def publish(self, channel: str, message: bytes):
+        await self._client.publish(channel, message)
+
+    async def subscribe(self, channel: str, handler: MessageHandler):
+        if self._pubsub is None:
+            self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(channel)
+        self._handlers[channel] = handler
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        """Передает сообщения подписок обработчикам"""
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    channel = message['channel']
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    handler = self._handlers.get(channel)
+                    if handler is not None:
+                        handler(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Обрыв соединения: redis-py переподключается при следующем чтении
+                logger.error(f"Ошибка подписки на инвалидацию кэша: {e}")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        await self._client.aclose()
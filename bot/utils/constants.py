@@ -10,9 +10,12 @@ from typing import Final
 # TTL кэша по умолчанию (в секундах)
 DEFAULT_CACHE_TTL: Final[int] = 300  # 5 минут
 
-# TTL кэша для автомобилей
+# TTL каталога автомобилей. Изменения через бота применяются к каталогу сразу
+# (сквозная запись); TTL страхует только от правок БД в обход бота
 CACHE_TTL_CARS_LIST: Final[int] = 60  # 1 минута
-CACHE_TTL_CAR_DETAILS: Final[int] = 120  # 2 минуты
+# Предельная задержка каталога: после истечения TTL каталог еще столько секунд
+# отдается сразу и обновляется в фоне (stale-while-revalidate)
+CACHE_MAX_STALE_CARS_LIST: Final[int] = 240  # 4 минуты
 
 # TTL кэша для аренд
 CACHE_TTL_RENTAL_USER: Final[int] = 300  # 5 минут
@@ -21,6 +24,25 @@ CACHE_TTL_RENTALS_ACTIVE: Final[int] = 60  # 1 минута
 # TTL кэша для администраторов
 CACHE_TTL_ADMIN_CHECK: Final[int] = 300  # 5 минут
 
+# TTL закэшированного отсутствия активной аренды.
+# Короче основного TTL: страхует от изменений в обход функций с инвалидацией
+CACHE_TTL_RENTAL_USER_MISS: Final[int] = 120  # 2 минуты
+
+# Максимальное количество записей в кэше (при переполнении вытесняются
+# давно не использованные записи)
+CACHE_MAX_ENTRIES: Final[int] = 10000
+
+# Интервал фоновой очистки истекших записей (в секундах)
+CACHE_SWEEP_INTERVAL: Final[int] = 60  # 1 минута
+
+# Разброс TTL декоратора @cached (доля TTL): записи, сохраненные одновременно,
+# истекают не в одну секунду и не создают пик загрузок
+CACHE_TTL_JITTER: Final[float] = 0.1  # ±10%
+
+# Префикс ключей кэша в общем хранилище (Redis) и канал рассылки инвалидаций
+CACHE_BACKEND_PREFIX: Final[str] = "atlant:cache:"
+CACHE_INVALIDATION_CHANNEL: Final[str] = "atlant:cache:invalidate"
+
 # ============================================================================
 # РАССЫЛКИ
 # ============================================================================
@@ -45,6 +67,52 @@ DB_CHUNK_SIZE: Final[int] = 100
 # Максимальная длина текста для сохранения в БД
 DB_MAX_TEXT_LENGTH: Final[int] = 500
 
+# Количество соединений-читателей в пуле по умолчанию (переопределяется DB_READ_POOL_SIZE)
+DEFAULT_DB_READ_POOL_SIZE: Final[int] = 4
+
+# Максимальное ожидание свободного читателя (в секундах)
+DB_ACQUIRE_TIMEOUT: Final[float] = 2.0
+
+# Групповая фиксация записей: окно накопления (в секундах) и максимум запросов в одной транзакции
+DB_WRITE_QUEUE_ENABLED: Final[bool] = True
+DB_WRITE_BATCH_WINDOW: Final[float] = 0.005  # 5 мс
+DB_WRITE_BATCH_MAX: Final[int] = 100
+
+# Журнал медленных запросов: порог (в мс), размер журнала и сбор EXPLAIN QUERY PLAN
+DB_SLOW_QUERY_THRESHOLD_MS: Final[float] = 100.0
+DB_SLOW_QUERY_LOG_SIZE: Final[int] = 50
+DB_EXPLAIN_SLOW_QUERIES: Final[bool] = True
+
+# ============================================================================
+# НАПОМИНАНИЯ ОБ ОПЛАТЕ
+# ============================================================================
+
+# На сколько дней вперед искать ближайший день напоминания аренды
+# (ежемесячное напоминание после недавнего может наступить через 60 дней)
+REMINDER_LOOKAHEAD_DAYS: Final[int] = 62
+
+# Максимальный сон планировщика (в секундах): после перевода системных часов
+# время ближайшего напоминания пересчитывается не позже чем через этот интервал
+REMINDER_MAX_SLEEP: Final[float] = 3600.0  # 1 час
+
+# Настройка (таблица settings) с последней обработанной минутой напоминаний
+REMINDER_WATERMARK_SETTING: Final[str] = 'reminder_watermark'
+
+# Насколько далеко в прошлое досылать пропущенные напоминания после простоя
+# (в секундах): более старые сроки считаются обработанными
+REMINDER_MAX_CATCH_UP: Final[int] = 86400  # 1 сутки
+
+# Количество одновременных отправителей напоминаний
+REMINDER_SEND_CONCURRENCY: Final[int] = 8
+
+# Лимиты Telegram при отправке напоминаний: сообщений в секунду на всех
+# получателей (лимит API - около 30) и интервал между сообщениями в один чат
+REMINDER_GLOBAL_RATE: Final[float] = 25.0
+REMINDER_PER_CHAT_INTERVAL: Final[float] = 1.0  # секунд
+
+# Сколько раз повторять отправку напоминания после ответа 429 (RetryAfter)
+REMINDER_SEND_RETRIES: Final[int] = 3
+
 # ============================================================================
 # УВЕДОМЛЕНИЯ АДМИНИСТРАТОРАМ
 # ============================================================================
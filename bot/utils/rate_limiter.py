@@ -0,0 +1,82 @@
+"""
+Ограничитель частоты отправки сообщений под лимиты Telegram Bot API
+
+Telegram допускает около 30 сообщений в секунду от бота и не больше одного
+сообщения в секунду в один чат; при превышении API отвечает 429 (RetryAfter).
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+class SendRateLimiter:
+    """
+    Раздает моменты отправки с учетом общего и початового лимитов
+
+    Каждый вызов acquire() сразу резервирует ближайший момент, свободный
+    по обоим лимитам, и спит до него - конкурентные отправители не
+    превышают лимиты без общей блокировки. pause() (ответ RetryAfter)
+    откладывает все отправки: еще не наступившие зарезервированные моменты
+    сдвигаются за паузу с сохранением интервалов между ними, и ждущие
+    отправители досыпают свой сдвинутый момент, не занимая новый.
+    """
+
+    # Сколько чатов хранить, прежде чем удалять чаты с истекшим интервалом
+    MAX_TRACKED_CHATS = 1024
+
+    def __init__(self, global_rate: float, per_chat_interval: float,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep):
+        """
+        Args:
+            global_rate: Сообщений в секунду на всех получателей
+            per_chat_interval: Минимальный интервал между сообщениями в один чат (в секундах)
+            clock, sleep: Часы и ожидание (подменяются в тестах)
+        """
+        self.global_interval = 1.0 / global_rate
+        self.per_chat_interval = per_chat_interval
+        self._clock = clock
+        self._sleep = sleep
+        self._next_global = 0.0
+        self._next_chat: Dict[Hashable, float] = {}
+        self._paused_until = 0.0
+        # Суммарный сдвиг зарезервированных моментов паузами
+        self._shifted = 0.0
+
+    async def acquire(self, chat_id: Hashable):
+        """Ждет момента, когда в чат chat_id можно отправить сообщение"""
+        now = self._clock()
+        start = max(now, self._next_global, self._next_chat.get(chat_id, 0.0), self._paused_until)
+        self._next_global = start + self.global_interval
+        self._next_chat[chat_id] = start + self.per_chat_interval
+        shifted = self._shifted
+        while start > now:
+            await self._sleep(start - now)
+            # Пауза, начатая во время ожидания, сдвинула и этот момент
+            start = max(start + self._shifted - shifted, self._paused_until)
+            shifted = self._shifted
+            now = self._clock()
+        self._forget_idle_chats()
+
+    def pause(self, seconds: float):
+        """Откладывает все отправки на seconds секунд (ответ 429 RetryAfter)"""
+        now = self._clock()
+        until = now + seconds
+        if until <= self._paused_until:
+            return
+        shift = until - max(now, self._paused_until)
+        self._shifted += shift
+        # Последний зарезервированный момент еще не наступил - сдвигаем очередь
+        if self._next_global - self.global_interval > now:
+            self._next_global += shift
+        for chat_id, ready in self._next_chat.items():
+            if ready - self.per_chat_interval > now:
+                self._next_chat[chat_id] = ready + shift
+        self._paused_until = until
+
+    def _forget_idle_chats(self):
+        """Удаляет чаты, интервал которых истек (словарь не растет с числом получателей)"""
+        if len(self._next_chat) < self.MAX_TRACKED_CHATS:
+            return
+        now = self._clock()
+        self._next_chat = {chat: ready for chat, ready in self._next_chat.items() if ready > now}
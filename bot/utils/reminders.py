@@ -0,0 +1,151 @@
+"""
+Правила напоминаний об оплате аренды
+
+Общие для планировщика (PaymentReminderScheduler), функций изменения аренд,
+которые хранят ближайшее напоминание в колонке rentals.next_reminder_at,
+и миграции, заполняющей эту колонку.
+"""
+import logging
+from datetime import datetime, time as dt_time, timedelta, date
+from typing import Any, Mapping, Optional
+
+from bot.utils.constants import REMINDER_LOOKAHEAD_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Формат rentals.next_reminder_at (лексикографический порядок совпадает с временным)
+REMINDER_AT_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def parse_reminder_time(rental: Mapping[str, Any]) -> Optional[dt_time]:
+    """Время напоминания "HH:MM" (None, если не задано или некорректно)"""
+    try:
+        hour, minute = map(int, rental['reminder_time'].split(':'))
+        return dt_time(hour, minute)
+    except (KeyError, AttributeError, TypeError, ValueError):
+        return None
+
+
+def parse_start_date(rental: Mapping[str, Any]) -> Optional[date]:
+    """Дата начала аренды (None, если не задана или некорректна)"""
+    start_date_str = rental.get('start_date')
+    if not start_date_str:
+        return None
+
+    try:
+        if isinstance(start_date_str, str):
+            return datetime.fromisoformat(start_date_str.replace('Z', '+00:00')).date()
+        return start_date_str.date() if hasattr(start_date_str, 'date') else start_date_str
+    except:
+        logger.error(f"Ошибка парсинга даты начала аренды: {start_date_str}")
+        return None
+
+
+def parse_last_reminder_date(rental: Mapping[str, Any]) -> Optional[date]:
+    """Дата последнего напоминания (None, если напоминаний не было)"""
+    last_reminder_date_str = rental.get('last_reminder_date')
+    if not last_reminder_date_str:
+        return None
+
+    try:
+        if isinstance(last_reminder_date_str, str):
+            return datetime.strptime(last_reminder_date_str, '%Y-%m-%d').date()
+        return last_reminder_date_str.date() if hasattr(last_reminder_date_str, 'date') else last_reminder_date_str
+    except:
+        return None
+
+
+def is_reminder_day(reminder_type: str, start_date: date,
+                    last_reminder_date: Optional[date], current_date: date) -> bool:
+    """Положено ли аренде напоминание в этот день"""
+    if reminder_type == 'daily':
+        # Ежедневно - отправляем каждый день, если еще не отправляли сегодня
+        return last_reminder_date != current_date
+
+    elif reminder_type == 'weekly':
+        # Еженедельно - каждые 7 дней от начала аренды
+        days_since_start = (current_date - start_date).days
+
+        # Проверяем, прошло ли 7 дней или кратно 7
+        if days_since_start < 7:
+            return False
+
+        # Проверяем, не отправляли ли уже напоминание в этот период
+        if last_reminder_date:
+            days_since_last = (current_date - last_reminder_date).days
+            if days_since_last < 7:
+                return False
+
+        # Проверяем, что сегодня кратно 7 дням от начала
+        return days_since_start % 7 == 0
+
+    elif reminder_type == 'monthly':
+        # Ежемесячно - каждые 30 дней от начала аренды
+        days_since_start = (current_date - start_date).days
+
+        # Проверяем, прошло ли 30 дней
+        if days_since_start < 30:
+            return False
+
+        # Проверяем, не отправляли ли уже напоминание в этот период
+        if last_reminder_date:
+            days_since_last = (current_date - last_reminder_date).days
+            if days_since_last < 30:
+                return False
+
+        # Проверяем, что сегодня кратно 30 дням от начала
+        return days_since_start % 30 == 0
+
+    return False
+
+
+def should_send_reminder(rental: Mapping[str, Any], current_date: date) -> bool:
+    """Проверяет, нужно ли отправить напоминание в зависимости от типа"""
+    start_date = parse_start_date(rental)
+    if start_date is None:
+        return False
+    return is_reminder_day(
+        rental.get('reminder_type', 'daily'), start_date,
+        parse_last_reminder_date(rental), current_date
+    )
+
+
+def next_reminder_at(rental: Mapping[str, Any], after: datetime) -> Optional[datetime]:
+    """
+    Ближайший момент не раньше after, когда аренде положено напоминание
+
+    Returns:
+        Момент напоминания или None, если в ближайшие REMINDER_LOOKAHEAD_DAYS
+        дней напоминаний нет (неизвестный тип, некорректные время или дата начала)
+    """
+    remind_at = parse_reminder_time(rental)
+    if remind_at is None:
+        return None
+
+    start_date = parse_start_date(rental)
+    if start_date is None:
+        return None
+    last_reminder_date = parse_last_reminder_date(rental)
+    reminder_type = rental.get('reminder_type', 'daily')
+
+    for offset in range(REMINDER_LOOKAHEAD_DAYS):
+        day = after.date() + timedelta(days=offset)
+        fire_at = datetime.combine(day, remind_at)
+        if fire_at >= after and is_reminder_day(reminder_type, start_date, last_reminder_date, day):
+            return fire_at
+    return None
+
+
+def format_reminder_at(value: Optional[datetime]) -> Optional[str]:
+    """Значение для rentals.next_reminder_at"""
+    return value.strftime(REMINDER_AT_FORMAT) if value is not None else None
+
+
+def parse_reminder_at(value: Optional[str]) -> Optional[datetime]:
+    """Момент из rentals.next_reminder_at (None, если не задан или некорректен)"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, REMINDER_AT_FORMAT)
+    except (TypeError, ValueError):
+        return None
@@ -3,27 +3,77 @@
 Интегрирован с APScheduler для проактивных уведомлений администратору (Модуль 1)
 """
 import asyncio
+import heapq
 import logging
-from datetime import datetime, time as dt_time, timedelta, date
-from typing import List, Dict, Any, Optional
+import time
+from datetime import datetime, timedelta, date
+from typing import List, Dict, Any, Mapping, Optional, Tuple
 from aiogram import Bot
-from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from bot.database.database import get_all_active_rentals, get_rentals_by_reminder_time, update_rental_last_reminder
+from bot.database.database import (
+    get_next_reminders, get_active_rentals_by_ids, update_rentals_reminders,
+    subscribe_rental_changes, unsubscribe_rental_changes, get_setting, set_setting
+)
 from bot.utils.admin_notifications import check_ending_rentals_notification, check_maintenance_reminders_notification
 from bot.config import NOTIFICATION_TIME
+from bot.utils.constants import (
+    REMINDER_MAX_SLEEP, REMINDER_WATERMARK_SETTING, REMINDER_MAX_CATCH_UP, DB_CHUNK_SIZE,
+    REMINDER_SEND_CONCURRENCY, REMINDER_GLOBAL_RATE, REMINDER_PER_CHAT_INTERVAL, REMINDER_SEND_RETRIES
+)
+from bot.utils.rate_limiter import SendRateLimiter
+from bot.utils.reminders import (
+    parse_reminder_time, next_reminder_at, parse_reminder_at
+)
 
 logger = logging.getLogger(__name__)
 
+# Формат сохраненной отметки обработанных напоминаний
+WATERMARK_FORMAT = "%Y-%m-%d %H:%M"
+
 class PaymentReminderScheduler:
-    """Планировщик напоминаний об оплате"""
+    """
+    Планировщик напоминаний об оплате
+    
+    Вместо ежеминутного опроса БД держит в памяти min-кучу
+    (время ближайшего напоминания, ID аренды) по всем активным арендам и спит
+    ровно до ближайшего срока. Очередь строится при запуске по колонке
+    rentals.next_reminder_at (ее пересчитывают функции изменения аренд и сам
+    планировщик после каждой пачки) и обновляется
+    функциями изменения аренд (subscribe_rental_changes): новая аренда, смена
+    времени или типа напоминания и завершение аренды сразу переносят или
+    убирают срок и будят цикл.
+    
+    Сроки - моменты по системным часам, и задержка пересчитывается от текущего
+    времени при каждом пробуждении, поэтому длительность обработки не копится.
+    Последняя обработанная минута сохраняется в настройках: после медленной
+    обработки или перезапуска все пропущенные сроки (не старше
+    REMINDER_MAX_CATCH_UP) оказываются в прошлом и отправляются одной пачкой
+    с одним запросом к БД. Повторной отправки не будет: last_reminder_date
+    обновляется одним запросом после каждой пачки, и условие
+    REMINDER_DUE_CONDITION его учитывает.
+    
+    Пачка рассылается конкурентно (REMINDER_SEND_CONCURRENCY отправителей)
+    с соблюдением лимитов Telegram на бота и на чат.
+    """
     
     def __init__(self, bot: Bot):
         self.bot = bot
         self.running = False
         self._task = None
+        # Min-куча (время напоминания, ID аренды). Запись, не совпадающая
+        # с _next_fire, устарела (срок перенесен или аренда завершена)
+        self._heap: List[Tuple[datetime, int]] = []
+        self._next_fire: Dict[int, datetime] = {}
+        # Напоминания раньше этого момента уже обработаны (и сохраненное значение)
+        self._processed_until: Optional[datetime] = None
+        self._saved_watermark: Optional[datetime] = None
+        self._wakeup = asyncio.Event()
+        # Лимиты Telegram на отправку и итоги последней пачки напоминаний
+        self._limiter = SendRateLimiter(REMINDER_GLOBAL_RATE, REMINDER_PER_CHAT_INTERVAL)
+        self.last_dispatch_stats: Optional[Dict[str, Any]] = None
     
     async def start(self):
         """Запуск планировщика"""
@@ -31,12 +81,14 @@ class PaymentReminderScheduler:
             return
         
         self.running = True
+        subscribe_rental_changes(self.schedule_rental)
         self._task = asyncio.create_task(self._scheduler_loop())
         logger.info("✅ Планировщик напоминаний запущен")
     
     async def stop(self):
         """Остановка планировщика"""
         self.running = False
+        unsubscribe_rental_changes(self.schedule_rental)
         if self._task:
             self._task.cancel()
             try:
@@ -46,28 +98,17 @@ class PaymentReminderScheduler:
         logger.info("⏹️ Планировщик напоминаний остановлен")
     
     async def _scheduler_loop(self):
-        """Основной цикл планировщика"""
+        """Основной цикл планировщика: сон до ближайшего напоминания и отправка наступивших"""
+        loaded = False
         while self.running:
             try:
-                now = datetime.now()
-                current_time = now.strftime("%H:%M")
-                current_date = now.date()
-                
-                # Fix based on audit: Фильтрация на уровне БД вместо загрузки всех аренд
-                # Получаем только аренды с текущим временем напоминания
-                rentals = await get_rentals_by_reminder_time(current_time)
-                
-                for rental in rentals:
-                    reminder_type = rental.get('reminder_type', 'daily')
-                    
-                    # Проверяем, нужно ли отправить напоминание в зависимости от типа
-                    should_send = await self._should_send_reminder(rental, current_date)
-                    
-                    if should_send:
-                        await self._send_reminder(rental, current_date)
+                if not loaded:
+                    await self._load_schedule(datetime.now())
+                    loaded = True
                 
-                # Проверяем каждую минуту
-                await asyncio.sleep(60)
+                await self._sleep_until_due()
+                await self._fire_due(datetime.now())
+                await self._save_watermark()
                 
             except asyncio.CancelledError:
                 break
@@ -75,80 +116,235 @@ class PaymentReminderScheduler:
                 logger.error(f"Ошибка в планировщике: {e}")
                 await asyncio.sleep(60)
     
-    async def _should_send_reminder(self, rental: Dict[str, Any], current_date: date) -> bool:
-        """Проверяет, нужно ли отправить напоминание в зависимости от типа"""
-        reminder_type = rental.get('reminder_type', 'daily')
-        start_date_str = rental.get('start_date')
-        last_reminder_date_str = rental.get('last_reminder_date')
+    async def _load_schedule(self, now: datetime):
+        """Строит очередь напоминаний по всем активным арендам, начиная с необработанной минуты"""
+        current_minute = now.replace(second=0, microsecond=0)
+        start = current_minute
         
-        if not start_date_str:
-            return False
+        watermark = await self._load_watermark()
+        if watermark is not None and watermark < current_minute:
+            start = max(watermark, current_minute - timedelta(seconds=REMINDER_MAX_CATCH_UP))
+            logger.info(f"⏪ Досылаем напоминания, пропущенные с {start:%Y-%m-%d %H:%M}")
+        self._processed_until = start
         
-        # Парсим дату начала аренды
-        try:
-            if isinstance(start_date_str, str):
-                start_date = datetime.fromisoformat(start_date_str.replace('Z', '+00:00')).date()
+        self._heap.clear()
+        self._next_fire.clear()
+        # Сохраненный срок раньше start устарел (простой дольше REMINDER_MAX_CATCH_UP
+        # или изменение в обход функций аренд): такие аренды пересчитываются
+        stale: List[Tuple[int, Optional[str]]] = []
+        for row in await get_next_reminders():
+            fire_at = parse_reminder_at(row['next_reminder_at'])
+            if fire_at is None or fire_at < start:
+                stale.append((row['id'], row['next_reminder_at']))
             else:
-                start_date = start_date_str.date() if hasattr(start_date_str, 'date') else start_date_str
-        except:
-            logger.error(f"Ошибка парсинга даты начала аренды: {start_date_str}")
-            return False
+                self._push(row['id'], fire_at)
         
-        # Парсим дату последнего напоминания
-        last_reminder_date = None
-        if last_reminder_date_str:
-            try:
-                if isinstance(last_reminder_date_str, str):
-                    last_reminder_date = datetime.strptime(last_reminder_date_str, '%Y-%m-%d').date()
-                else:
-                    last_reminder_date = last_reminder_date_str.date() if hasattr(last_reminder_date_str, 'date') else last_reminder_date_str
-            except:
-                pass
+        for offset in range(0, len(stale), DB_CHUNK_SIZE):
+            chunk = dict(stale[offset:offset + DB_CHUNK_SIZE])
+            for rental in await get_active_rentals_by_ids(list(chunk)):
+                self.schedule_rental(rental, after=start)
+            changed = {
+                rental_id: self._next_fire.get(rental_id) for rental_id, saved in chunk.items()
+                if parse_reminder_at(saved) != self._next_fire.get(rental_id)
+            }
+            await update_rentals_reminders({}, changed)
+        logger.info(f"📅 Запланировано напоминаний: {len(self._next_fire)} (пересчитано: {len(stale)})")
+    
+    async def _load_watermark(self) -> Optional[datetime]:
+        """Последняя обработанная минута из настроек (None, если не сохранялась)"""
+        value = await get_setting(REMINDER_WATERMARK_SETTING)
+        if not value:
+            return None
+        try:
+            self._saved_watermark = datetime.strptime(value, WATERMARK_FORMAT)
+        except ValueError:
+            logger.warning(f"Некорректная отметка обработанных напоминаний: {value}")
+            return None
+        return self._saved_watermark
+    
+    async def _save_watermark(self):
+        """Сохраняет последнюю обработанную минуту, если она сдвинулась"""
+        if self._processed_until is None or self._processed_until == self._saved_watermark:
+            return
+        if await set_setting(REMINDER_WATERMARK_SETTING, self._processed_until.strftime(WATERMARK_FORMAT)):
+            self._saved_watermark = self._processed_until
+    
+    def schedule_rental(self, rental: Mapping[str, Any], after: Optional[datetime] = None):
+        """
+        Ставит в очередь ближайшее напоминание аренды
         
-        if reminder_type == 'daily':
-            # Ежедневно - отправляем каждый день, если еще не отправляли сегодня
-            return last_reminder_date != current_date
+        Вызывается при построении очереди и функциями изменения аренд.
+        Завершенная аренда или аренда без будущих напоминаний из очереди убирается.
         
-        elif reminder_type == 'weekly':
-            # Еженедельно - каждые 7 дней от начала аренды
-            days_since_start = (current_date - start_date).days
-            
-            # Проверяем, прошло ли 7 дней или кратно 7
-            if days_since_start < 7:
-                return False
-            
-            # Проверяем, не отправляли ли уже напоминание в этот период
-            if last_reminder_date:
-                days_since_last = (current_date - last_reminder_date).days
-                if days_since_last < 7:
-                    return False
-            
-            # Проверяем, что сегодня кратно 7 дням от начала
-            return days_since_start % 7 == 0
+        Args:
+            rental: Аренда (строка get_active_rentals_by_ids или изменяющего запроса)
+            after: Самый ранний допустимый срок (по умолчанию - первая необработанная минута)
+        """
+        rental_id = rental['id']
+        fire_at = None
+        if rental.get('is_active', 1):
+            after = after or self._schedule_from()
+            # Изменяющие функции уже пересчитали next_reminder_at; срок раньше
+            # after (уже обработанная минута) пересчитывается заново
+            fire_at = parse_reminder_at(rental.get('next_reminder_at'))
+            if fire_at is None or fire_at < after:
+                fire_at = next_reminder_at(rental, after)
         
-        elif reminder_type == 'monthly':
-            # Ежемесячно - каждые 30 дней от начала аренды
-            days_since_start = (current_date - start_date).days
-            
-            # Проверяем, прошло ли 30 дней
-            if days_since_start < 30:
-                return False
-            
-            # Проверяем, не отправляли ли уже напоминание в этот период
-            if last_reminder_date:
-                days_since_last = (current_date - last_reminder_date).days
-                if days_since_last < 30:
-                    return False
-            
-            # Проверяем, что сегодня кратно 30 дням от начала
-            return days_since_start % 30 == 0
+        if fire_at is None:
+            # Запись в куче остается и будет пропущена как устаревшая
+            self._next_fire.pop(rental_id, None)
+            return
+        self._push(rental_id, fire_at)
+    
+    def _push(self, rental_id: int, fire_at: datetime):
+        """Ставит срок аренды в кучу (прежний срок становится устаревшим)"""
+        if self._next_fire.get(rental_id) == fire_at:
+            return
+        self._next_fire[rental_id] = fire_at
+        heapq.heappush(self._heap, (fire_at, rental_id))
+        self._wakeup.set()
+    
+    def _schedule_from(self) -> datetime:
+        """Самый ранний момент, на который можно назначить напоминание"""
+        # Текущая минута еще не пропущена: напоминание на нее отправится сразу
+        start = datetime.now().replace(second=0, microsecond=0)
+        if self._processed_until is not None and self._processed_until > start:
+            return self._processed_until
+        return start
+    
+    def _peek(self) -> Optional[datetime]:
+        """Время ближайшего актуального напоминания (устаревшие записи отбрасываются)"""
+        while self._heap:
+            fire_at, rental_id = self._heap[0]
+            if self._next_fire.get(rental_id) == fire_at:
+                return fire_at
+            heapq.heappop(self._heap)
+        return None
+    
+    async def _sleep_until_due(self):
+        """Спит до ближайшего напоминания или до изменения очереди"""
+        self._wakeup.clear()
+        delay = REMINDER_MAX_SLEEP
+        next_fire = self._peek()
+        if next_fire is not None:
+            delay = min(delay, (next_fire - datetime.now()).total_seconds())
+        if delay <= 0:
+            return
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _fire_due(self, now: datetime):
+        """Отправляет все наступившие напоминания и планирует следующие"""
+        due: Dict[int, datetime] = {}
+        while (next_fire := self._peek()) is not None and next_fire <= now:
+            fire_at, rental_id = heapq.heappop(self._heap)
+            del self._next_fire[rental_id]
+            due[rental_id] = fire_at
+        # Все сроки до текущей минуты включительно обработаны
+        processed_until = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        if self._processed_until is None or processed_until > self._processed_until:
+            self._processed_until = processed_until
+        if not due:
+            return
         
-        return False
+        # Аренды перечитываются одним запросом на день: данные могли измениться,
+        # поэтому положено ли напоминание, решает условие в SQL, а завершенные
+        # аренды в результат не попадут
+        by_date: Dict[date, List[int]] = {}
+        for rental_id, fire_at in due.items():
+            by_date.setdefault(fire_at.date(), []).append(rental_id)
+        try:
+            due_rentals = []
+            for fire_date, rental_ids in sorted(by_date.items()):
+                due_rentals.extend(await get_active_rentals_by_ids(rental_ids, due_on=fire_date))
+            # Аренды, которым напоминание уже не положено (изменены в обход
+            # subscribe_rental_changes), перечитываются только для перепланирования
+            skipped = set(due) - {rental['id'] for rental in due_rentals}
+            other_rentals = await get_active_rentals_by_ids(list(skipped)) if skipped else []
+        except Exception:
+            # Возвращаем сроки в очередь: цикл повторит попытку
+            for rental_id, fire_at in due.items():
+                self._next_fire[rental_id] = fire_at
+                heapq.heappush(self._heap, (fire_at, rental_id))
+            raise
+        
+        to_send: List[Tuple[Mapping[str, Any], datetime]] = []
+        for rental in due_rentals:
+            fire_at = due[rental['id']]
+            # Время напоминания могли изменить в обход subscribe_rental_changes
+            if parse_reminder_time(rental) == fire_at.time():
+                to_send.append((rental, fire_at))
+            # Следующий срок не зависит от того, дойдет ли напоминание: все дни
+            # до _processed_until уже обработаны. Планируем до отправки, чтобы
+            # изменения аренды во время отправки (subscribe_rental_changes) не
+            # перезаписывались устаревшей строкой
+            self.schedule_rental(rental)
+        for rental in other_rentals:
+            self.schedule_rental(rental)
+        
+        sent = await self._dispatch(to_send) if to_send else {}
+        # Сроки берутся после отправки: изменения аренд за время отправки уже
+        # учтены в очереди через subscribe_rental_changes
+        fetched = [rental['id'] for rental in (*due_rentals, *other_rentals)]
+        await update_rentals_reminders(sent, {rental_id: self._next_fire.get(rental_id) for rental_id in fetched})
+    
+    async def _dispatch(self, reminders: List[Tuple[Mapping[str, Any], datetime]]) -> Dict[int, str]:
+        """
+        Отправляет напоминания группой из REMINDER_SEND_CONCURRENCY отправителей
+        
+        Частоту ограничивает общий для планировщика SendRateLimiter (лимиты
+        Telegram на бота и на чат). Итоги пачки (скорость и задержка
+        относительно срока) пишутся в лог и сохраняются в last_dispatch_stats.
+        
+        Returns:
+            ID аренды -> дата напоминания для успешно отправленных
+        """
+        pending = iter(reminders)
+        sent: Dict[int, str] = {}
+        lags: List[float] = []
+        started = time.monotonic()
+        
+        async def worker():
+            # Общий итератор: каждое напоминание забирает ровно один отправитель
+            for rental, fire_at in pending:
+                fire_date = fire_at.date()
+                if await self._send_reminder(rental, fire_date):
+                    sent[rental['id']] = fire_date.strftime('%Y-%m-%d')
+                    lags.append((datetime.now() - fire_at).total_seconds())
+        
+        await asyncio.gather(*(worker() for _ in range(min(REMINDER_SEND_CONCURRENCY, len(reminders)))))
+        
+        elapsed = time.monotonic() - started
+        self.last_dispatch_stats = {
+            'total': len(reminders),
+            'sent': len(sent),
+            'elapsed': elapsed,
+            'rate': len(sent) / elapsed if elapsed > 0 else float(len(sent)),
+            'max_lag': max(lags, default=0.0),
+            'avg_lag': sum(lags) / len(lags) if lags else 0.0,
+        }
+        stats = self.last_dispatch_stats
+        logger.info(
+            f"📨 Напоминания: отправлено {stats['sent']} из {stats['total']} за {stats['elapsed']:.1f} с "
+            f"({stats['rate']:.1f}/с), задержка от срока: средняя {stats['avg_lag']:.1f} с, "
+            f"максимальная {stats['max_lag']:.1f} с"
+        )
+        return sent
     
-    async def _send_reminder(self, rental: Dict[str, Any], reminder_date: date):
-        """Отправка напоминания пользователю"""
+    async def _send_reminder(self, rental: Mapping[str, Any], reminder_date: date) -> bool:
+        """
+        Отправка напоминания пользователю
+        
+        Дата последнего напоминания здесь не записывается: _fire_due отмечает
+        все отправленные напоминания пачки одним запросом.
+        
+        Returns:
+            True, если сообщение доставлено в Telegram
+        """
+        user_id = rental['user_id']
         try:
-            user_id = rental['user_id']
             car_name = rental.get('car_name', 'Автомобиль')
             daily_price = rental.get('daily_price', 0)
             reminder_type = rental.get('reminder_type', 'daily')
@@ -195,17 +391,24 @@ class PaymentReminderScheduler:
 
 📞 <i>Для оплаты свяжитесь с менеджером</i>"""
             
-            await self.bot.send_message(
-                chat_id=user_id,
-                text=text,
-                parse_mode='HTML'
-            )
-            
-            # Обновляем дату последнего напоминания
-            await update_rental_last_reminder(rental['id'], reminder_date.strftime('%Y-%m-%d'))
+            for attempt in range(REMINDER_SEND_RETRIES + 1):
+                await self._limiter.acquire(user_id)
+                try:
+                    await self.bot.send_message(
+                        chat_id=user_id,
+                        text=text,
+                        parse_mode='HTML'
+                    )
+                    break
+                except TelegramRetryAfter as e:
+                    # Превышен лимит: откладываем все отправки, а не только эту
+                    self._limiter.pause(e.retry_after)
+                    if attempt == REMINDER_SEND_RETRIES:
+                        raise
             
             logger.info(f"✅ Напоминание отправлено пользователю {user_id} (тип: {reminder_type})")
-            
+            return True
+
         except TelegramForbiddenError:
             # Пользователь заблокировал бота - это нормальная ситуация
             logger.warning(f"Пользователь {user_id} заблокировал бота, напоминание не отправлено")
@@ -213,6 +416,7 @@ class PaymentReminderScheduler:
             logger.warning(f"Ошибка Telegram API при отправке напоминания пользователю {user_id}: {e}")
         except Exception as e:
             logger.error(f"Неожиданная ошибка при отправке напоминания пользователю {user_id}: {e}")
+        return False
 
 # Глобальные экземпляры планировщиков
 scheduler: PaymentReminderScheduler = None
@@ -24,6 +24,30 @@ def temp_db_path(tmp_path: Path) -> Path:
     return tmp_path / "test_bot_database.db"
 
 
+@pytest.fixture
+async def empty_db(temp_db_path: Path, monkeypatch):
+    """Глобальный пул соединений (db_pool) на пустой временной БД с чистым кэшем"""
+    import bot.database.db_pool
+    from bot.database.db_pool import db_pool
+    from bot.utils.cache import cache
+    
+    monkeypatch.setattr(bot.database.db_pool, "DB_PATH", str(temp_db_path))
+    cache.clear()
+    await db_pool.initialize()
+    yield db_pool
+    await db_pool.close()
+    cache.clear()
+
+
+@pytest.fixture
+async def initialized_db(empty_db):
+    """Модуль database на временной БД со схемой через init_db"""
+    from bot.database import database
+    
+    await database.init_db()
+    return database
+
+
 @pytest.fixture
 def mock_bot():
     """Создает мок объект Bot"""
@@ -165,3 +189,10 @@ def reset_env_vars(monkeypatch):
 
 
 
+
+
+@pytest.fixture(autouse=True)
+def cache_debug_mode(monkeypatch):
+    """Глобальный кэш в режиме отладки: тест падает, если код изменяет закэшированные данные"""
+    from bot.utils.cache import cache
+    monkeypatch.setattr(cache, "debug", True)
@@ -166,10 +166,10 @@ class TestCarRepositoryIntegration:
         
         assert car1 == car2
         
-        # Проверяем, что значение в кэше
-        cached_value = cache.get(f"car:{car_id}")
-        assert cached_value is not None
-        assert cached_value['name'] == "Cached Car"
+        # Проверяем, что автомобиль в закэшированном каталоге
+        snapshot = cache.get("cars:catalog")
+        assert snapshot is not None
+        assert snapshot.by_id[car_id]['name'] == "Cached Car"
     
     @pytest.mark.asyncio
     async def test_cache_invalidation_on_update(self, car_repository, clean_cache):
@@ -189,11 +189,11 @@ class TestCarRepositoryIntegration:
         # Обновляем
         await car_repository.update(car_id, name="Updated Name")
         
-        # Кэш должен быть очищен
-        cached_value = cache.get(f"car:{car_id}")
-        assert cached_value is None
+        # Каталог обновлен сквозной записью, без повторной загрузки
+        snapshot = cache.get("cars:catalog")
+        assert snapshot is not None
+        assert snapshot.by_id[car_id]['name'] == "Updated Name"
         
-        # Новый запрос должен получить обновленные данные
         car = await car_repository.get_by_id(car_id)
         assert car['name'] == "Updated Name"
 
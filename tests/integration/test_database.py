@@ -6,7 +6,7 @@ import aiosqlite
 import tempfile
 import os
 from pathlib import Path
-from bot.database.db_pool import DatabasePool
+from bot.database.db_pool import DatabasePool, is_read_query
 from bot.database.models import ALL_TABLES
 
 
@@ -151,9 +151,1079 @@ class TestDatabasePool:
         await pool.close()
         
         assert pool._connection is None
+    
+    @pytest.mark.asyncio
+    async def test_reads_use_reader_connections(self, temp_db):
+        """Тест маршрутизации SELECT на соединения-читатели"""
+        pool, db_path = temp_db
+        
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        await pool.execute("INSERT INTO test_table (name) VALUES (?)", ("reader",))
+        await pool.commit()
+        
+        result = await pool.execute_fetchone("SELECT * FROM test_table WHERE name = ?", ("reader",))
+        stats = pool.get_stats()
+        
+        assert result['name'] == "reader"
+        assert stats['read_pool_size'] == len(pool._readers) > 0
+        assert stats['reads'] == 1
+        assert stats['acquires'] == 1
+        assert stats['idle_readers'] == stats['read_pool_size']
+    
+    @pytest.mark.asyncio
+    async def test_readers_are_query_only(self, temp_db):
+        """Тест, что читатели не могут изменять данные"""
+        pool, db_path = temp_db
+        
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        await pool.commit()
+        
+        with pytest.raises(Exception):
+            await pool._readers[0].execute("INSERT INTO test_table (name) VALUES ('x')")
+    
+    @pytest.mark.asyncio
+    async def test_acquire_timeout_falls_back_to_writer(self, temp_db):
+        """Тест выполнения чтения через писателя, когда все читатели заняты"""
+        pool, db_path = temp_db
+        pool.acquire_timeout = 0.01
+        
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        await pool.commit()
+        
+        # Забираем всех читателей
+        busy = [pool._idle_readers.get_nowait() for _ in pool._readers]
+        try:
+            result = await pool.execute_fetchall("SELECT * FROM test_table")
+        finally:
+            for reader in busy:
+                pool._idle_readers.put_nowait(reader)
+        
+        assert result == []
+        assert pool.get_stats()['acquire_timeouts'] == 1
+    
+    @pytest.mark.asyncio
+    async def test_pool_without_readers(self, tmp_path, monkeypatch):
+        """Тест пула без читателей: все запросы через писателя"""
+        import bot.database.db_pool
+        monkeypatch.setattr(bot.database.db_pool, "DB_PATH", str(tmp_path / "no_readers.db"))
+        pool = DatabasePool()
+        await pool.initialize(read_pool_size=0)
+        try:
+            await pool.execute("CREATE TABLE test_table (id INTEGER PRIMARY KEY, name TEXT)")
+            await pool.execute("INSERT INTO test_table (name) VALUES ('writer')")
+            # Незакоммиченные данные видны, т.к. чтение идет через то же соединение
+            result = await pool.execute_fetchone("SELECT name FROM test_table")
+            assert result['name'] == 'writer'
+            assert pool.get_stats()['read_pool_size'] == 0
+        finally:
+            await pool.close()
+            pool.read_pool_size = DatabasePool.read_pool_size
 
+    @pytest.mark.asyncio
+    async def test_writer_fallback_waits_for_transaction(self, tmp_path, monkeypatch):
+        """Тест, что чтение через писателя не видит чужую незафиксированную транзакцию"""
+        import asyncio
+        import bot.database.db_pool
+        monkeypatch.setattr(bot.database.db_pool, "DB_PATH", str(tmp_path / "no_readers.db"))
+        pool = DatabasePool()
+        await pool.initialize(read_pool_size=0)
+        try:
+            await pool.execute("CREATE TABLE test_table (id INTEGER PRIMARY KEY, name TEXT)")
+            await pool.commit()
+            entered = asyncio.Event()
 
+            async def failing_transaction():
+                async with pool.transaction():
+                    await pool.execute("INSERT INTO test_table (name) VALUES ('tx')")
+                    entered.set()
+                    await asyncio.sleep(0.05)
+                    raise RuntimeError("rollback")
 
+            async def concurrent_read():
+                await entered.wait()
+                return await pool.execute_fetchall("SELECT name FROM test_table")
 
+            results = await asyncio.gather(failing_transaction(), concurrent_read(), return_exceptions=True)
 
+            assert isinstance(results[0], RuntimeError)
+            assert results[1] == []
+        finally:
+            await pool.close()
+            pool.read_pool_size = DatabasePool.read_pool_size
 
+    
+    @pytest.mark.asyncio
+    async def test_write_queue_coalesces_concurrent_writes(self, temp_db):
+        """Тест групповой фиксации конкурентных записей"""
+        import asyncio
+        pool, db_path = temp_db
+        
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        await pool.commit()
+        
+        results = await asyncio.gather(*[
+            pool.write("INSERT INTO test_table (name) VALUES (?)", (f"name_{i}",))
+            for i in range(20)
+        ])
+        
+        assert sorted(r.lastrowid for r in results) == list(range(1, 21))
+        assert all(r.rowcount == 1 for r in results)
+        stats = pool.get_stats()
+        assert stats['queued_writes'] == 20
+        assert stats['write_batches'] < 20
+        # Данные зафиксированы и видны читателям
+        rows = await pool.execute_fetchall("SELECT * FROM test_table")
+        assert len(rows) == 20
+    
+    @pytest.mark.asyncio
+    async def test_write_queue_isolates_failed_statement(self, temp_db):
+        """Тест, что ошибка одного запроса не откатывает остальную пачку"""
+        import asyncio
+        pool, db_path = temp_db
+        
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+        await pool.commit()
+        
+        results = await asyncio.gather(
+            pool.write("INSERT INTO test_table (name) VALUES ('a')"),
+            pool.write("INSERT INTO test_table (name) VALUES ('a')"),
+            pool.write("INSERT INTO test_table (name) VALUES ('b')"),
+            return_exceptions=True
+        )
+        
+        assert isinstance(results[1], aiosqlite.IntegrityError)
+        rows = await pool.execute_fetchall("SELECT name FROM test_table ORDER BY name")
+        assert [row['name'] for row in rows] == ['a', 'b']
+    
+    @pytest.mark.asyncio
+    async def test_write_without_queue(self, temp_db):
+        """Тест прямой записи с немедленной фиксацией при выключенной очереди"""
+        pool, db_path = temp_db
+        pool.write_queue_enabled = False
+        try:
+            await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+            result = await pool.write("INSERT INTO test_table (name) VALUES ('direct')")
+        finally:
+            pool.write_queue_enabled = DatabasePool.write_queue_enabled
+        
+        assert result.lastrowid == 1
+        assert pool.get_stats()['write_batches'] == 0
+        row = await pool.execute_fetchone("SELECT name FROM test_table")
+        assert row['name'] == 'direct'
+    
+    @pytest.mark.asyncio
+    async def test_write_returning(self, temp_db):
+        """Тест INSERT/UPDATE ... RETURNING через очередь, без нее и в транзакции"""
+        pool, db_path = temp_db
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        await pool.commit()
+        
+        row = await pool.write_returning("INSERT INTO test_table (name) VALUES (?) RETURNING *", ("queued",))
+        assert row == {'id': 1, 'name': 'queued'}
+        
+        async with pool.transaction():
+            row = await pool.write_returning("UPDATE test_table SET name = ? WHERE id = 1 RETURNING name", ("tx",))
+        assert row == {'name': 'tx'}
+        
+        pool.write_queue_enabled = False
+        try:
+            row = await pool.write_returning("UPDATE test_table SET name = ? WHERE id = 2 RETURNING *", ("none",))
+        finally:
+            pool.write_queue_enabled = DatabasePool.write_queue_enabled
+        assert row is None
+    
+    @pytest.mark.asyncio
+    async def test_transaction_commit(self, temp_db):
+        """Тест фиксации транзакции при выходе из блока"""
+        pool, db_path = temp_db
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        await pool.commit()
+        
+        async with pool.transaction():
+            assert pool.in_transaction()
+            await pool.execute("INSERT INTO test_table (name) VALUES ('a')")
+            # Внутри транзакции чтение видит собственные изменения
+            row = await pool.execute_fetchone("SELECT COUNT(*) as count FROM test_table")
+            assert row['count'] == 1
+        
+        assert not pool.in_transaction()
+        row = await pool.execute_fetchone("SELECT COUNT(*) as count FROM test_table")
+        assert row['count'] == 1
+    
+    @pytest.mark.asyncio
+    async def test_transaction_rollback_on_error(self, temp_db):
+        """Тест отката транзакции при исключении"""
+        pool, db_path = temp_db
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        await pool.commit()
+        
+        with pytest.raises(RuntimeError):
+            async with pool.transaction():
+                await pool.execute("INSERT INTO test_table (name) VALUES ('a')")
+                await pool.write("INSERT INTO test_table (name) VALUES ('b')")
+                raise RuntimeError("boom")
+        
+        row = await pool.execute_fetchone("SELECT COUNT(*) as count FROM test_table")
+        assert row['count'] == 0
+        assert pool.get_stats()['rollbacks'] == 1
+    
+    @pytest.mark.asyncio
+    async def test_nested_transaction_savepoint(self, temp_db):
+        """Тест отката вложенного уровня без отката внешней транзакции"""
+        pool, db_path = temp_db
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        await pool.commit()
+        
+        async with pool.transaction():
+            await pool.execute("INSERT INTO test_table (name) VALUES ('outer')")
+            with pytest.raises(ValueError):
+                async with pool.transaction():
+                    await pool.execute("INSERT INTO test_table (name) VALUES ('inner')")
+                    raise ValueError("inner failure")
+        
+        rows = await pool.execute_fetchall("SELECT name FROM test_table")
+        assert [row['name'] for row in rows] == ['outer']
+    
+    @pytest.mark.asyncio
+    async def test_transaction_excludes_concurrent_writes(self, temp_db):
+        """Тест, что чужие записи не попадают внутрь открытой транзакции"""
+        import asyncio
+        pool, db_path = temp_db
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        await pool.commit()
+        
+        entered = asyncio.Event()
+        
+        async def failing_transaction():
+            async with pool.transaction():
+                await pool.execute("INSERT INTO test_table (name) VALUES ('tx')")
+                entered.set()
+                await asyncio.sleep(0.05)
+                raise RuntimeError("rollback")
+        
+        async def concurrent_write():
+            await entered.wait()
+            await pool.write("INSERT INTO test_table (name) VALUES ('other')")
+        
+        results = await asyncio.gather(failing_transaction(), concurrent_write(), return_exceptions=True)
+        
+        assert isinstance(results[0], RuntimeError)
+        rows = await pool.execute_fetchall("SELECT name FROM test_table")
+        # Откат транзакции не затронул запись, выполненную после нее
+        assert [row['name'] for row in rows] == ['other']
+    
+    @pytest.mark.asyncio
+    async def test_query_timing_and_slow_log(self, temp_db):
+        """Тест хронометража запросов и сбора плана медленных запросов"""
+        import asyncio
+        pool, db_path = temp_db
+        pool.query_metrics.reset()
+        original_threshold = pool.query_metrics.slow_threshold_ms
+        pool.query_metrics.slow_threshold_ms = 0  # Все запросы считаются медленными
+        try:
+            await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+            await pool.commit()
+            await pool.execute_fetchall("SELECT * FROM test_table WHERE id = ?", (1,))
+            await pool.execute_fetchall("SELECT * FROM test_table WHERE id = ?", (2,))
+            # Даем фоновой задаче собрать план
+            await asyncio.sleep(0.05)
+        finally:
+            pool.query_metrics.slow_threshold_ms = original_threshold
+        
+        stats = {item['sql']: item for item in pool.get_query_stats()}
+        select_stats = stats["SELECT * FROM test_table WHERE id = ?"]
+        assert select_stats['count'] == 2
+        
+        slow = pool.get_slow_queries()
+        assert slow[0]['sql'] == "SELECT * FROM test_table WHERE id = ?"
+        assert slow[0]['plan'] and 'test_table' in slow[0]['plan'][0]
+        assert not pool._plan_tasks
+        pool.query_metrics.reset()
+
+    @pytest.mark.asyncio
+    async def test_close_cancels_pending_plan_tasks(self, temp_db):
+        """Тест, что close() не оставляет незавершенных задач сбора плана"""
+        pool, db_path = temp_db
+        pool.query_metrics.reset()
+        original_threshold = pool.query_metrics.slow_threshold_ms
+        pool.query_metrics.slow_threshold_ms = 0
+        try:
+            await pool.execute_fetchall("SELECT 1")
+            tasks = set(pool._plan_tasks)
+            assert tasks
+            await pool.close()
+        finally:
+            pool.query_metrics.slow_threshold_ms = original_threshold
+            pool.query_metrics.reset()
+
+        assert all(task.done() for task in tasks)
+        assert not pool._plan_tasks
+
+    @pytest.mark.asyncio
+    async def test_iterate_streams_rows_in_batches(self, temp_db):
+        """Тест постраничной выборки: читатель не удерживается между порциями"""
+        pool, db_path = temp_db
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        for i in range(25):
+            await pool.execute("INSERT INTO test_table (name) VALUES (?)", (f"row{i}",))
+        await pool.commit()
+        
+        rows = []
+        async for row in pool.iterate("SELECT * FROM test_table WHERE id > ? ORDER BY id LIMIT ?", batch=10):
+            # Пока потребитель обрабатывает строку, все читатели свободны
+            assert pool.get_stats()['idle_readers'] == pool.read_pool_size
+            rows.append(row)
+        
+        assert len(rows) == 25
+        assert rows[0] == {'id': 1, 'name': 'row0'}
+        assert [row['id'] for row in rows] == list(range(1, 26))
+        # 3 порции по 10 строк: 10, 10, 5
+        assert pool.get_stats()['reads'] == 3
+    
+    @pytest.mark.asyncio
+    async def test_iterate_with_params_and_start(self, temp_db):
+        """Тест постраничной выборки с параметрами фильтра и начальным ключом"""
+        pool, db_path = temp_db
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        for i in range(10):
+            await pool.execute("INSERT INTO test_table (name) VALUES (?)", ("even" if i % 2 else "odd",))
+        await pool.commit()
+        
+        rows = [row async for row in pool.iterate(
+            "SELECT id FROM test_table WHERE name = ? AND id > ? ORDER BY id LIMIT ?",
+            ("odd",), start=2, batch=2
+        )]
+        
+        assert [row['id'] for row in rows] == [3, 5, 7, 9]
+
+    @pytest.mark.asyncio
+    async def test_iterate_early_exit_releases_reader(self, temp_db):
+        """Тест досрочного выхода из итерации"""
+        pool, db_path = temp_db
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        for i in range(5):
+            await pool.execute("INSERT INTO test_table (name) VALUES (?)", (f"row{i}",))
+        await pool.commit()
+
+        async for row in pool.iterate("SELECT * FROM test_table WHERE id > ? ORDER BY id LIMIT ?", batch=2):
+            break
+
+        assert row['name'] == 'row0'
+        assert pool.get_stats()['idle_readers'] == pool.read_pool_size
+
+    @pytest.mark.asyncio
+    async def test_fetchall_compact_rows(self, temp_db):
+        """Тест компактного представления результата execute_fetchall"""
+        from bot.database.rows import CompactRow
+        pool, db_path = temp_db
+        await pool.execute("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        await pool.execute("INSERT INTO test_table (name) VALUES (?)", ("first",))
+        await pool.commit()
+        
+        plain = await pool.execute_fetchall("SELECT * FROM test_table")
+        compact = await pool.execute_fetchall("SELECT * FROM test_table", compact=True)
+        
+        assert isinstance(compact[0], CompactRow)
+        assert compact == plain
+        assert compact[0]['name'] == "first"
+
+class TestIsReadQuery:
+    """Тесты классификации запросов по типу"""
+    
+    @pytest.mark.parametrize("query,expected", [
+        ("SELECT * FROM users", True),
+        ("  select id FROM cars", True),
+        ("WITH t AS (SELECT 1) SELECT * FROM t", True),
+        ("EXPLAIN QUERY PLAN SELECT * FROM cars", True),
+        ("INSERT INTO users (telegram_id) VALUES (?)", False),
+        ("UPDATE rentals SET is_active = 0", False),
+        ("WITH t AS (SELECT 1) DELETE FROM cars", False),
+        ("PRAGMA table_info(cars)", False),
+        ("CREATE TABLE x (id INTEGER)", False),
+    ])
+    def test_is_read_query(self, query, expected):
+        """Тест определения запросов только на чтение"""
+        assert is_read_query(query) is expected
+
+
+class TestAtomicOperations:
+    """Integration тесты многошаговых и конкурентных операций database.py на реальной БД"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_add_rental_creates_single_rental(self, initialized_db):
+        """Тест, что параллельные add_rental создают только одну активную аренду"""
+        import asyncio
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        car_id = await database.add_car("Car", None, 1000)
+        
+        results = await asyncio.gather(*[database.add_rental(111, car_id, 1000) for _ in range(5)])
+        
+        assert sum(1 for rental_id in results if rental_id) == 1
+    
+    @pytest.mark.asyncio
+    async def test_delete_car_removes_rentals_atomically(self, initialized_db):
+        """Тест удаления автомобиля вместе с завершенными арендами"""
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        car_id = await database.add_car("Car", None, 1000)
+        rental_id = await database.add_rental(111, car_id, 1000)
+        
+        # С активной арендой удалить нельзя
+        assert await database.delete_car(car_id) is False
+        
+        await database.end_rental(rental_id)
+        assert await database.delete_car(car_id) is True
+        assert await database.get_car_by_id(car_id) is None
+        assert await database.get_rental_by_id(rental_id) is None
+        assert await database.delete_car(car_id) is False
+    
+    @pytest.mark.asyncio
+    async def test_ensure_user_referral_code_is_stable(self, initialized_db):
+        """Тест, что реферальный код назначается один раз"""
+        import asyncio
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        
+        codes = await asyncio.gather(*[database.ensure_user_referral_code(111) for _ in range(3)])
+        
+        assert len(set(codes)) == 1
+        user = await database.get_user_by_id(111)
+        assert user['referral_code'] == codes[0]
+    
+    @pytest.mark.asyncio
+    async def test_update_contact_upsert(self, initialized_db):
+        """Тест создания и обновления контакта"""
+        database = initialized_db
+        
+        assert await database.update_contact('support', name='Анна') is True
+        assert await database.update_contact('support', phone='+7 900 000-00-00') is True
+        
+        contact = await database.get_contact('support')
+        assert contact['name'] == 'Анна'
+        assert contact['phone'] == '+7 900 000-00-00'
+
+
+class TestReturningMutations:
+    """Integration тесты изменяющих функций, возвращающих строку через RETURNING"""
+    
+    @pytest.mark.asyncio
+    async def test_rental_mutations_return_updated_row(self, initialized_db):
+        """Тест, что изменения аренды возвращают строку в форме get_rental_by_id без повторного SELECT"""
+        from bot.utils.cache import cache
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        car_id = await database.add_car("Car", None, 1000)
+        rental_id = await database.add_rental(111, car_id, 1000)
+        await database.get_active_rental_by_user(111)
+        assert cache.get("rental:user:111") is not None
+        
+        database.db_pool.query_metrics.reset()
+        rental = await database.update_rental_reminder_time(rental_id, "09:30")
+        
+        stats = database.db_pool.get_query_stats()
+        # Второй UPDATE пересчитывает next_reminder_at; повторного SELECT нет
+        assert len(stats) == 2 and all(stat['sql'].startswith("UPDATE rentals") for stat in stats)
+        assert rental == await database.get_rental_by_id(rental_id)
+        assert rental['reminder_time'] == "09:30"
+        assert rental['car_name'] == "Car"
+        assert cache.get("rental:user:111") is None
+        
+        assert (await database.update_rental_deposit_status(rental_id, 'paid'))['deposit_status'] == 'paid'
+        assert (await database.update_rental_end_date(rental_id, '2030-01-01'))['end_date'] == '2030-01-01'
+        assert (await database.update_rental_reminder_type(rental_id, 'weekly'))['reminder_type'] == 'weekly'
+        assert (await database.update_rental_last_reminder(rental_id, '2030-01-01'))['last_reminder_date'] == '2030-01-01'
+        assert (await database.end_rental(rental_id))['is_active'] == 0
+        assert await database.end_rental(rental_id + 100) is None
+
+
+class TestCachedReads:
+    """Integration тесты кэширования чтений database.py и каталога автомобилей"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_cache_misses_run_single_query(self, initialized_db):
+        """Тест, что одновременные промахи кэша выполняют один запрос к БД"""
+        import asyncio
+        database = initialized_db
+        await database.add_car("Car", None, 1000)
+        await database.add_admin(42)
+        
+        database.db_pool.query_metrics.reset()
+        cars, admins = await asyncio.gather(
+            asyncio.gather(*[database.get_all_cars(available_only=True) for _ in range(10)]),
+            asyncio.gather(*[database.is_admin(42) for _ in range(10)]),
+        )
+        
+        assert all(result is cars[0] for result in cars)
+        assert all(admins)
+        assert sorted(stats['count'] for stats in database.db_pool.get_query_stats()) == [1, 1]
+    
+    @pytest.mark.asyncio
+    async def test_missing_rental_and_car_are_cached(self, initialized_db):
+        """Тест, что отсутствие аренды и автомобиля читается из кэша и сбрасывается при изменениях"""
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        
+        database.db_pool.query_metrics.reset()
+        assert await database.get_active_rental_by_user(111) is None
+        assert await database.get_active_rental_by_user(111) is None
+        assert await database.get_car_by_id(1) is None
+        assert await database.get_car_by_id(1) is None
+        assert sum(stats['count'] for stats in database.db_pool.get_query_stats()) == 2
+        
+        car_id = await database.add_car("Car", None, 1000)
+        assert car_id == 1
+        assert (await database.get_car_by_id(car_id))['name'] == "Car"
+        
+        rental_id = await database.add_rental(111, car_id, 1000)
+        assert (await database.get_active_rental_by_user(111))['id'] == rental_id
+        
+        await database.end_rental(rental_id)
+        assert await database.get_active_rental_by_user(111) is None
+    
+    @pytest.mark.asyncio
+    async def test_car_update_invalidates_derived_rental_entries(self, initialized_db):
+        """Тест, что изменение автомобиля инвалидирует и закэшированные аренды с его названием"""
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        car_id = await database.add_car("Car", None, 1000)
+        await database.add_rental(111, car_id, 1000)
+        
+        assert (await database.get_active_rental_by_user(111))['car_name'] == "Car"
+        assert (await database.get_all_active_rentals())[0]['car_name'] == "Car"
+        
+        await database.update_car(car_id, name="Renamed")
+        
+        assert (await database.get_car_by_id(car_id))['name'] == "Renamed"
+        assert (await database.get_active_rental_by_user(111))['car_name'] == "Renamed"
+        assert (await database.get_all_active_rentals())[0]['car_name'] == "Renamed"
+    
+    @pytest.mark.asyncio
+    async def test_reminder_marks_refresh_active_rentals(self, initialized_db):
+        """Тест, что отметка напоминания не оставляет устаревший список активных аренд"""
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        car_id = await database.add_car("Car", None, 1000)
+        rental_id = await database.add_rental(111, car_id, 1000)
+        assert (await database.get_all_active_rentals())[0]['last_reminder_date'] is None
+        
+        await database.update_rental_last_reminder(rental_id, "2024-03-10")
+        
+        assert (await database.get_all_active_rentals())[0]['last_reminder_date'] == "2024-03-10"
+        
+        await database.update_rentals_reminders({rental_id: "2024-03-11"}, {})
+        
+        assert (await database.get_all_active_rentals())[0]['last_reminder_date'] == "2024-03-11"
+    
+    @pytest.mark.asyncio
+    async def test_car_catalog_reads_without_queries(self, initialized_db):
+        """Тест, что после загрузки каталога чтения автомобилей не обращаются к БД"""
+        database = initialized_db
+        first = await database.add_car("First", None, 7000)
+        second = await database.add_car("Second", None, 5000)
+        await database.get_all_cars()
+        
+        await database.update_car(second, available=False)
+        third = await database.add_car("Third", None, 6000)
+        await database.delete_car(first)
+        
+        database.db_pool.query_metrics.reset()
+        assert [car['id'] for car in await database.get_all_cars()] == [third, second]
+        assert [car['id'] for car in await database.get_all_cars(available_only=True)] == [third]
+        assert (await database.get_car_by_id(second))['available'] == 0
+        assert await database.get_car_by_id(first) is None
+        assert await database.get_min_car_price() == 6000
+        assert database.db_pool.get_query_stats() == []
+
+
+class TestReminderQueries:
+    """Integration тесты запросов и колонок, на которых работает планировщик напоминаний"""
+    
+    @pytest.mark.asyncio
+    async def test_rental_changes_are_published(self, initialized_db):
+        """Тест, что изменения аренд, влияющие на напоминания, передаются подписчикам"""
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        car_id = await database.add_car("Car", None, 1000)
+        changes = []
+        database.subscribe_rental_changes(changes.append)
+        try:
+            rental_id = await database.add_rental(111, car_id, 1000, reminder_time="09:00")
+            await database.update_rental_reminder_time(rental_id, "10:30")
+            await database.update_rental_reminder_type(rental_id, "weekly")
+            await database.update_rental_last_reminder(rental_id, "2024-01-01")
+            await database.end_rental(rental_id)
+        finally:
+            database.unsubscribe_rental_changes(changes.append)
+        
+        assert [change['id'] for change in changes] == [rental_id] * 5
+        assert changes[0]['reminder_time'] == "09:00"
+        assert changes[0]['car_name'] == "Car"
+        assert changes[1]['reminder_time'] == "10:30"
+        assert changes[2]['reminder_type'] == "weekly"
+        assert changes[3]['last_reminder_date'] == "2024-01-01"
+        assert changes[4]['is_active'] == 0
+        
+        active = await database.get_active_rentals_by_ids([rental_id])
+        assert active == []
+    
+    @pytest.mark.asyncio
+    async def test_repository_changes_reach_scheduler(self, initialized_db):
+        """Тест, что изменения аренд через RentalRepository видит планировщик"""
+        from unittest.mock import Mock
+        from bot.database.repositories.rental_repository import RentalRepository
+        from bot.utils.scheduler import PaymentReminderScheduler
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        car_id = await database.add_car("Car", None, 1000)
+        repository = RentalRepository()
+        scheduler = PaymentReminderScheduler(Mock())
+        database.subscribe_rental_changes(scheduler.schedule_rental)
+        try:
+            rental_id = await repository.create(111, car_id, 1000, reminder_time="09:00")
+            fire_at = scheduler._next_fire[rental_id]
+            assert (fire_at.hour, fire_at.minute) == (9, 0)
+            assert (await repository.get_by_id(rental_id))['next_reminder_at'] is not None
+        
+            assert await repository.update_reminder_time(rental_id, "10:30")
+            fire_at = scheduler._next_fire[rental_id]
+            assert (fire_at.hour, fire_at.minute) == (10, 30)
+        
+            assert await repository.end(rental_id)
+            assert rental_id not in scheduler._next_fire
+            assert not await repository.end(rental_id + 1)
+        finally:
+            database.unsubscribe_rental_changes(scheduler.schedule_rental)
+    
+    @pytest.mark.asyncio
+    async def test_next_reminder_is_maintained(self, initialized_db, monkeypatch):
+        """Тест, что next_reminder_at пересчитывается изменяющими функциями аренды"""
+        from datetime import datetime, timedelta
+        from bot.utils.reminders import next_reminder_at, format_reminder_at
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        car_id = await database.add_car("Car", None, 1000)
+        
+        # Часы замораживаются на полудне: результат не зависит от того,
+        # запущен ли тест около полуночи
+        now = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return now
+        
+        monkeypatch.setattr(database, "datetime", FrozenDatetime)
+        
+        def expected(rental):
+            return format_reminder_at(next_reminder_at(rental, now))
+        
+        rental_id = await database.add_rental(111, car_id, 1000, reminder_time="23:59")
+        rental = await database.get_rental_by_id(rental_id)
+        assert rental['next_reminder_at'] == expected(rental)
+        assert rental['next_reminder_at'] == f"{now:%Y-%m-%d} 23:59"
+        
+        rental = await database.update_rental_reminder_time(rental_id, "00:00")
+        tomorrow = now.date() + timedelta(days=1)
+        assert rental['next_reminder_at'] == f"{tomorrow:%Y-%m-%d} 00:00"
+        
+        rental = await database.update_rental_reminder_type(rental_id, "monthly")
+        assert rental['next_reminder_at'] == expected(rental)
+        assert rental['next_reminder_at'] > f"{tomorrow + timedelta(days=28):%Y-%m-%d}"
+        
+        rental = await database.update_rental_reminder_type(rental_id, "unknown")
+        assert rental['next_reminder_at'] is None
+        
+        await database.update_rental_reminder_type(rental_id, "daily")
+        rental = await database.end_rental(rental_id)
+        assert rental['next_reminder_at'] is None
+        assert await database.get_next_reminders() == []
+    
+    @pytest.mark.asyncio
+    async def test_mark_reminders_in_one_update(self, initialized_db):
+        """Тест, что даты и сроки напоминаний пачки записываются одним запросом"""
+        from datetime import datetime
+        database = initialized_db
+        car_id = await database.add_car("Car", None, 1000)
+        rental_ids = []
+        for telegram_id in (111, 222, 333):
+            await database.add_user(telegram_id, "user", "User")
+            rental_ids.append(await database.add_rental(telegram_id, car_id, 1000))
+        await database.get_active_rental_by_user(111)
+        changes = []
+        database.subscribe_rental_changes(changes.append)
+        
+        database.db_pool.query_metrics.reset()
+        try:
+            updated = await database.update_rentals_reminders(
+                {rental_ids[0]: "2024-03-10", rental_ids[1]: "2024-03-09"},
+                {rental_ids[0]: datetime(2024, 3, 11, 12, 0)},
+            )
+        finally:
+            database.unsubscribe_rental_changes(changes.append)
+        
+        assert [stats['count'] for stats in database.db_pool.get_query_stats()] == [1]
+        assert {rental['id']: rental['last_reminder_date'] for rental in updated} == {
+            rental_ids[0]: "2024-03-10", rental_ids[1]: "2024-03-09",
+        }
+        next_reminders = {rental['id']: rental['next_reminder_at'] for rental in updated}
+        assert next_reminders[rental_ids[0]] == "2024-03-11 12:00"
+        # Аренда без нового срока в пачке сохраняет прежний
+        assert next_reminders[rental_ids[1]] is not None
+        assert sorted(change['id'] for change in changes) == rental_ids[:2]
+        assert (await database.get_active_rental_by_user(111))['last_reminder_date'] == "2024-03-10"
+        assert (await database.get_rental_by_id(rental_ids[2]))['last_reminder_date'] is None
+        assert await database.update_rentals_reminders({}, {}) == []
+    
+    @pytest.mark.asyncio
+    async def test_due_condition_matches_scheduler(self, initialized_db):
+        """Тест, что REMINDER_DUE_CONDITION совпадает с правилом планировщика на случайных датах"""
+        import random
+        from datetime import date, timedelta
+        from bot.utils.reminders import should_send_reminder
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        car_id = await database.add_car("Car", None, 1000)
+        rng = random.Random(20240310)
+        base = date(2024, 1, 1)
+        
+        rentals = []
+        for _ in range(150):
+            start = base + timedelta(days=rng.randint(0, 365))
+            start_date = rng.choice([
+                f"{start:%Y-%m-%d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+                f"{start:%Y-%m-%d}T08:15:00",
+                start.isoformat(),
+            ])
+            last = start + timedelta(days=rng.randint(-2, 120))
+            last_reminder_date = rng.choice([None, None, last.isoformat()])
+            reminder_type = rng.choice(['daily', 'weekly', 'monthly', 'unknown'])
+            result = await database.db_pool.write(
+                """INSERT INTO rentals (user_id, car_id, daily_price, reminder_type,
+                                        start_date, last_reminder_date)
+                   VALUES (111, ?, 1000, ?, ?, ?)""",
+                (car_id, reminder_type, start_date, last_reminder_date)
+            )
+            rentals.append({
+                'id': result.lastrowid, 'reminder_type': reminder_type,
+                'start_date': start_date, 'last_reminder_date': last_reminder_date,
+            })
+        ids = [rental['id'] for rental in rentals]
+        
+        checked = due_count = 0
+        for _ in range(60):
+            day = base + timedelta(days=rng.randint(-5, 500))
+            due = await database.get_active_rentals_by_ids(ids, due_on=day)
+            expected = {rental['id'] for rental in rentals
+                        if should_send_reminder(rental, day)}
+            assert {rental['id'] for rental in due} == expected, day
+            checked += len(rentals)
+            due_count += len(expected)
+        
+        # Случайные даты покрывают обе ветви условия
+        assert checked == 9000
+        assert 0 < due_count < checked
+
+
+class TestUserQueries:
+    """Integration тесты выборок пользователей без загрузки всей таблицы"""
+    
+    @pytest.mark.asyncio
+    async def test_user_aggregates_without_materializing(self, initialized_db):
+        """Тест подсчета пользователей и выгрузки порциями"""
+        database = initialized_db
+        for telegram_id in range(1, 6):
+            await database.add_user(telegram_id, f"user{telegram_id}", "User")
+        await database.update_user_source(1, 'ads')
+        
+        assert await database.get_users_count() == 5
+        chunks = [chunk async for chunk in database.get_users_chunked(chunk_size=2)]
+        assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+        sources = await database.get_users_by_source()
+        assert sources['ads'] == 1
+
+
+class TestMigrations:
+    """Integration тесты версионных миграций схемы"""
+    
+    @pytest.mark.asyncio
+    async def test_fresh_database_gets_latest_version(self, empty_db):
+        """Тест применения всех миграций к новой БД"""
+        pool = empty_db
+        from bot.database.migrations import run_migrations, get_schema_version, latest_version
+        
+        applied = await run_migrations(pool)
+        
+        assert applied == latest_version()
+        assert await get_schema_version(pool) == latest_version()
+        columns = {row['name'] for row in await pool.execute_fetchall("PRAGMA table_info(users)")}
+        assert {'referral_code', 'referrer_id', 'source'} <= columns
+        contact = await pool.execute_fetchone("SELECT * FROM contacts WHERE contact_type = 'booking'")
+        assert contact is not None
+    
+    @pytest.mark.asyncio
+    async def test_up_to_date_database_is_single_read(self, empty_db):
+        """Тест, что актуальная схема проверяется одним запросом"""
+        pool = empty_db
+        from bot.database.migrations import run_migrations
+        await run_migrations(pool)
+        pool.query_metrics.reset()
+        
+        assert await run_migrations(pool) == 0
+        
+        stats = pool.get_query_stats()
+        assert sum(item['count'] for item in stats) == 1
+        assert stats[0]['sql'] == "PRAGMA user_version"
+    
+    @pytest.mark.asyncio
+    async def test_next_reminder_backfill(self, empty_db):
+        """Тест, что миграция 10 заполняет next_reminder_at активных аренд"""
+        pool = empty_db
+        from datetime import datetime, timedelta
+        from bot.database.migrations import MIGRATIONS, run_migrations
+        async with pool.transaction():
+            db = await pool.get_connection()
+            for step in MIGRATIONS[:9]:
+                await step.apply(db)
+            await db.execute("PRAGMA user_version = 9")
+        start = (datetime.now() - timedelta(days=3)).strftime('%Y-%m-%d %H:%M:%S')
+        await pool.write("INSERT INTO users (telegram_id) VALUES (111), (222)")
+        await pool.write("INSERT INTO cars (id, name, daily_price) VALUES (1, 'Car', 1000)")
+        await pool.write(
+            """INSERT INTO rentals (user_id, car_id, daily_price, reminder_type, reminder_time, start_date, is_active)
+               VALUES (111, 1, 1000, 'weekly', '10:00', ?, 1), (222, 1, 1000, 'daily', '10:00', ?, 0)""",
+            (start, start)
+        )
+        
+        await run_migrations(pool)
+        
+        rows = await pool.execute_fetchall("SELECT user_id, next_reminder_at FROM rentals ORDER BY user_id")
+        in_four_days = datetime.now().date() + timedelta(days=4)
+        assert [(row['user_id'], row['next_reminder_at']) for row in rows] == [(111, f"{in_four_days:%Y-%m-%d} 10:00"), (222, None)]
+        plan = await pool.execute_fetchall(
+            "EXPLAIN QUERY PLAN SELECT id, next_reminder_at FROM rentals WHERE is_active = 1"
+        )
+        assert any('COVERING INDEX idx_rentals_active_next_reminder' in row['detail'] for row in plan)
+    
+    @pytest.mark.asyncio
+    async def test_legacy_database_is_upgraded(self, empty_db):
+        """Тест обновления БД, созданной до появления версий схемы"""
+        pool = empty_db
+        from bot.database.migrations import run_migrations, get_schema_version, latest_version
+        # Таблица users в исходном виде, без колонок рефералов и источника
+        await pool.execute(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "telegram_id INTEGER UNIQUE NOT NULL, username TEXT, first_name TEXT, "
+            "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        )
+        await pool.execute("INSERT INTO users (telegram_id) VALUES (111)")
+        await pool.commit()
+        
+        await run_migrations(pool)
+        
+        assert await get_schema_version(pool) == latest_version()
+        user = await pool.execute_fetchone("SELECT * FROM users WHERE telegram_id = 111")
+        assert 'source' in user and user['source'] is None
+    
+    @pytest.mark.asyncio
+    async def test_failed_migration_rolls_back(self, empty_db, monkeypatch):
+        """Тест отката всех миграций при ошибке"""
+        pool = empty_db
+        from bot.database import migrations
+        
+        async def broken(db):
+            raise RuntimeError("broken migration")
+        
+        registry = migrations.MIGRATIONS[:1] + [migrations.Migration(2, "broken", broken)]
+        monkeypatch.setattr(migrations, "MIGRATIONS", registry)
+        
+        with pytest.raises(RuntimeError):
+            await migrations.run_migrations(pool)
+        
+        assert await migrations.get_schema_version(pool) == 0
+        tables = await pool.execute_fetchall("SELECT name FROM sqlite_master WHERE type = 'table'")
+        assert tables == []
+    
+    def test_registry_is_ordered(self):
+        """Тест, что версии миграций идут подряд с 1"""
+        from bot.database.migrations import MIGRATIONS
+        assert [step.version for step in MIGRATIONS] == list(range(1, len(MIGRATIONS) + 1))
+
+
+class TestQueryPlans:
+    """Проверка, что горячие запросы database.py используют предназначенные им индексы"""
+    
+    @pytest.fixture
+    def database(self, initialized_db, monkeypatch):
+        """БД со схемой через init_db и перехватом текста выполняемых запросов"""
+        queries = []
+        
+        def capture(original):
+            def wrapper(self, query, params=(), *args, **kwargs):
+                queries.append((query, params))
+                return original(self, query, params, *args, **kwargs)
+            return wrapper
+        
+        for name in ('execute_fetchone', 'execute_fetchall'):
+            monkeypatch.setattr(DatabasePool, name, capture(getattr(DatabasePool, name)))
+        
+        return initialized_db, queries
+    
+    @staticmethod
+    async def _plan(database, queries, marker):
+        """План последнего перехваченного запроса, содержащего marker"""
+        query, params = next(item for item in reversed(queries) if marker in item[0])
+        rows = await database.db_pool.execute_fetchall("EXPLAIN QUERY PLAN " + query, params)
+        return " | ".join(row['detail'] for row in rows)
+    
+    @pytest.mark.asyncio
+    async def test_scheduler_queries_use_indexes(self, database):
+        """Тест выборок планировщика: очередь при запуске и аренды наступившего срока"""
+        from datetime import date
+        database, queries = database
+        
+        await database.get_next_reminders()
+        await database.get_active_rentals_by_ids([1, 2, 3], due_on=date(2024, 1, 8))
+        
+        plan = await self._plan(database, queries, "next_reminder_at FROM rentals")
+        assert "USING COVERING INDEX idx_rentals_active_next_reminder" in plan
+        plan = await self._plan(database, queries, "r.id IN")
+        assert "SEARCH r USING INTEGER PRIMARY KEY (rowid=?)" in plan
+        assert "SCAN r" not in plan
+        # Индекс прежней выборки по reminder_time удален миграцией 11
+        indexes = await database.db_pool.execute_fetchall(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'idx_rentals_active_reminder_time'"
+        )
+        assert indexes == []
+    
+    @pytest.mark.asyncio
+    async def test_active_rental_by_user_uses_composite_index(self, database):
+        """Тест поиска активной аренды пользователя"""
+        database, queries = database
+        
+        await database.get_active_rental_by_user(111)
+        
+        plan = await self._plan(database, queries, "r.user_id = ?")
+        assert "idx_rentals_user_active_created (user_id=? AND is_active=?)" in plan
+        assert "TEMP B-TREE" not in plan
+    
+    @pytest.mark.asyncio
+    async def test_referral_queries_use_covering_index(self, database):
+        """Тест проверки и статистики реферальных скидок"""
+        database, queries = database
+        await database.add_user(111, "user", "User")
+        await database.add_user(222, "referrer", "Referrer")
+        await database.set_user_referrer(111, 222)
+        await database.set_setting('referral_system_enabled', 'true')
+        
+        await database.check_user_referral_bonus_eligibility(111)
+        await database.get_referral_statistics()
+        
+        referral_queries = [query for query, _ in queries if "referral_discount_percentage > 0" in query]
+        assert len(referral_queries) == 3
+        for query in referral_queries:
+            plan = await self._plan(database, queries, query)
+            assert "USING COVERING INDEX idx_rentals_referral_discount" in plan
+    
+    @pytest.mark.asyncio
+    async def test_users_by_source_uses_covering_index(self, database):
+        """Тест статистики пользователей по источникам"""
+        database, queries = database
+        
+        await database.get_users_by_source()
+        
+        plan = await self._plan(database, queries, "GROUP BY source")
+        assert "USING COVERING INDEX idx_users_source" in plan
+    
+    @pytest.mark.asyncio
+    async def test_maintenance_reminders_use_partial_index(self, database):
+        """Тест выборки напоминаний об обслуживании"""
+        database, queries = database
+        
+        await database.get_maintenance_reminders_for_today()
+        
+        plan = await self._plan(database, queries, "cm.reminder_date = ?")
+        assert "USING INDEX idx_car_maintenance_reminder_date" in plan
+        assert "SCAN cm" not in plan
+
+
+class TestRegisterUser:
+    """Integration тесты регистрации пользователя при /start одним запросом"""
+    
+    @pytest.mark.asyncio
+    async def test_new_user_gets_referral_code(self, initialized_db):
+        """Тест создания пользователя с реферальным кодом"""
+        database = initialized_db
+        user = await database.register_user(111, "user", "User")
+        
+        assert user['telegram_id'] == 111
+        assert user['referral_code'].startswith("111")
+        assert user['referrer_id'] is None
+        assert user['source'] is None
+    
+    @pytest.mark.asyncio
+    async def test_referral_code_sets_referrer(self, initialized_db):
+        """Тест назначения реферера по коду из deep-link"""
+        database = initialized_db
+        referrer = await database.register_user(222, "referrer", "Referrer")
+        
+        user = await database.register_user(111, "user", "User", start_param=referrer['referral_code'])
+        
+        assert user['referrer_id'] == 222
+        assert user['source'] is None
+    
+    @pytest.mark.asyncio
+    async def test_unknown_param_is_source(self, initialized_db):
+        """Тест сохранения UTM-метки, если параметр не реферальный код"""
+        database = initialized_db
+        user = await database.register_user(111, "user", "User", start_param="x" * 150)
+        
+        assert user['source'] == "x" * 100
+        assert user['referrer_id'] is None
+    
+    @pytest.mark.asyncio
+    async def test_existing_user_keeps_code_source_and_referrer(self, initialized_db):
+        """Тест повторного /start существующего пользователя"""
+        database = initialized_db
+        referrer = await database.register_user(222, "referrer", "Referrer")
+        first = await database.register_user(111, "user", "User", start_param="ads")
+        
+        again = await database.register_user(111, "renamed", "Renamed", start_param=referrer['referral_code'])
+        
+        assert again['referral_code'] == first['referral_code']
+        assert again['source'] == "ads"
+        assert again['referrer_id'] is None
+        assert again['username'] == "renamed"
+    
+    @pytest.mark.asyncio
+    async def test_existing_user_without_code_gets_one(self, initialized_db):
+        """Тест назначения кода и источника пользователю, созданному через add_user"""
+        database = initialized_db
+        await database.add_user(111, "user", "User")
+        
+        user = await database.register_user(111, "user", "User", start_param="ads")
+        
+        assert user['referral_code']
+        assert user['source'] == "ads"
+    
+    @pytest.mark.asyncio
+    async def test_self_referral_is_ignored(self, initialized_db):
+        """Тест, что собственный код не делает пользователя своим реферером"""
+        database = initialized_db
+        user = await database.register_user(111, "user", "User")
+        
+        again = await database.register_user(111, "user", "User", start_param=user['referral_code'])
+        
+        assert again['referrer_id'] is None
+        assert again['source'] is None
+    
+    @pytest.mark.asyncio
+    async def test_single_write_statement(self, initialized_db):
+        """Тест, что регистрация выполняется одним запросом"""
+        database = initialized_db
+        database.db_pool.query_metrics.reset()
+        
+        await database.register_user(111, "user", "User", start_param="ads")
+        
+        stats = database.db_pool.get_query_stats()
+        assert sum(item['count'] for item in stats) == 1
@@ -1,9 +1,10 @@
 """
 Unit тесты для модуля cache.py
 """
+import asyncio
 import pytest
 import time
-from bot.utils.cache import SimpleCache
+from bot.utils.cache import SimpleCache, MISSING, CacheMutationError, key_namespace, cached, freeze
 
 
 class TestSimpleCache:
@@ -42,7 +43,7 @@ class TestSimpleCache:
         def mock_time():
             return current_time[0]
         
-        monkeypatch.setattr(bot.utils.cache, "time", mock_time)
+        monkeypatch.setattr(bot.utils.cache, "monotonic", mock_time)
         
         cache = SimpleCache(default_ttl=60)
         cache.set("expired_key", "value")
@@ -62,7 +63,7 @@ class TestSimpleCache:
         def mock_time():
             return current_time[0]
         
-        monkeypatch.setattr(bot.utils.cache, "time", mock_time)
+        monkeypatch.setattr(bot.utils.cache, "monotonic", mock_time)
         
         cache = SimpleCache(default_ttl=300)
         cache.set("key", "value", ttl=10)
@@ -185,3 +186,693 @@ class TestSimpleCache:
         assert result['list'] == [1, 2, 3]
         assert result['dict']['nested'] == 'value'
 
+
+
+class TestSimpleCacheBounds:
+    """Тесты ограничения размера и очистки истекших записей"""
+    
+    def test_evicts_least_recently_used(self):
+        """Тест вытеснения давно не использованной записи при переполнении"""
+        cache = SimpleCache(max_entries=3)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("c", 3)
+        
+        # Обращение к "a" делает ее недавно использованной
+        assert cache.get("a") == 1
+        cache.set("d", 4)
+        
+        assert len(cache._cache) == 3
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.get("d") == 4
+    
+    def test_overwrite_does_not_grow(self):
+        """Тест, что перезапись ключа не увеличивает размер кэша"""
+        cache = SimpleCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("a", 10)
+        cache.set("c", 3)
+        
+        # "a" обновлена позже "b", поэтому вытесняется "b"
+        assert cache.get("a") == 10
+        assert cache.get("b") is None
+    
+    def test_purge_expired(self, monkeypatch):
+        """Тест удаления всех истекших записей"""
+        import bot.utils.cache
+        current_time = [1000.0]
+        monkeypatch.setattr(bot.utils.cache, "monotonic", lambda: current_time[0])
+        
+        cache = SimpleCache(default_ttl=60)
+        for i in range(10):
+            cache.set(f"short_{i}", i, ttl=10)
+        cache.set("long", "value")
+        
+        current_time[0] = 1011.0
+        
+        assert cache.purge_expired() == 10
+        assert list(cache._cache) == ["long"]
+    
+    @pytest.mark.asyncio
+    async def test_sweeper_removes_expired(self):
+        """Тест фоновой очистки истекших записей"""
+        cache = SimpleCache()
+        cache.set("key", "value", ttl=0.01)
+        
+        cache.start_sweeper(interval=0.02)
+        try:
+            await asyncio.sleep(0.1)
+            assert "key" not in cache._cache
+        finally:
+            await cache.stop_sweeper()
+        
+        assert cache._sweeper is None
+
+
+class TestGetOrLoad:
+    """Тесты загрузки с объединением одновременных промахов"""
+    
+    @pytest.mark.asyncio
+    async def test_hit_does_not_call_loader(self):
+        """Тест, что при попадании в кэш загрузчик не вызывается"""
+        cache = SimpleCache()
+        cache.set("key", "cached")
+        
+        async def loader():
+            raise AssertionError("loader не должен вызываться")
+        
+        assert await cache.get_or_load("key", loader) == "cached"
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_single_load(self):
+        """Тест, что одновременные промахи ждут одну загрузку"""
+        cache = SimpleCache()
+        calls = [0]
+        
+        async def loader():
+            calls[0] += 1
+            await asyncio.sleep(0.01)
+            return ["car"]
+        
+        results = await asyncio.gather(*[cache.get_or_load("cars", loader, ttl=60) for _ in range(20)])
+        
+        assert calls[0] == 1
+        assert all(result is results[0] for result in results)
+        assert cache.get("cars") == ["car"]
+        assert cache._inflight == {}
+    
+    @pytest.mark.asyncio
+    async def test_none_is_not_cached(self):
+        """Тест, что результат None не сохраняется"""
+        cache = SimpleCache()
+        calls = [0]
+        
+        async def loader():
+            calls[0] += 1
+            return None
+        
+        assert await cache.get_or_load("missing", loader) is None
+        assert await cache.get_or_load("missing", loader) is None
+        assert calls[0] == 2
+    
+    @pytest.mark.asyncio
+    async def test_error_propagates_to_all_waiters(self):
+        """Тест, что ошибку загрузки получают все ожидающие, а следующий вызов загружает заново"""
+        cache = SimpleCache()
+        
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("db error")
+        
+        results = await asyncio.gather(
+            *[cache.get_or_load("key", failing) for _ in range(3)], return_exceptions=True
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        
+        async def loader():
+            return "value"
+        
+        assert await cache.get_or_load("key", loader) == "value"
+    
+    @pytest.mark.asyncio
+    async def test_delete_during_load_discards_result(self):
+        """Тест, что инвалидация во время загрузки не дает сохранить устаревшее значение"""
+        cache = SimpleCache()
+        started = asyncio.Event()
+        release = asyncio.Event()
+        
+        async def slow_loader():
+            started.set()
+            await release.wait()
+            return "stale"
+        
+        pending = asyncio.ensure_future(cache.get_or_load("key", slow_loader))
+        await started.wait()
+        cache.delete("key")
+        release.set()
+        
+        assert await pending == "stale"
+        assert cache.get("key") is None
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_load(self):
+        """Тест, что отмена одного ожидающего не прерывает общую загрузку"""
+        cache = SimpleCache()
+        
+        async def loader():
+            await asyncio.sleep(0.02)
+            return "value"
+        
+        first = asyncio.ensure_future(cache.get_or_load("key", loader))
+        second = asyncio.ensure_future(cache.get_or_load("key", loader))
+        await asyncio.sleep(0)
+        first.cancel()
+        
+        assert await second == "value"
+        assert first.cancelled()
+        assert cache.get("key") == "value"
+
+
+class TestNegativeCaching:
+    """Тесты кэширования отсутствия значения"""
+    
+    @pytest.mark.asyncio
+    async def test_miss_is_cached_with_negative_ttl(self, monkeypatch):
+        """Тест, что отсутствие значения кэшируется на negative_ttl"""
+        import bot.utils.cache
+        current_time = [1000.0]
+        monkeypatch.setattr(bot.utils.cache, "monotonic", lambda: current_time[0])
+        
+        cache = SimpleCache()
+        calls = [0]
+        
+        async def loader():
+            calls[0] += 1
+            return None
+        
+        assert await cache.get_or_load("rental:user:1", loader, ttl=300, negative_ttl=30) is None
+        assert await cache.get_or_load("rental:user:1", loader, ttl=300, negative_ttl=30) is None
+        assert calls[0] == 1
+        
+        current_time[0] = 1031.0
+        assert await cache.get_or_load("rental:user:1", loader, ttl=300, negative_ttl=30) is None
+        assert calls[0] == 2
+    
+    @pytest.mark.asyncio
+    async def test_get_hides_missing_marker(self):
+        """Тест, что get возвращает None вместо метки отсутствия"""
+        cache = SimpleCache()
+        
+        async def loader():
+            return None
+        
+        await cache.get_or_load("car:1", loader, negative_ttl=30)
+        
+        assert cache._cache["car:1"][0] is MISSING
+        assert cache.get("car:1") is None
+    
+    @pytest.mark.asyncio
+    async def test_delete_removes_missing_marker(self):
+        """Тест, что инвалидация снимает метку отсутствия"""
+        cache = SimpleCache()
+        value = [None]
+        
+        async def loader():
+            return value[0]
+        
+        assert await cache.get_or_load("car:1", loader, negative_ttl=30) is None
+        value[0] = {"id": 1}
+        assert await cache.get_or_load("car:1", loader, negative_ttl=30) is None
+        
+        cache.delete("car:1")
+        assert await cache.get_or_load("car:1", loader, negative_ttl=30) == {"id": 1}
+
+
+class TestNamespaceInvalidation:
+    """Тесты инвалидации по тегам через счетчики поколений"""
+    
+    def test_invalidate_tag_hides_all_tagged_entries(self):
+        """Тест, что invalidate скрывает все записи с тегом и не трогает остальные"""
+        cache = SimpleCache()
+        cache.set("cars:all:True", [1], tags=('cars',))
+        cache.set("car:1", {"id": 1}, tags=('cars',))
+        cache.set("rental:user:1", {"id": 5}, tags=('rentals', 'cars'))
+        cache.set("admin:1", True)
+        
+        cache.invalidate('cars')
+        
+        assert cache.get("cars:all:True") is None
+        assert cache.get("car:1") is None
+        assert cache.get("rental:user:1") is None
+        assert cache.get("admin:1") is True
+    
+    def test_entries_after_invalidate_are_fresh(self):
+        """Тест, что записи, сохраненные после invalidate, читаются"""
+        cache = SimpleCache()
+        cache.set("car:1", "old", tags=('cars',))
+        cache.invalidate('cars')
+        cache.set("car:1", "new", tags=('cars',))
+        
+        assert cache.get("car:1") == "new"
+    
+    def test_invalidate_is_constant_time(self):
+        """Тест, что invalidate не перебирает записи, а очистка удаляет устаревшие"""
+        cache = SimpleCache()
+        for i in range(100):
+            cache.set(f"car:{i}", i, tags=('cars',))
+        
+        cache.invalidate('cars')
+        
+        # Записи остаются в памяти до очистки
+        assert len(cache._cache) == 100
+        assert cache.purge_expired() == 100
+        assert len(cache._cache) == 0
+    
+    @pytest.mark.asyncio
+    async def test_invalidate_during_load(self):
+        """Тест, что загрузка, начатая до invalidate, не сохраняется и не переиспользуется"""
+        cache = SimpleCache()
+        started = asyncio.Event()
+        release = asyncio.Event()
+        
+        async def slow_loader():
+            started.set()
+            await release.wait()
+            return "stale"
+        
+        async def fresh_loader():
+            return "fresh"
+        
+        pending = asyncio.ensure_future(cache.get_or_load("car:1", slow_loader, tags=('cars',)))
+        await started.wait()
+        cache.invalidate('cars')
+        
+        # Новый запрос не присоединяется к устаревшей загрузке
+        assert await cache.get_or_load("car:1", fresh_loader, tags=('cars',)) == "fresh"
+        
+        release.set()
+        assert await pending == "stale"
+        assert cache.get("car:1") == "fresh"
+
+
+class TestCacheStats:
+    """Тесты статистики кэша по пространствам ключей"""
+    
+    @staticmethod
+    def _by_namespace(cache):
+        return {stats['namespace']: stats for stats in cache.get_stats()}
+    
+    def test_key_namespace(self):
+        """Тест выделения пространства из ключа"""
+        assert key_namespace("car:42") == "car"
+        assert key_namespace("cars:all:True") == "cars:all"
+        assert key_namespace("rental:user:111") == "rental:user"
+        assert key_namespace("rentals:active") == "rentals"
+        assert key_namespace("plain") == "plain"
+        assert key_namespace(("bot.module.func", (1,), ())) == "bot.module.func"
+    
+    def test_hits_misses_and_sets(self):
+        """Тест подсчета попаданий, промахов и записей"""
+        cache = SimpleCache()
+        cache.get("car:1")
+        cache.set("car:1", {"id": 1})
+        cache.get("car:1")
+        cache.get("car:1")
+        cache.get("admin:5")
+        
+        stats = self._by_namespace(cache)
+        assert stats["car"]["hits"] == 2
+        assert stats["car"]["misses"] == 1
+        assert stats["car"]["sets"] == 1
+        assert stats["car"]["hit_rate"] == round(2 / 3, 4)
+        assert stats["car"]["entries"] == 1
+        assert stats["car"]["bytes"] > 0
+        assert stats["admin"]["misses"] == 1
+        assert stats["admin"]["entries"] == 0
+    
+    def test_evictions_expirations_invalidations(self, monkeypatch):
+        """Тест подсчета вытеснений, истечений и инвалидаций"""
+        import bot.utils.cache
+        current_time = [1000.0]
+        monkeypatch.setattr(bot.utils.cache, "monotonic", lambda: current_time[0])
+        
+        cache = SimpleCache(max_entries=2)
+        cache.set("admin:1", True, ttl=10)
+        cache.set("car:1", 1, tags=('cars',))
+        cache.set("car:2", 2, tags=('cars',))  # вытесняет admin:1
+        
+        cache.invalidate('cars')
+        assert cache.get("car:1") is None
+        cache.set("admin:2", True, ttl=10)
+        cache.set("admin:3", True, ttl=10)  # вытесняет car:2
+        current_time[0] = 1011.0
+        assert cache.get("admin:2") is None
+        
+        stats = self._by_namespace(cache)
+        assert stats["admin"]["evictions"] == 1
+        assert stats["admin"]["expirations"] == 1
+        assert stats["car"]["evictions"] == 1
+        assert stats["car"]["invalidations"] == 1
+        assert stats["car"]["misses"] == 1
+    
+    def test_bytes_grow_with_value_size(self):
+        """Тест, что примерный объем учитывает вложенные значения"""
+        cache = SimpleCache()
+        cache.set("cars:all:True", [{"name": "x" * 10}])
+        cache.set("cars:all:False", [{"name": "x" * 10000}])
+        cache.set("car:1", {"name": "x"})
+        
+        stats = self._by_namespace(cache)
+        assert stats["cars:all"]["entries"] == 2
+        assert stats["cars:all"]["bytes"] > 10000
+        assert stats["car"]["bytes"] < 1000
+    
+    def test_reset_stats(self):
+        """Тест сброса счетчиков без очистки данных"""
+        cache = SimpleCache()
+        cache.set("car:1", 1)
+        cache.get("car:1")
+        
+        cache.reset_stats()
+        
+        stats = self._by_namespace(cache)
+        assert stats["car"]["hits"] == 0
+        assert stats["car"]["entries"] == 1
+
+
+class TestStaleWhileRevalidate:
+    """Тесты режима stale-while-revalidate"""
+    
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        import bot.utils.cache
+        current_time = [1000.0]
+        monkeypatch.setattr(bot.utils.cache, "monotonic", lambda: current_time[0])
+        return current_time
+    
+    @pytest.mark.asyncio
+    async def test_stale_value_served_and_refreshed_in_background(self, clock):
+        """Тест, что истекшее значение отдается сразу, а обновляется в фоне"""
+        cache = SimpleCache()
+        value = ["v1"]
+        calls = [0]
+        
+        async def loader():
+            calls[0] += 1
+            await asyncio.sleep(0.01)
+            return value[0]
+        
+        assert await cache.get_or_load("cars:all:True", loader, ttl=60, stale_ttl=120) == "v1"
+        
+        value[0] = "v2"
+        clock[0] = 1070.0
+        # Истекло, но в пределах stale_ttl: без ожидания загрузки
+        assert await cache.get_or_load("cars:all:True", loader, ttl=60, stale_ttl=120) == "v1"
+        assert await cache.get_or_load("cars:all:True", loader, ttl=60, stale_ttl=120) == "v1"
+        assert "cars:all:True" in cache._inflight
+        
+        await cache._inflight["cars:all:True"][1]
+        assert calls[0] == 2
+        assert await cache.get_or_load("cars:all:True", loader, ttl=60, stale_ttl=120) == "v2"
+        
+        stats = {item['namespace']: item for item in cache.get_stats()}
+        assert stats["cars:all"]["stale_hits"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_max_staleness_bound(self, clock):
+        """Тест, что после stale_ttl значение загружается синхронно"""
+        cache = SimpleCache()
+        value = ["v1"]
+        
+        async def loader():
+            return value[0]
+        
+        await cache.get_or_load("cars:all:True", loader, ttl=60, stale_ttl=120)
+        value[0] = "v2"
+        clock[0] = 1181.0
+        
+        assert await cache.get_or_load("cars:all:True", loader, ttl=60, stale_ttl=120) == "v2"
+    
+    @pytest.mark.asyncio
+    async def test_invalidated_value_is_never_stale(self, clock):
+        """Тест, что после invalidate устаревшее значение не отдается"""
+        cache = SimpleCache()
+        value = ["v1"]
+        
+        async def loader():
+            return value[0]
+        
+        await cache.get_or_load("cars:all:True", loader, ttl=60, tags=('cars',), stale_ttl=120)
+        value[0] = "v2"
+        clock[0] = 1070.0
+        cache.invalidate('cars')
+        
+        assert await cache.get_or_load("cars:all:True", loader, ttl=60, tags=('cars',), stale_ttl=120) == "v2"
+    
+    def test_get_does_not_return_stale(self, clock):
+        """Тест, что обычный get не отдает истекшее значение, а очистка его сохраняет до stale_ttl"""
+        cache = SimpleCache()
+        cache._store("cars:all:True", "v1", 60, (), stale_ttl=120)
+        clock[0] = 1070.0
+        
+        assert cache.get("cars:all:True") is None
+        assert cache.purge_expired() == 0
+        clock[0] = 1181.0
+        assert cache.purge_expired() == 1
+    
+    @pytest.mark.asyncio
+    async def test_background_refresh_error_keeps_stale_value(self, clock):
+        """Тест, что ошибка фонового обновления не ломает чтение"""
+        cache = SimpleCache()
+        fail = [False]
+        
+        async def loader():
+            if fail[0]:
+                raise RuntimeError("db error")
+            return "v1"
+        
+        await cache.get_or_load("cars:all:True", loader, ttl=60, stale_ttl=120)
+        fail[0] = True
+        clock[0] = 1070.0
+        
+        assert await cache.get_or_load("cars:all:True", loader, ttl=60, stale_ttl=120) == "v1"
+        await asyncio.sleep(0)
+        assert await cache.get_or_load("cars:all:True", loader, ttl=60, stale_ttl=120) == "v1"
+
+
+class TestCachedDecorator:
+    """Тесты декоратора @cached"""
+    
+    @pytest.fixture(autouse=True)
+    def clean_global_cache(self):
+        from bot.utils.cache import cache
+        cache.clear()
+        cache.reset_stats()
+        yield
+        cache.clear()
+    
+    @staticmethod
+    def _counting(result):
+        """Функция, возвращающая result[0] и считающая вызовы"""
+        calls = []
+        
+        async def func(*args, **kwargs):
+            calls.append((args, kwargs))
+            return result[0]
+        
+        return func, calls
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("value", [None, 0, False, "", ()])
+    async def test_falsy_results_are_cached(self, value):
+        """Тест, что None и другие ложные результаты тоже кэшируются"""
+        func, calls = self._counting([value])
+        wrapped = cached(ttl=60)(func)
+        
+        assert await wrapped(1) == value
+        assert await wrapped(1) == value
+        assert len(calls) == 1
+    
+    @pytest.mark.asyncio
+    async def test_keys_are_module_qualified_tuples(self):
+        """Тест, что одноименные функции разных модулей не пересекаются"""
+        first, first_calls = self._counting(["first"])
+        second, second_calls = self._counting(["second"])
+        first.__module__, second.__module__ = "bot.a", "bot.b"
+        first, second = cached()(first), cached()(second)
+        
+        assert await first(1, flag=True) == "first"
+        assert await second(1, flag=True) == "second"
+        
+        from bot.utils.cache import cache
+        assert ("bot.a." + first.__qualname__, (1,), (("flag", True),)) in cache._cache
+    
+    @pytest.mark.asyncio
+    async def test_kwargs_order_does_not_matter(self):
+        """Тест, что порядок именованных аргументов не влияет на ключ"""
+        func, calls = self._counting(["value"])
+        wrapped = cached()(func)
+        
+        await wrapped(a=1, b=2)
+        await wrapped(b=2, a=1)
+        assert len(calls) == 1
+    
+    @pytest.mark.asyncio
+    async def test_unhashable_args_bypass_cache(self):
+        """Тест, что вызовы с нехешируемыми аргументами выполняются без кэша"""
+        func, calls = self._counting(["value"])
+        wrapped = cached()(func)
+        
+        assert await wrapped([1, 2]) == "value"
+        assert await wrapped([1, 2]) == "value"
+        assert len(calls) == 2
+    
+    @pytest.mark.asyncio
+    async def test_invalidate(self):
+        """Тест точечной и полной инвалидации"""
+        result = ["v1"]
+        func, calls = self._counting(result)
+        wrapped = cached()(func)
+        await wrapped(1)
+        await wrapped(2)
+        
+        result[0] = "v2"
+        wrapped.invalidate(1)
+        assert await wrapped(1) == "v2"
+        assert await wrapped(2) == "v1"
+        
+        wrapped.invalidate()
+        assert await wrapped(2) == "v2"
+        assert len(calls) == 4
+    
+    @pytest.mark.asyncio
+    async def test_tags_invalidate_results(self):
+        """Тест, что результаты инвалидируются тегом данных"""
+        from bot.utils.cache import cache
+        func, calls = self._counting(["value"])
+        wrapped = cached(tags=('cars',))(func)
+        
+        await wrapped()
+        cache.invalidate('cars')
+        await wrapped()
+        assert len(calls) == 2
+    
+    @pytest.mark.asyncio
+    async def test_ttl_jitter(self, monkeypatch):
+        """Тест, что TTL записей случайно отклоняется в пределах jitter"""
+        import bot.utils.cache
+        from bot.utils.cache import cache
+        monkeypatch.setattr(bot.utils.cache, "monotonic", lambda: 1000.0)
+        func, _ = self._counting(["value"])
+        wrapped = cached(ttl=100, jitter=0.2)(func)
+        
+        for i in range(20):
+            await wrapped(i)
+        expiries = {entry[1] for entry in cache._cache.values()}
+        
+        assert all(1080.0 <= expiry <= 1120.0 for expiry in expiries)
+        assert len(expiries) > 1
+    
+    @pytest.mark.asyncio
+    async def test_cache_info(self, monkeypatch):
+        """Тест статистики функции"""
+        from bot.utils.cache import cache
+        func, _ = self._counting(["value"])
+        wrapped = cached()(func)
+        
+        assert wrapped.cache_info()['entries'] == 0
+        await wrapped(1)
+        await wrapped(1)
+        await wrapped(2)
+        
+        info = wrapped.cache_info()
+        assert info['hits'] == 1
+        assert info['misses'] == 2
+        assert info['entries'] == 2
+        
+        # cache_info не проходит по всему кэшу (get_stats)
+        monkeypatch.setattr(cache, "get_stats", None)
+        wrapped.invalidate(1)
+        assert wrapped.cache_info()['entries'] == 1
+        cache.clear()
+        assert wrapped.cache_info()['entries'] == 0
+
+
+class _Record:
+    """Изменяемый объект, который freeze() оставляет как есть"""
+    
+    def __init__(self, name):
+        self.name = name
+
+
+class TestFrozenValues:
+    """Тесты неизменяемых снимков и режима отладки"""
+    
+    def test_freeze(self):
+        """Тест заморозки вложенных коллекций"""
+        value = freeze([{"id": 1, "tags": ["a"]}, {"id": 2, "tags": {"b"}}])
+        
+        assert isinstance(value, tuple)
+        assert value == ({"id": 1, "tags": ("a",)}, {"id": 2, "tags": frozenset({"b"})})
+        with pytest.raises(TypeError):
+            value[0]["id"] = 3
+        assert freeze("text") == "text"
+        assert freeze(None) is None
+    
+    def test_set_and_get_return_shared_snapshot(self):
+        """Тест, что все читатели получают один и тот же неизменяемый объект"""
+        cache = SimpleCache(freeze_values=True)
+        cache.set("cars:all:True", [{"id": 1, "name": "Car"}])
+        
+        first, second = cache.get("cars:all:True"), cache.get("cars:all:True")
+        assert first is second
+        assert first == ({"id": 1, "name": "Car"},)
+        with pytest.raises((TypeError, AttributeError)):
+            first.append({"id": 2})
+    
+    @pytest.mark.asyncio
+    async def test_loader_result_is_frozen_for_all_waiters(self):
+        """Тест, что и загрузивший, и ожидавшие получают сохраненный снимок"""
+        cache = SimpleCache(freeze_values=True)
+        
+        async def loader():
+            await asyncio.sleep(0)
+            return [{"id": 1}]
+        
+        results = await asyncio.gather(*[cache.get_or_load("cars:all:True", loader) for _ in range(3)])
+        
+        assert all(result is cache.get("cars:all:True") for result in results)
+        assert isinstance(results[0], tuple)
+    
+    def test_values_stored_as_is_by_default(self):
+        """Тест, что без freeze_values значение хранится без преобразования"""
+        cache = SimpleCache()
+        value = [1]
+        cache.set("key", value)
+        assert cache.get("key") is value
+    
+    def test_debug_detects_mutation(self):
+        """Тест, что режим отладки обнаруживает изменение значения после сохранения"""
+        cache = SimpleCache(freeze_values=True, debug=True)
+        record = _Record("Car")
+        cache.set("car:1", record)
+        assert cache.get("car:1") is record
+        
+        record.name = "Changed"
+        with pytest.raises(CacheMutationError):
+            cache.get("car:1")
+        # Измененная запись удаляется: следующее чтение - обычный промах
+        assert cache.get("car:1") is None
+    
+    def test_debug_accepts_unchanged_values(self):
+        """Тест, что неизменные значения читаются в режиме отладки без ошибок"""
+        cache = SimpleCache(freeze_values=True, debug=True)
+        cache.set("cars:all:True", [{"id": 1}])
+        cache.set("admin:1", True)
+        
+        for _ in range(3):
+            assert cache.get("cars:all:True") == ({"id": 1},)
+            assert cache.get("admin:1") is True
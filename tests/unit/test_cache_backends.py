@@ -0,0 +1,193 @@
+"""
+Unit тесты для двухуровневого кэша (cache_backends.py)
+"""
+import asyncio
+import pytest
+from bot.utils.cache import SimpleCache, MISSING
+from bot.utils.cache_backends import CacheBackend, InMemoryBackend, InMemoryBroker
+
+
+@pytest.fixture
+async def instances():
+    """Два экземпляра кэша, подключенные к одному общему хранилищу"""
+    broker = InMemoryBroker()
+    first, second = SimpleCache(), SimpleCache()
+    await first.connect_backend(InMemoryBackend(broker))
+    await second.connect_backend(InMemoryBackend(broker))
+    yield first, second
+    await first.disconnect_backend()
+    await second.disconnect_backend()
+
+
+def _counting_loader(holder):
+    """Загрузчик значения holder[0], считающий свои вызовы"""
+    calls = [0]
+
+    async def loader():
+        calls[0] += 1
+        return holder[0]
+
+    return loader, calls
+
+
+class TestInMemoryBackend:
+    """Тесты замены Redis в памяти"""
+
+    @pytest.mark.asyncio
+    async def test_get_set_delete(self):
+        """Тест базовых операций"""
+        backend = InMemoryBackend()
+        await backend.set("a", b"1", ttl=60)
+
+        assert await backend.get_many(["a", "b"]) == [b"1", None]
+        await backend.delete("a")
+        assert await backend.get_many(["a"]) == [None]
+
+    def test_incomplete_backend_cannot_be_created(self):
+        """Тест, что бэкенд без части команд не создается"""
+        class PartialBackend(CacheBackend):
+            async def get_many(self, keys):
+                return [None] * len(keys)
+
+        with pytest.raises(TypeError):
+            PartialBackend()
+
+    @pytest.mark.asyncio
+    async def test_ttl(self, monkeypatch):
+        """Тест истечения значения"""
+        import bot.utils.cache_backends
+        current_time = [1000.0]
+        monkeypatch.setattr(bot.utils.cache_backends, "monotonic", lambda: current_time[0])
+
+        backend = InMemoryBackend()
+        await backend.set("a", b"1", ttl=10)
+        current_time[0] = 1011.0
+
+        assert await backend.get_many(["a"]) == [None]
+
+    @pytest.mark.asyncio
+    async def test_incr(self):
+        """Тест счетчика"""
+        backend = InMemoryBackend()
+        assert await backend.incr("gen") == 1
+        assert await backend.incr("gen") == 2
+        assert await backend.get_many(["gen"]) == [b"2"]
+
+    @pytest.mark.asyncio
+    async def test_publish_subscribe(self):
+        """Тест доставки сообщений подписчикам того же брокера"""
+        broker = InMemoryBroker()
+        publisher, subscriber = InMemoryBackend(broker), InMemoryBackend(broker)
+        received = []
+        await subscriber.subscribe("channel", received.append)
+
+        await publisher.publish("channel", b"hello")
+        await asyncio.sleep(0)
+        assert received == [b"hello"]
+
+        await subscriber.close()
+        await publisher.publish("channel", b"again")
+        await asyncio.sleep(0)
+        assert received == [b"hello"]
+
+
+class TestTwoTierCache:
+    """Тесты L1-кэша с общим хранилищем"""
+
+    @pytest.mark.asyncio
+    async def test_second_instance_reads_from_backend(self, instances):
+        """Тест, что второй экземпляр берет значение из L2, а не из БД"""
+        first, second = instances
+        loader, calls = _counting_loader([["car"]])
+
+        assert await first.get_or_load("cars:all:True", loader, tags=('cars',)) == ["car"]
+        assert await second.get_or_load("cars:all:True", loader, tags=('cars',)) == ["car"]
+
+        assert calls[0] == 1
+        stats = {item['namespace']: item for item in second.get_stats()}
+        assert stats["cars:all"]["backend_hits"] == 1
+        # После чтения из L2 значение есть и в L1 второго экземпляра
+        assert second.get("cars:all:True") == ["car"]
+
+    @pytest.mark.asyncio
+    async def test_invalidate_reaches_other_instance(self, instances):
+        """Тест, что invalidate на одном экземпляре сбрасывает L1 и L2 для всех"""
+        first, second = instances
+        value = ["old"]
+        loader, calls = _counting_loader(value)
+
+        await first.get_or_load("car:1", loader, tags=('cars',))
+        await second.get_or_load("car:1", loader, tags=('cars',))
+        assert calls[0] == 1
+
+        value[0] = "new"
+        first.invalidate('cars')
+        await first._flush_backend()
+        await asyncio.sleep(0)
+
+        assert second.get("car:1") is None
+        assert await second.get_or_load("car:1", loader, tags=('cars',)) == "new"
+        assert await first.get_or_load("car:1", loader, tags=('cars',)) == "new"
+        assert calls[0] == 2
+
+    @pytest.mark.asyncio
+    async def test_delete_reaches_other_instance(self, instances):
+        """Тест, что delete удаляет ключ из L2 и из L1 других экземпляров"""
+        first, second = instances
+        value = [True]
+        loader, calls = _counting_loader(value)
+
+        await first.get_or_load("admin:1", loader)
+        await second.get_or_load("admin:1", loader)
+
+        value[0] = False
+        second.delete("admin:1")
+        await second._flush_backend()
+        await asyncio.sleep(0)
+
+        assert first.get("admin:1") is None
+        assert await first.get_or_load("admin:1", loader) is False
+        assert calls[0] == 2
+
+    @pytest.mark.asyncio
+    async def test_own_invalidation_applied_before_backend_read(self, instances):
+        """Тест, что экземпляр не читает из L2 значение, которое сам только что инвалидировал"""
+        first, _ = instances
+        value = ["old"]
+        loader, _ = _counting_loader(value)
+
+        await first.get_or_load("car:1", loader, tags=('cars',))
+        value[0] = "new"
+        # Инвалидация еще не отправлена в L2, но чтение ее дождется
+        first.invalidate('cars')
+
+        assert await first.get_or_load("car:1", loader, tags=('cars',)) == "new"
+
+    @pytest.mark.asyncio
+    async def test_negative_entry_is_shared(self, instances):
+        """Тест, что закэшированное отсутствие значения тоже общее"""
+        first, second = instances
+        loader, calls = _counting_loader([None])
+
+        assert await first.get_or_load("rental:user:1", loader, negative_ttl=30) is None
+        assert await second.get_or_load("rental:user:1", loader, negative_ttl=30) is None
+
+        assert calls[0] == 1
+        assert second._cache["rental:user:1"][0] is MISSING
+
+    @pytest.mark.asyncio
+    async def test_backend_errors_fall_back_to_loader(self):
+        """Тест, что недоступность L2 не ломает загрузку"""
+        class BrokenBackend(InMemoryBackend):
+            async def get_many(self, keys):
+                raise ConnectionError("redis is down")
+
+        cache = SimpleCache()
+        await cache.connect_backend(BrokenBackend())
+        loader, calls = _counting_loader(["value"])
+
+        assert await cache.get_or_load("car:1", loader) == "value"
+        assert cache.get("car:1") == "value"
+        assert calls[0] == 1
+        await cache.disconnect_backend()
+        assert cache.backend is None
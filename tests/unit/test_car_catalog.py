@@ -0,0 +1,149 @@
+"""
+Unit тесты для каталога автомобилей в памяти (car_catalog.py)
+"""
+import pytest
+from bot.database.car_catalog import CarCatalog, CatalogSnapshot
+from bot.utils.cache import cache
+
+
+def _car(car_id, price, available=True, created_at="2024-01-01 10:00:00"):
+    """Строка автомобиля, как ее возвращает SELECT * FROM cars"""
+    return {
+        'id': car_id, 'name': f"Car {car_id}", 'description': None,
+        'daily_price': price, 'available': int(available),
+        'image_1': None, 'image_2': None, 'image_3': None, 'created_at': created_at,
+    }
+
+
+CARS = [
+    _car(1, 7000, created_at="2024-01-01 10:00:00"),
+    _car(2, 5000, available=False, created_at="2024-01-03 10:00:00"),
+    _car(3, 9000, created_at="2024-01-02 10:00:00"),
+    _car(4, 6000, created_at="2024-01-02 10:00:00"),
+]
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    """Каталог, загружающий CARS и считающий загрузки"""
+    cache.clear()
+    loads = [0]
+
+    async def load():
+        loads[0] += 1
+        return CatalogSnapshot(CARS)
+
+    catalog = CarCatalog()
+    monkeypatch.setattr(catalog, "_load", load)
+    yield catalog, loads
+    cache.clear()
+
+
+class TestCatalogSnapshot:
+    """Тесты представлений снимка"""
+
+    def test_views(self):
+        """Тест порядка и фильтрации представлений"""
+        snapshot = CatalogSnapshot(CARS)
+
+        # Как ORDER BY created_at DESC; при равной дате новые ID первыми
+        assert [car['id'] for car in snapshot.ordered] == [2, 4, 3, 1]
+        assert [car['id'] for car in snapshot.available] == [4, 3, 1]
+        assert [car['id'] for car in snapshot.available_by_price] == [4, 1, 3]
+        assert snapshot.by_id[3]['daily_price'] == 9000
+
+    def test_with_car_and_without_car(self):
+        """Тест, что изменения возвращают новый снимок и не трогают исходный"""
+        snapshot = CatalogSnapshot(CARS)
+
+        changed = snapshot.with_car(_car(2, 3000, created_at="2024-01-03 10:00:00"))
+        assert [car['id'] for car in changed.available_by_price] == [2, 4, 1, 3]
+        assert [car['id'] for car in snapshot.available_by_price] == [4, 1, 3]
+
+        removed = changed.without_car(4)
+        assert 4 not in removed.by_id
+        assert [car['id'] for car in removed.ordered] == [2, 3, 1]
+
+    def test_snapshot_is_immutable(self):
+        """Тест, что снимок и его представления нельзя изменить"""
+        import pickle
+        snapshot = CatalogSnapshot(CARS)
+
+        with pytest.raises(AttributeError):
+            snapshot.ordered = ()
+        with pytest.raises(TypeError):
+            snapshot.by_id[5] = _car(5, 1000)
+        with pytest.raises(AttributeError):
+            snapshot.available.append(_car(5, 1000))
+
+        restored = pickle.loads(pickle.dumps(snapshot))
+        assert restored.ordered == snapshot.ordered
+        assert restored.available_by_price == snapshot.available_by_price
+
+
+class TestCarCatalog:
+    """Тесты каталога со сквозной записью"""
+
+    @pytest.mark.asyncio
+    async def test_reads_load_once(self, catalog):
+        """Тест, что все чтения обслуживаются одним снимком"""
+        catalog, loads = catalog
+
+        assert [car['id'] for car in await catalog.get_all()] == [2, 4, 3, 1]
+        assert [car['id'] for car in await catalog.get_all(available_only=True)] == [4, 3, 1]
+        assert (await catalog.get(1))['name'] == "Car 1"
+        assert await catalog.get(99) is None
+        assert await catalog.min_price() == 6000
+        assert loads[0] == 1
+
+    @pytest.mark.asyncio
+    async def test_put_and_remove_write_through(self, catalog):
+        """Тест, что изменения применяются к снимку без повторной загрузки"""
+        catalog, loads = catalog
+        await catalog.load()
+
+        catalog.put(_car(5, 4000, created_at="2024-01-04 10:00:00"))
+        assert (await catalog.get_all())[0]['id'] == 5
+        assert await catalog.min_price() == 4000
+
+        catalog.put({**_car(5, 4000), 'available': 0})
+        assert await catalog.min_price() == 6000
+
+        catalog.remove(4)
+        assert await catalog.get(4) is None
+        assert await catalog.min_price() == 7000
+        assert loads[0] == 1
+
+    @pytest.mark.asyncio
+    async def test_put_invalidates_derived_entries(self, catalog):
+        """Тест, что записи с тегом 'cars' (аренды с названием автомобиля) сбрасываются"""
+        catalog, _ = catalog
+        await catalog.load()
+        cache.set("rentals:active", ["rental"], tags=('rentals', 'cars'))
+
+        catalog.put(_car(1, 7500))
+
+        assert cache.get("rentals:active") is None
+        assert (await catalog.get(1))['daily_price'] == 7500
+
+    @pytest.mark.asyncio
+    async def test_put_without_snapshot_defers_to_load(self, catalog):
+        """Тест, что без загруженного снимка изменение не собирает неполный каталог"""
+        catalog, loads = catalog
+
+        catalog.put(_car(5, 1000))
+
+        assert cache.get(CarCatalog.CACHE_KEY) is None
+        assert await catalog.min_price() == 6000
+        assert loads[0] == 1
+
+    @pytest.mark.asyncio
+    async def test_no_available_cars(self, catalog, monkeypatch):
+        """Тест минимальной цены без доступных автомобилей"""
+        catalog, _ = catalog
+
+        async def load():
+            return CatalogSnapshot([_car(1, 1000, available=False)])
+
+        monkeypatch.setattr(catalog, "_load", load)
+        assert await catalog.min_price() is None
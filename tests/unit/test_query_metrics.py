@@ -0,0 +1,122 @@
+"""
+Unit тесты для модуля query_metrics.py
+"""
+import pytest
+from bot.database.query_metrics import QueryMetrics, QueryStats, normalize_sql
+
+
+class TestNormalizeSql:
+    """Тесты нормализации текста запросов"""
+    
+    def test_collapses_whitespace(self):
+        """Тест схлопывания пробелов и переносов строк"""
+        query = """SELECT *
+                   FROM users
+                   WHERE telegram_id = ?"""
+        assert normalize_sql(query) == "SELECT * FROM users WHERE telegram_id = ?"
+    
+    def test_replaces_literals(self):
+        """Тест замены строковых и числовых литералов"""
+        assert normalize_sql("SELECT * FROM cars WHERE available = 1 AND name = 'BMW'") == \
+            "SELECT * FROM cars WHERE available = ? AND name = ?"
+    
+    def test_collapses_placeholder_lists(self):
+        """Тест схлопывания списков параметров IN (...)"""
+        assert normalize_sql("SELECT * FROM settings WHERE setting_key IN (?, ?, ?)") == \
+            "SELECT * FROM settings WHERE setting_key IN (?)"
+
+
+class TestQueryMetrics:
+    """Тесты для класса QueryMetrics"""
+    
+    def test_record_groups_by_normalized_sql(self):
+        """Тест группировки выполнений одного запроса"""
+        metrics = QueryMetrics(slow_threshold_ms=1000)
+        metrics.record("SELECT * FROM cars WHERE id = 1", 0.002, 1)
+        metrics.record("SELECT *  FROM cars WHERE id = 2", 0.004, 1)
+        
+        stats = metrics.get_stats()
+        
+        assert len(stats) == 1
+        assert stats[0]['count'] == 2
+        assert stats[0]['rows'] == 2
+        assert stats[0]['max_ms'] == pytest.approx(4.0)
+        assert stats[0]['avg_ms'] == pytest.approx(3.0)
+    
+    def test_fast_query_not_logged_as_slow(self):
+        """Тест, что быстрый запрос не попадает в журнал медленных"""
+        metrics = QueryMetrics(slow_threshold_ms=100)
+        
+        assert metrics.record("SELECT 1", 0.001, 1) is None
+        assert metrics.get_slow_queries() == []
+    
+    def test_slow_query_logged(self):
+        """Тест записи медленного запроса в журнал"""
+        metrics = QueryMetrics(slow_threshold_ms=100)
+        
+        entry = metrics.record("SELECT * FROM users", 0.25, 1000, ())
+        
+        assert entry is not None
+        assert entry['duration_ms'] == pytest.approx(250.0)
+        assert entry['rows'] == 1000
+        assert metrics.get_slow_queries() == [entry]
+    
+    def test_slow_log_bounded(self):
+        """Тест ограничения размера журнала медленных запросов"""
+        metrics = QueryMetrics(slow_threshold_ms=0, slow_log_size=3)
+        for i in range(10):
+            metrics.record(f"SELECT {i}", 0.001, 0)
+        
+        slow = metrics.get_slow_queries()
+        
+        assert len(slow) == 3
+    
+    def test_get_stats_ordering_and_limit(self):
+        """Тест сортировки и ограничения статистики"""
+        metrics = QueryMetrics(slow_threshold_ms=1000)
+        metrics.record("SELECT * FROM cars", 0.001, 1)
+        metrics.record("SELECT * FROM users", 0.050, 1)
+        
+        stats = metrics.get_stats(limit=1, order_by='max_ms')
+        
+        assert len(stats) == 1
+        assert stats[0]['sql'] == "SELECT * FROM users"
+    
+    def test_reset(self):
+        """Тест сброса статистики"""
+        metrics = QueryMetrics(slow_threshold_ms=0)
+        metrics.record("SELECT 1", 0.001, 1)
+        metrics.reset()
+        
+        assert metrics.get_stats() == []
+        assert metrics.get_slow_queries() == []
+
+
+class TestQueryStats:
+    """Тесты гистограммы задержек"""
+    
+    @pytest.mark.parametrize("duration_ms,bucket", [
+        (0.5, 'le_1ms'),
+        (3, 'le_5ms'),
+        (100, 'le_100ms'),
+        (5000, 'inf'),
+    ])
+    def test_histogram_buckets(self, duration_ms, bucket):
+        """Тест распределения по интервалам гистограммы"""
+        stats = QueryStats("SELECT 1")
+        stats.observe(duration_ms, 0)
+        
+        assert stats.to_dict()['histogram'][bucket] == 1
+    
+    def test_percentiles(self):
+        """Тест оценки перцентилей по гистограмме"""
+        stats = QueryStats("SELECT 1")
+        for _ in range(99):
+            stats.observe(0.5, 0)
+        stats.observe(300, 0)
+        
+        result = stats.to_dict()
+        
+        assert result['p50_ms'] == 1.0
+        assert result['p99_ms'] == 1.0
+        assert result['max_ms'] == 300.0
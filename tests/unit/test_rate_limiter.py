@@ -0,0 +1,106 @@
+"""
+Unit тесты для ограничителя частоты отправки (rate_limiter.py)
+"""
+import asyncio
+import pytest
+from bot.utils.rate_limiter import SendRateLimiter
+
+
+@pytest.fixture
+def limiter():
+    """Ограничитель 10 сообщений/с и 1 сообщение/с в чат на искусственных часах"""
+    now = [100.0]
+    sends = []
+
+    async def sleep(seconds):
+        now[0] += seconds
+
+    limiter = SendRateLimiter(10.0, 1.0, clock=lambda: now[0], sleep=sleep)
+
+    async def send(chat_id):
+        await limiter.acquire(chat_id)
+        sends.append((round(now[0] - 100.0, 3), chat_id))
+
+    return limiter, send, sends, now
+
+
+class TestSendRateLimiter:
+    """Тесты лимитов на бота и на чат"""
+
+    @pytest.mark.asyncio
+    async def test_global_rate(self, limiter):
+        """Тест, что сообщения в разные чаты идут не чаще global_rate"""
+        _, send, sends, _ = limiter
+        for chat_id in range(3):
+            await send(chat_id)
+
+        assert sends == [(0.0, 0), (0.1, 1), (0.2, 2)]
+
+    @pytest.mark.asyncio
+    async def test_per_chat_interval(self, limiter):
+        """Тест, что в один чат сообщения идут не чаще per_chat_interval"""
+        _, send, sends, _ = limiter
+        await send(1)
+        await send(1)
+        await send(2)
+
+        assert sends == [(0.0, 1), (1.0, 1), (1.1, 2)]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_acquire_reserves_distinct_slots(self):
+        """Тест, что конкурентные отправители получают разные моменты"""
+        limiter = SendRateLimiter(50.0, 1.0)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        moments = []
+
+        async def send(chat_id):
+            await limiter.acquire(chat_id)
+            moments.append(loop.time() - started)
+
+        await asyncio.gather(*(send(chat_id) for chat_id in range(5)))
+
+        assert max(moments) >= 4 * limiter.global_interval * 0.9
+
+    @pytest.mark.asyncio
+    async def test_pause(self, limiter):
+        """Тест, что pause (ответ RetryAfter) откладывает все отправки"""
+        limiter, send, sends, _ = limiter
+        await send(1)
+        limiter.pause(5)
+        await send(2)
+
+        assert sends == [(0.0, 1), (5.0, 2)]
+
+    @pytest.mark.asyncio
+    async def test_pause_while_waiting_keeps_reservation(self, limiter):
+        """Тест, что ждущий отправитель досыпает сдвинутый паузой момент, не занимая новый"""
+        limiter, send, sends, _ = limiter
+        plain_sleep = limiter._sleep
+
+        async def sleep_with_retry_after(seconds):
+            # Другой отправитель получил RetryAfter, пока этот ждал свой момент
+            limiter.pause(0.15)
+            limiter._sleep = plain_sleep
+            await plain_sleep(seconds)
+
+        await send(0)
+        limiter._sleep = sleep_with_retry_after
+        await send(1)
+        await send(2)
+
+        # Момент 0.1 сдвинут паузой на 0.15, а не перерезервирован
+        # после собственного интервала чата 1 (1.1) и конца очереди
+        assert sends == [(0.0, 0), (0.25, 1), (0.35, 2)]
+
+    @pytest.mark.asyncio
+    async def test_forgets_idle_chats(self, limiter, monkeypatch):
+        """Тест, что чаты с истекшим интервалом не копятся"""
+        limiter, send, _, now = limiter
+        monkeypatch.setattr(SendRateLimiter, "MAX_TRACKED_CHATS", 3)
+        for chat_id in range(3):
+            await send(chat_id)
+        now[0] += 10
+        await send(3)
+
+        assert list(limiter._next_chat) == [3]
@@ -18,22 +18,33 @@ class TestRentalRepository:
         pool.execute_fetchall = AsyncMock()
         pool.commit = AsyncMock()
         
-        # Мокаем cursor для create
-        mock_cursor = Mock()
-        mock_cursor.lastrowid = 1
-        pool.execute.return_value = mock_cursor
-        
         return pool
     
     @pytest.fixture
-    def rental_repository(self, mock_db_pool, monkeypatch):
-        """Создает экземпляр RentalRepository с мок db_pool"""
+    def mock_database(self):
+        """Создает мок изменяющих функций аренд модуля database"""
+        database = Mock()
+        database.add_rental = AsyncMock(return_value=1)
+        database.end_rental = AsyncMock(return_value={'id': 1, 'is_active': 0})
+        database.update_rental_reminder_time = AsyncMock(return_value={'id': 1})
+        database.update_rental_reminder_type = AsyncMock(return_value={'id': 1})
+        
+        return database
+    
+    @pytest.fixture
+    def rental_repository(self, mock_db_pool, mock_database, monkeypatch):
+        """Создает экземпляр RentalRepository с мок db_pool и функциями database"""
         import bot.database.repositories.rental_repository
         monkeypatch.setattr(
             bot.database.repositories.rental_repository,
             'db_pool',
             mock_db_pool
         )
+        monkeypatch.setattr(
+            bot.database.repositories.rental_repository,
+            'database',
+            mock_database
+        )
         return RentalRepository()
     
     @pytest.fixture
@@ -45,10 +56,8 @@ class TestRentalRepository:
         cache.clear()
     
     @pytest.mark.asyncio
-    async def test_create_rental_success(self, rental_repository, mock_db_pool, clean_cache):
+    async def test_create_rental_success(self, rental_repository, mock_database, clean_cache):
         """Тест успешного создания аренды"""
-        mock_db_pool.execute_fetchone.return_value = None  # Нет активной аренды
-        
         rental_id = await rental_repository.create(
             user_id=123456789,
             car_id=1,
@@ -56,14 +65,13 @@ class TestRentalRepository:
         )
         
         assert rental_id == 1
-        mock_db_pool.execute.assert_called()
-        mock_db_pool.commit.assert_called()
+        mock_database.add_rental.assert_called_once()
     
     @pytest.mark.asyncio
-    async def test_create_rental_existing_active(self, rental_repository, mock_db_pool, clean_cache):
+    async def test_create_rental_existing_active(self, rental_repository, mock_database, clean_cache):
         """Тест создания аренды при существующей активной"""
-        # Возвращаем существующую активную аренду
-        mock_db_pool.execute_fetchone.return_value = {'id': 1, 'user_id': 123456789}
+        # add_rental возвращает None, если у пользователя уже есть активная аренда
+        mock_database.add_rental.return_value = None
         
         rental_id = await rental_repository.create(
             user_id=123456789,
@@ -109,7 +117,8 @@ class TestRentalRepository:
         
         result = await rental_repository.get_all_active()
         
-        assert result == expected_rentals
+        # Кэш хранит неизменяемый снимок: кортеж вместо списка
+        assert list(result) == expected_rentals
         assert len(result) == 2
     
     @pytest.mark.asyncio
@@ -128,43 +137,39 @@ class TestRentalRepository:
         assert result == expected_rental
     
     @pytest.mark.asyncio
-    async def test_end_rental(self, rental_repository, mock_db_pool, clean_cache):
+    async def test_end_rental(self, rental_repository, mock_database, clean_cache):
         """Тест завершения аренды"""
-        mock_db_pool.execute_fetchone.return_value = {'user_id': 123456789}
-        
         result = await rental_repository.end(1)
         
         assert result is True
-        mock_db_pool.execute.assert_called()
-        mock_db_pool.commit.assert_called()
+        mock_database.end_rental.assert_called_once_with(1)
     
     @pytest.mark.asyncio
-    async def test_update_reminder_time(self, rental_repository, mock_db_pool, clean_cache):
-        """Тест обновления времени напоминания"""
-        mock_db_pool.execute_fetchone.return_value = {'user_id': 123456789}
+    async def test_end_missing_rental(self, rental_repository, mock_database, clean_cache):
+        """Тест завершения несуществующей аренды"""
+        mock_database.end_rental.return_value = None
         
+        assert await rental_repository.end(1) is False
+    
+    @pytest.mark.asyncio
+    async def test_update_reminder_time(self, rental_repository, mock_database, clean_cache):
+        """Тест обновления времени напоминания"""
         result = await rental_repository.update_reminder_time(1, "14:00")
         
         assert result is True
-        mock_db_pool.execute.assert_called()
-        mock_db_pool.commit.assert_called()
+        mock_database.update_rental_reminder_time.assert_called_once_with(1, "14:00")
     
     @pytest.mark.asyncio
-    async def test_update_reminder_type(self, rental_repository, mock_db_pool, clean_cache):
+    async def test_update_reminder_type(self, rental_repository, mock_database, clean_cache):
         """Тест обновления типа напоминания"""
-        mock_db_pool.execute_fetchone.return_value = {'user_id': 123456789}
-        
         result = await rental_repository.update_reminder_type(1, "weekly")
         
         assert result is True
-        mock_db_pool.execute.assert_called()
-        mock_db_pool.commit.assert_called()
+        mock_database.update_rental_reminder_type.assert_called_once_with(1, "weekly")
     
     @pytest.mark.asyncio
-    async def test_create_with_custom_reminder_time(self, rental_repository, mock_db_pool, clean_cache):
+    async def test_create_with_custom_reminder_time(self, rental_repository, mock_database, clean_cache):
         """Тест создания аренды с кастомным временем напоминания"""
-        mock_db_pool.execute_fetchone.return_value = None
-        
         rental_id = await rental_repository.create(
             user_id=123456789,
             car_id=1,
@@ -175,12 +180,6 @@ class TestRentalRepository:
         
         assert rental_id == 1
         # Проверяем, что правильные параметры переданы
-        call_args = mock_db_pool.execute.call_args
-        assert "15:30" in str(call_args)
-        assert "weekly" in str(call_args)
-
-
-
-
-
-
+        call_args = mock_database.add_rental.call_args
+        assert call_args.kwargs['reminder_time'] == "15:30"
+        assert call_args.kwargs['reminder_type'] == "weekly"
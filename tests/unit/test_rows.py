@@ -0,0 +1,135 @@
+"""
+Unit тесты для компактного представления строк (CompactRow)
+"""
+import pickle
+import sqlite3
+import time
+import tracemalloc
+import pytest
+from bot.database.rows import CompactRow
+
+CAR_COLUMNS = (
+    'id', 'name', 'description', 'daily_price', 'available',
+    'image_1', 'image_2', 'image_3', 'created_at',
+)
+
+
+def _description(columns):
+    """Эмулирует cursor.description"""
+    return tuple((name, None, None, None, None, None, None) for name in columns)
+
+
+def _car_tuples(count):
+    """Строки, похожие на результат SELECT * FROM cars"""
+    return [
+        (i, f"Car {i}", f"Description {i}", 5000 + i, 1,
+         f"file_{i}_1", None, None, "2024-01-01 10:00:00")
+        for i in range(count)
+    ]
+
+
+class TestCompactRow:
+    """Тесты для CompactRow"""
+
+    @pytest.fixture
+    def row(self):
+        """Одна строка автомобиля"""
+        return CompactRow.from_rows(_description(CAR_COLUMNS), _car_tuples(1))[0]
+
+    def test_item_access(self, row):
+        """Тест доступа по имени колонки"""
+        assert row['name'] == "Car 0"
+        assert row['daily_price'] == 5000
+        assert row['image_2'] is None
+
+    def test_missing_key(self, row):
+        """Тест обращения к отсутствующей колонке"""
+        with pytest.raises(KeyError):
+            row['missing']
+        assert row.get('missing') is None
+        assert row.get('missing', 'default') == 'default'
+        assert row.get('image_2', 'default') is None
+
+    def test_mapping_protocol(self, row):
+        """Тест поведения как у словаря"""
+        assert 'name' in row
+        assert 'missing' not in row
+        assert list(row) == list(CAR_COLUMNS)
+        assert len(row) == len(CAR_COLUMNS)
+        assert dict(row)['name'] == "Car 0"
+        assert {**row}['id'] == 0
+
+    def test_equals_dict(self, row):
+        """Тест сравнения с обычным словарем"""
+        expected = dict(zip(CAR_COLUMNS, _car_tuples(1)[0]))
+        assert row == expected
+        assert expected == row
+        assert row.to_dict() == expected
+
+    def test_immutable(self, row):
+        """Тест, что строку нельзя изменить"""
+        with pytest.raises(TypeError):
+            row['name'] = "Other"
+        with pytest.raises(AttributeError):
+            row.name = "Other"
+
+    def test_rows_share_column_index(self):
+        """Тест, что строки одного результата используют общий индекс колонок"""
+        rows = CompactRow.from_rows(_description(CAR_COLUMNS), _car_tuples(3))
+        assert rows[0]._index is rows[2]._index
+
+    def test_pickle_roundtrip(self, row):
+        """Тест сериализации (например, для внешнего кэша)"""
+        restored = pickle.loads(pickle.dumps(row))
+        assert restored == row
+        assert restored['name'] == "Car 0"
+
+    def test_from_mapping_shares_column_index(self, row):
+        """Тест, что строка из словаря (RETURNING *) использует общий индекс колонок"""
+        converted = CompactRow.from_mapping(row.to_dict())
+        assert converted == row
+        assert converted._index is row._index
+
+
+@pytest.mark.slow
+class TestCompactRowBenchmark:
+    """Сравнение памяти и времени создания CompactRow и dict"""
+
+    ROWS = 5000
+
+    @staticmethod
+    def _measure(build):
+        """Возвращает (пиковая память в байтах, время в секундах)"""
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = build()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert len(result) == TestCompactRowBenchmark.ROWS
+        return peak, elapsed
+
+    def test_compact_rows_use_less_memory(self):
+        """Тест, что компактные строки занимают меньше памяти, чем dict"""
+        # Строки sqlite3.Row - то же, что execute_fetchall получает от курсора
+        conn = sqlite3.connect(":memory:")
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"CREATE TABLE cars ({', '.join(CAR_COLUMNS)})")
+        conn.executemany(
+            f"INSERT INTO cars VALUES ({', '.join('?' * len(CAR_COLUMNS))})",
+            _car_tuples(self.ROWS)
+        )
+        cursor = conn.execute("SELECT * FROM cars")
+        source = cursor.fetchall()
+        description = cursor.description
+        conn.close()
+
+        dict_memory, dict_time = self._measure(lambda: [dict(row) for row in source])
+        compact_memory, compact_time = self._measure(
+            lambda: CompactRow.from_rows(description, source)
+        )
+
+        assert compact_memory < dict_memory * 0.75, (
+            f"{self.ROWS} строк: dict {dict_memory / 1024:.0f} КБ за {dict_time * 1000:.2f} мс, "
+            f"CompactRow {compact_memory / 1024:.0f} КБ за {compact_time * 1000:.2f} мс"
+        )
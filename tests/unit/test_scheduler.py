@@ -2,9 +2,10 @@
 Unit тесты для модуля scheduler.py
 """
 import pytest
-from unittest.mock import AsyncMock, Mock, patch
+from unittest.mock import AsyncMock, Mock, patch, call
 from datetime import datetime, date, timedelta
 from bot.utils.scheduler import PaymentReminderScheduler
+from bot.utils.reminders import next_reminder_at, should_send_reminder
 
 
 class TestPaymentReminderScheduler:
@@ -97,124 +98,112 @@ class TestPaymentReminderScheduler:
         
         await scheduler.stop()
     
-    @pytest.mark.asyncio
-    async def test_should_send_reminder_daily_first_time(self, scheduler, sample_rental_daily):
+    def test_should_send_reminder_daily_first_time(self, sample_rental_daily):
         """Тест отправки ежедневного напоминания в первый раз"""
         current_date = date.today()
         
-        result = await scheduler._should_send_reminder(sample_rental_daily, current_date)
+        result = should_send_reminder(sample_rental_daily, current_date)
         
         assert result is True
     
-    @pytest.mark.asyncio
-    async def test_should_send_reminder_daily_already_sent_today(self, scheduler, sample_rental_daily):
+    def test_should_send_reminder_daily_already_sent_today(self, sample_rental_daily):
         """Тест ежедневного напоминания, уже отправленного сегодня"""
         sample_rental_daily['last_reminder_date'] = date.today()
         current_date = date.today()
         
-        result = await scheduler._should_send_reminder(sample_rental_daily, current_date)
+        result = should_send_reminder(sample_rental_daily, current_date)
         
         assert result is False
     
-    @pytest.mark.asyncio
-    async def test_should_send_reminder_daily_sent_yesterday(self, scheduler, sample_rental_daily):
+    def test_should_send_reminder_daily_sent_yesterday(self, sample_rental_daily):
         """Тест ежедневного напоминания, отправленного вчера"""
         sample_rental_daily['last_reminder_date'] = date.today() - timedelta(days=1)
         current_date = date.today()
         
-        result = await scheduler._should_send_reminder(sample_rental_daily, current_date)
+        result = should_send_reminder(sample_rental_daily, current_date)
         
         assert result is True
     
-    @pytest.mark.asyncio
-    async def test_should_send_reminder_weekly_exact_7_days(self, scheduler, sample_rental_weekly):
+    def test_should_send_reminder_weekly_exact_7_days(self, sample_rental_weekly):
         """Тест еженедельного напоминания ровно через 7 дней"""
         start_date = date.today() - timedelta(days=7)
         sample_rental_weekly['start_date'] = datetime.combine(start_date, datetime.min.time())
         current_date = date.today()
         
-        result = await scheduler._should_send_reminder(sample_rental_weekly, current_date)
+        result = should_send_reminder(sample_rental_weekly, current_date)
         
         assert result is True
     
-    @pytest.mark.asyncio
-    async def test_should_send_reminder_weekly_less_than_7_days(self, scheduler, sample_rental_weekly):
+    def test_should_send_reminder_weekly_less_than_7_days(self, sample_rental_weekly):
         """Тест еженедельного напоминания менее чем через 7 дней"""
         start_date = date.today() - timedelta(days=3)
         sample_rental_weekly['start_date'] = datetime.combine(start_date, datetime.min.time())
         current_date = date.today()
         
-        result = await scheduler._should_send_reminder(sample_rental_weekly, current_date)
+        result = should_send_reminder(sample_rental_weekly, current_date)
         
         assert result is False
     
-    @pytest.mark.asyncio
-    async def test_should_send_reminder_weekly_already_sent_this_week(self, scheduler, sample_rental_weekly):
+    def test_should_send_reminder_weekly_already_sent_this_week(self, sample_rental_weekly):
         """Тест еженедельного напоминания, уже отправленного на этой неделе"""
         start_date = date.today() - timedelta(days=14)
         sample_rental_weekly['start_date'] = datetime.combine(start_date, datetime.min.time())
         sample_rental_weekly['last_reminder_date'] = date.today() - timedelta(days=3)
         current_date = date.today()
         
-        result = await scheduler._should_send_reminder(sample_rental_weekly, current_date)
+        result = should_send_reminder(sample_rental_weekly, current_date)
         
         assert result is False
     
-    @pytest.mark.asyncio
-    async def test_should_send_reminder_monthly_exact_30_days(self, scheduler, sample_rental_monthly):
+    def test_should_send_reminder_monthly_exact_30_days(self, sample_rental_monthly):
         """Тест ежемесячного напоминания ровно через 30 дней"""
         start_date = date.today() - timedelta(days=30)
         sample_rental_monthly['start_date'] = datetime.combine(start_date, datetime.min.time())
         current_date = date.today()
         
-        result = await scheduler._should_send_reminder(sample_rental_monthly, current_date)
+        result = should_send_reminder(sample_rental_monthly, current_date)
         
         assert result is True
     
-    @pytest.mark.asyncio
-    async def test_should_send_reminder_monthly_less_than_30_days(self, scheduler, sample_rental_monthly):
+    def test_should_send_reminder_monthly_less_than_30_days(self, sample_rental_monthly):
         """Тест ежемесячного напоминания менее чем через 30 дней"""
         start_date = date.today() - timedelta(days=15)
         sample_rental_monthly['start_date'] = datetime.combine(start_date, datetime.min.time())
         current_date = date.today()
         
-        result = await scheduler._should_send_reminder(sample_rental_monthly, current_date)
+        result = should_send_reminder(sample_rental_monthly, current_date)
         
         assert result is False
     
     @pytest.mark.asyncio
     async def test_send_reminder_daily(self, scheduler, sample_rental_daily):
         """Тест отправки ежедневного напоминания"""
-        with patch('bot.utils.scheduler.update_rental_last_reminder', new_callable=AsyncMock) as mock_update:
-            await scheduler._send_reminder(sample_rental_daily, date.today())
-            
-            scheduler.bot.send_message.assert_called_once()
-            call_args = scheduler.bot.send_message.call_args
-            assert call_args[1]['chat_id'] == sample_rental_daily['user_id']
-            assert 'НАПОМИНАНИЕ ОБ ОПЛАТЕ' in call_args[1]['text']
-            assert '5000' in call_args[1]['text']  # Ежедневная цена
-            
-            mock_update.assert_called_once()
+        result = await scheduler._send_reminder(sample_rental_daily, date.today())
+        
+        assert result is True
+        scheduler.bot.send_message.assert_called_once()
+        call_args = scheduler.bot.send_message.call_args
+        assert call_args[1]['chat_id'] == sample_rental_daily['user_id']
+        assert 'НАПОМИНАНИЕ ОБ ОПЛАТЕ' in call_args[1]['text']
+        assert '5000' in call_args[1]['text']  # Ежедневная цена
     
     @pytest.mark.asyncio
     async def test_send_reminder_weekly(self, scheduler, sample_rental_weekly):
         """Тест отправки еженедельного напоминания"""
-        with patch('bot.utils.scheduler.update_rental_last_reminder', new_callable=AsyncMock):
-            await scheduler._send_reminder(sample_rental_weekly, date.today())
-            
-            scheduler.bot.send_message.assert_called_once()
-            call_args = scheduler.bot.send_message.call_args
-            assert '35000' in call_args[1]['text']  # 5000 * 7 дней
+        await scheduler._send_reminder(sample_rental_weekly, date.today())
+        
+        scheduler.bot.send_message.assert_called_once()
+        call_args = scheduler.bot.send_message.call_args
+        assert '35000' in call_args[1]['text']  # 5000 * 7 дней
     
     @pytest.mark.asyncio
     async def test_send_reminder_monthly(self, scheduler, sample_rental_monthly):
         """Тест отправки ежемесячного напоминания"""
-        with patch('bot.utils.scheduler.update_rental_last_reminder', new_callable=AsyncMock):
-            await scheduler._send_reminder(sample_rental_monthly, date.today())
-            
-            scheduler.bot.send_message.assert_called_once()
-            call_args = scheduler.bot.send_message.call_args
-            assert '150000' in call_args[1]['text']  # 5000 * 30 дней
+        await scheduler._send_reminder(sample_rental_monthly, date.today())
+        
+        scheduler.bot.send_message.assert_called_once()
+        call_args = scheduler.bot.send_message.call_args
+        assert '150000' in call_args[1]['text']  # 5000 * 30 дней
     
     @pytest.mark.asyncio
     async def test_send_reminder_handles_exception(self, scheduler, sample_rental_daily):
@@ -222,20 +211,19 @@ class TestPaymentReminderScheduler:
         scheduler.bot.send_message.side_effect = Exception("Send error")
         
         # Не должно вызывать исключение
-        await scheduler._send_reminder(sample_rental_daily, date.today())
+        result = await scheduler._send_reminder(sample_rental_daily, date.today())
         
+        assert result is False
         scheduler.bot.send_message.assert_called_once()
     
-    @pytest.mark.asyncio
-    async def test_send_reminder_invalid_start_date(self, scheduler, sample_rental_daily):
+    def test_send_reminder_invalid_start_date(self, sample_rental_daily):
         """Тест обработки некорректной даты начала"""
         sample_rental_daily['start_date'] = "invalid_date"
         
-        result = await scheduler._should_send_reminder(sample_rental_daily, date.today())
+        result = should_send_reminder(sample_rental_daily, date.today())
         
         assert result is False
     
-    @pytest.mark.asyncio
     @pytest.mark.parametrize("reminder_type,days_since_start,expected", [
         ('daily', 0, True),
         ('daily', 1, True),
@@ -249,8 +237,8 @@ class TestPaymentReminderScheduler:
         ('monthly', 30, True),
         ('monthly', 60, True),
     ])
-    async def test_reminder_types_various_scenarios(
-        self, scheduler, reminder_type, days_since_start, expected
+    def test_reminder_types_various_scenarios(
+        self, reminder_type, days_since_start, expected
     ):
         """Параметризованный тест различных сценариев напоминаний"""
         rental = {
@@ -268,7 +256,7 @@ class TestPaymentReminderScheduler:
             'last_reminder_date': None
         }
         
-        result = await scheduler._should_send_reminder(rental, date.today())
+        result = should_send_reminder(rental, date.today())
         
         assert result == expected
 
@@ -277,3 +265,291 @@ class TestPaymentReminderScheduler:
 
 
 
+
+
+class TestReminderQueue:
+    """Тесты очереди ближайших напоминаний"""
+    
+    NOW = datetime(2024, 3, 10, 11, 30)
+    
+    @pytest.fixture
+    def scheduler(self, monkeypatch):
+        """Планировщик с зафиксированным "сейчас" для расчета сроков"""
+        bot = Mock()
+        bot.send_message = AsyncMock()
+        scheduler = PaymentReminderScheduler(bot)
+        monkeypatch.setattr(
+            scheduler, "_schedule_from",
+            lambda: max(self.NOW, scheduler._processed_until or self.NOW)
+        )
+        return scheduler
+    
+    @staticmethod
+    def _rental(rental_id, reminder_type='daily', reminder_time='12:00',
+                start_date='2024-03-01 10:00:00', last_reminder_date=None):
+        return {
+            'id': rental_id, 'user_id': 100 + rental_id, 'car_name': 'Test Car',
+            'daily_price': 5000, 'is_active': 1, 'reminder_time': reminder_time,
+            'reminder_type': reminder_type, 'start_date': start_date,
+            'last_reminder_date': last_reminder_date,
+        }
+    
+    @staticmethod
+    def _fetch(rentals):
+        """Замена get_active_rentals_by_ids над списком аренд (due_on - по правилу планировщика)"""
+        async def fetch(rental_ids, due_on=None):
+            return [
+                rental for rental in rentals
+                if rental['id'] in rental_ids
+                and (due_on is None or should_send_reminder(rental, due_on))
+            ]
+        return AsyncMock(side_effect=fetch)
+    
+    @pytest.mark.parametrize("rental_kwargs,expected", [
+        ({}, datetime(2024, 3, 10, 12, 0)),
+        ({'reminder_time': '09:00'}, datetime(2024, 3, 11, 9, 0)),
+        ({'last_reminder_date': '2024-03-10'}, datetime(2024, 3, 11, 12, 0)),
+        ({'reminder_type': 'weekly'}, datetime(2024, 3, 15, 12, 0)),
+        ({'reminder_type': 'monthly'}, datetime(2024, 3, 31, 12, 0)),
+        ({'reminder_type': 'monthly', 'last_reminder_date': '2024-02-10',
+          'start_date': '2024-01-11'}, datetime(2024, 3, 11, 12, 0)),
+        ({'reminder_type': 'unknown'}, None),
+        ({'reminder_time': 'bad'}, None),
+    ])
+    def test_next_fire_time(self, rental_kwargs, expected):
+        """Тест расчета ближайшего срока по правилам should_send_reminder"""
+        rental = self._rental(1, **rental_kwargs)
+        assert next_reminder_at(rental, self.NOW) == expected
+    
+    def test_next_fire_time_matches_should_send(self):
+        """Тест, что срок - первый день, когда should_send_reminder разрешает отправку"""
+        for reminder_type in ('daily', 'weekly', 'monthly'):
+            for days_ago in range(0, 70, 3):
+                start = (self.NOW - timedelta(days=days_ago)).strftime('%Y-%m-%d %H:%M:%S')
+                rental = self._rental(1, reminder_type=reminder_type, start_date=start)
+                fire_at = next_reminder_at(rental, self.NOW)
+                
+                day = self.NOW.date()
+                while not should_send_reminder(rental, day):
+                    day += timedelta(days=1)
+                assert fire_at == datetime.combine(day, datetime.min.time()).replace(hour=12)
+    
+    def test_queue_order_and_reschedule(self, scheduler):
+        """Тест, что очередь отдает ближайший срок и учитывает перенос и завершение"""
+        scheduler.schedule_rental(self._rental(1, reminder_time='18:00'))
+        scheduler.schedule_rental(self._rental(2, reminder_time='12:00'))
+        assert scheduler._peek() == datetime(2024, 3, 10, 12, 0)
+        
+        # Перенос времени: прежняя запись в куче становится устаревшей
+        scheduler.schedule_rental(self._rental(2, reminder_time='20:00'))
+        assert scheduler._peek() == datetime(2024, 3, 10, 18, 0)
+        
+        scheduler.schedule_rental({**self._rental(1), 'is_active': 0})
+        assert scheduler._peek() == datetime(2024, 3, 10, 20, 0)
+        assert scheduler._next_fire == {2: datetime(2024, 3, 10, 20, 0)}
+    
+    @pytest.mark.asyncio
+    async def test_schedule_wakes_sleeping_loop(self, scheduler):
+        """Тест, что новая аренда будит цикл, спящий до более позднего срока"""
+        import asyncio
+        sleeper = asyncio.create_task(scheduler._sleep_until_due())
+        await asyncio.sleep(0)
+        assert not sleeper.done()
+        
+        scheduler.schedule_rental(self._rental(1))
+        await asyncio.wait_for(sleeper, timeout=1)
+    
+    @pytest.mark.asyncio
+    async def test_fire_due_sends_and_reschedules(self, scheduler):
+        """Тест отправки наступивших напоминаний одним запросом и планирования следующих"""
+        scheduler.schedule_rental(self._rental(1))
+        scheduler.schedule_rental(self._rental(2))
+        scheduler.schedule_rental(self._rental(3, reminder_time='15:00'))
+        
+        fresh = [self._rental(1)]  # аренда 2 завершена в обход очереди
+        with patch('bot.utils.scheduler.get_active_rentals_by_ids',
+                   self._fetch(fresh)) as mock_fetch, \
+             patch('bot.utils.scheduler.update_rentals_reminders', new_callable=AsyncMock) as mock_mark:
+            await scheduler._fire_due(datetime(2024, 3, 10, 12, 0, 1))
+        
+        # Наступившие сроки - один запрос с условием дня; не попавшие в него
+        # аренды перечитываются для перепланирования
+        assert mock_fetch.await_args_list == [call([1, 2], due_on=date(2024, 3, 10)), call([2])]
+        # Отметки отправленных и новые сроки (next_reminder_at) - одним запросом
+        mock_mark.assert_awaited_once_with({1: '2024-03-10'}, {1: datetime(2024, 3, 11, 12, 0)})
+        scheduler.bot.send_message.assert_called_once()
+        assert scheduler.bot.send_message.call_args[1]['chat_id'] == 101
+        assert scheduler._next_fire == {
+            1: datetime(2024, 3, 11, 12, 0),
+            3: datetime(2024, 3, 10, 15, 0),
+        }
+    
+    @pytest.mark.asyncio
+    async def test_dispatch_is_concurrent_and_batched(self, scheduler):
+        """Тест, что пачка рассылается несколькими отправителями и отмечается одним запросом"""
+        import asyncio
+        from bot.utils.constants import REMINDER_SEND_CONCURRENCY
+        rentals = [self._rental(rental_id) for rental_id in range(1, 21)]
+        for rental in rentals:
+            scheduler.schedule_rental(rental)
+        in_flight, peak = [0], [0]
+        
+        async def send_message(**kwargs):
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            await asyncio.sleep(0.01)
+            in_flight[0] -= 1
+            if kwargs['chat_id'] == 105:
+                raise Exception("Send error")
+        
+        scheduler.bot.send_message = AsyncMock(side_effect=send_message)
+        scheduler._limiter.global_interval = 0
+        with patch('bot.utils.scheduler.get_active_rentals_by_ids', self._fetch(rentals)), \
+             patch('bot.utils.scheduler.update_rentals_reminders', new_callable=AsyncMock) as mock_mark:
+            await scheduler._fire_due(datetime(2024, 3, 10, 12, 0, 1))
+        
+        assert scheduler.bot.send_message.await_count == 20
+        assert 1 < peak[0] <= REMINDER_SEND_CONCURRENCY
+        # Неотправленное напоминание не отмечается
+        mock_mark.assert_awaited_once_with(
+            {i: '2024-03-10' for i in range(1, 21) if i != 5},
+            {i: datetime(2024, 3, 11, 12, 0) for i in range(1, 21)},
+        )
+        stats = scheduler.last_dispatch_stats
+        assert (stats['total'], stats['sent']) == (20, 19)
+        assert stats['max_lag'] >= stats['avg_lag'] > 0
+    
+    @pytest.mark.asyncio
+    async def test_send_reminder_retries_after_rate_limit(self, scheduler):
+        """Тест, что ответ 429 откладывает отправки и напоминание отправляется повторно"""
+        from aiogram.exceptions import TelegramRetryAfter
+        scheduler.bot.send_message.side_effect = [
+            TelegramRetryAfter(method=Mock(), message="Too Many Requests", retry_after=0),
+            None,
+        ]
+        scheduler._limiter.pause = Mock(wraps=scheduler._limiter.pause)
+        
+        assert await scheduler._send_reminder(self._rental(1), date(2024, 3, 10)) is True
+        
+        assert scheduler.bot.send_message.await_count == 2
+        scheduler._limiter.pause.assert_called_once_with(0)
+    
+    @pytest.mark.asyncio
+    async def test_fire_due_restores_queue_on_db_error(self, scheduler):
+        """Тест, что при ошибке БД сроки возвращаются в очередь"""
+        scheduler.schedule_rental(self._rental(1))
+        
+        with patch('bot.utils.scheduler.get_active_rentals_by_ids',
+                   new_callable=AsyncMock, side_effect=RuntimeError("db")):
+            with pytest.raises(RuntimeError):
+                await scheduler._fire_due(datetime(2024, 3, 10, 12, 0, 1))
+        
+        assert scheduler._peek() == datetime(2024, 3, 10, 12, 0)
+    
+    @pytest.mark.asyncio
+    async def test_catch_up_after_downtime(self, scheduler):
+        """Тест, что пропущенные за простой сроки отправляются одной пачкой и без повторов"""
+        now = datetime(2024, 3, 10, 13, 30, 5)
+        rentals = [
+            self._rental(1),
+            # Напоминание уже отправлено до перезапуска: last_reminder_date защищает от повтора
+            self._rental(2, last_reminder_date='2024-03-10'),
+            self._rental(3, reminder_time='14:00'),
+            self._rental(4),
+        ]
+        saved = [
+            {'id': 1, 'next_reminder_at': '2024-03-10 12:00'},
+            {'id': 2, 'next_reminder_at': '2024-03-11 12:00'},
+            {'id': 3, 'next_reminder_at': '2024-03-10 14:00'},
+            # Срок раньше окна досылки устарел и пересчитывается
+            {'id': 4, 'next_reminder_at': '2024-03-08 12:00'},
+        ]
+        with patch('bot.utils.scheduler.get_setting', new_callable=AsyncMock, return_value='2024-03-10 11:00'), \
+             patch('bot.utils.scheduler.get_next_reminders', new_callable=AsyncMock, return_value=saved), \
+             patch('bot.utils.scheduler.get_active_rentals_by_ids',
+                   self._fetch(rentals)) as mock_fetch, \
+             patch('bot.utils.scheduler.update_rentals_reminders', new_callable=AsyncMock) as mock_store:
+            await scheduler._load_schedule(now)
+        
+        # Даты разбираются только у аренды с устаревшим сроком
+        mock_fetch.assert_awaited_once_with([4])
+        mock_store.assert_awaited_once_with({}, {4: datetime(2024, 3, 10, 12, 0)})
+        assert scheduler._peek() == datetime(2024, 3, 10, 12, 0)
+        assert scheduler._next_fire[2] == datetime(2024, 3, 11, 12, 0)
+        
+        with patch('bot.utils.scheduler.get_active_rentals_by_ids',
+                   self._fetch(rentals)) as mock_fetch, \
+             patch('bot.utils.scheduler.update_rentals_reminders', new_callable=AsyncMock), \
+             patch('bot.utils.scheduler.set_setting', new_callable=AsyncMock, return_value=True) as mock_save:
+            await scheduler._fire_due(now)
+            await scheduler._save_watermark()
+            await scheduler._save_watermark()
+        
+        mock_fetch.assert_awaited_once_with([1, 4], due_on=date(2024, 3, 10))
+        assert scheduler.bot.send_message.call_count == 2
+        assert scheduler._next_fire == {
+            1: datetime(2024, 3, 11, 12, 0),
+            2: datetime(2024, 3, 11, 12, 0),
+            3: datetime(2024, 3, 10, 14, 0),
+            4: datetime(2024, 3, 11, 12, 0),
+        }
+        mock_save.assert_awaited_once_with('reminder_watermark', '2024-03-10 13:31')
+    
+    def test_schedule_uses_saved_next_reminder(self, scheduler):
+        """Тест, что сохраненный next_reminder_at используется без разбора дат, а прошедший - пересчитывается"""
+        with patch('bot.utils.scheduler.next_reminder_at', wraps=next_reminder_at) as mock_compute:
+            scheduler.schedule_rental({**self._rental(1), 'next_reminder_at': '2024-03-15 12:00'})
+            assert mock_compute.call_count == 0
+            
+            scheduler.schedule_rental({**self._rental(2), 'next_reminder_at': '2024-03-09 12:00'})
+            assert mock_compute.call_count == 1
+        
+        assert scheduler._next_fire == {
+            1: datetime(2024, 3, 15, 12, 0),
+            2: datetime(2024, 3, 10, 12, 0),
+        }
+    
+    @pytest.mark.asyncio
+    async def test_fire_due_skips_rental_no_longer_due(self, scheduler):
+        """Тест, что аренда, которой напоминание уже не положено, не получает его и перепланируется"""
+        scheduler.schedule_rental(self._rental(1))
+        # Напоминание отправлено в обход очереди (например, другим экземпляром)
+        sent = self._rental(1, last_reminder_date='2024-03-10')
+        
+        with patch('bot.utils.scheduler.get_active_rentals_by_ids',
+                   self._fetch([sent])) as mock_fetch, \
+             patch('bot.utils.scheduler.update_rentals_reminders', new_callable=AsyncMock):
+            await scheduler._fire_due(datetime(2024, 3, 10, 12, 0, 1))
+        
+        assert mock_fetch.await_args_list == [call([1], due_on=date(2024, 3, 10)), call([1])]
+        scheduler.bot.send_message.assert_not_called()
+        assert scheduler._next_fire == {1: datetime(2024, 3, 11, 12, 0)}
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("watermark,expected_start", [
+        (None, datetime(2024, 3, 10, 13, 30)),
+        ('2024-03-01 08:00', datetime(2024, 3, 9, 13, 30)),
+        ('2024-03-11 08:00', datetime(2024, 3, 10, 13, 30)),
+        ('garbage', datetime(2024, 3, 10, 13, 30)),
+    ])
+    async def test_catch_up_window(self, scheduler, watermark, expected_start):
+        """Тест границ досылки: не раньше отметки и не старше REMINDER_MAX_CATCH_UP"""
+        with patch('bot.utils.scheduler.get_setting', new_callable=AsyncMock, return_value=watermark), \
+             patch('bot.utils.scheduler.get_next_reminders', new_callable=AsyncMock, return_value=[]):
+            await scheduler._load_schedule(datetime(2024, 3, 10, 13, 30, 5))
+        
+        assert scheduler._processed_until == expected_start
+    
+    @pytest.mark.asyncio
+    async def test_reminder_time_format_is_normalized(self, scheduler):
+        """Тест, что время "9:00" из БД совпадает со сроком 09:00"""
+        rental = self._rental(1, reminder_time='9:00')
+        scheduler.schedule_rental(rental)
+        assert scheduler._peek() == datetime(2024, 3, 11, 9, 0)
+        
+        with patch('bot.utils.scheduler.get_active_rentals_by_ids',
+                   new_callable=AsyncMock, return_value=[rental]), \
+             patch('bot.utils.scheduler.update_rentals_reminders', new_callable=AsyncMock):
+            await scheduler._fire_due(datetime(2024, 3, 11, 9, 0, 0))
+        
+        scheduler.bot.send_message.assert_called_once()
@@ -17,6 +17,7 @@ class TestUserRepository:
         pool.execute_fetchone = AsyncMock()
         pool.execute_fetchall = AsyncMock()
         pool.commit = AsyncMock()
+        pool.write = AsyncMock()
         return pool
     
     @pytest.fixture
@@ -40,8 +41,7 @@ class TestUserRepository:
         )
         
         assert result is True
-        mock_db_pool.execute.assert_called_once()
-        mock_db_pool.commit.assert_called_once()
+        mock_db_pool.write.assert_called_once()
     
     @pytest.mark.asyncio
     async def test_create_user_without_username(self, user_repository, mock_db_pool):
@@ -53,7 +53,7 @@ class TestUserRepository:
         )
         
         assert result is True
-        mock_db_pool.execute.assert_called_once()
+        mock_db_pool.write.assert_called_once()
     
     @pytest.mark.asyncio
     async def test_create_user_without_first_name(self, user_repository, mock_db_pool):
@@ -65,7 +65,7 @@ class TestUserRepository:
         )
         
         assert result is True
-        mock_db_pool.execute.assert_called_once()
+        mock_db_pool.write.assert_called_once()
     
     @pytest.mark.asyncio
     async def test_create_user_duplicate(self, user_repository, mock_db_pool):
@@ -133,7 +133,7 @@ class TestUserRepository:
     @pytest.mark.asyncio
     async def test_create_user_handles_exception(self, user_repository, mock_db_pool):
         """Тест обработки исключений при создании пользователя"""
-        mock_db_pool.execute.side_effect = Exception("DB error")
+        mock_db_pool.write.side_effect = Exception("DB error")
         
         result = await user_repository.create(
             telegram_id=123456789,